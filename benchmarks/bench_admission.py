@@ -0,0 +1,96 @@
+"""截止时间与准入控制基准测试：超时的部分结果和过载时的快速拒绝"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from siwi.admission import AdmissionController
+from siwi.app import create_app
+from siwi.coalescer import LookupCoalescer
+from siwi.deadline import DeadlineExceeded, check, deadline
+from siwi.subgraph_sampler import SubgraphSampler
+from siwi.testing import FakeConnectionPool
+
+
+@pytest.fixture
+def client(fake_pool):
+    return create_app().test_client()
+
+
+def test_sample_subgraph_deadline(benchmark, graph, fake_pool):
+    # 每次往返10毫秒，逐跳的3跳采样在25毫秒内只能完成前几次查询
+    slow = FakeConnectionPool(graph, latency=0.01)
+    sampler = SubgraphSampler(slow)
+
+    def sample():
+        with deadline(0.025):
+            return sampler.sample_subgraph(center_vid="player150", n_hops=3, fused=False)
+
+    result = sample()
+    assert result['partial']
+    assert result['num_nodes'] > 0
+    benchmark(sample)
+
+
+def test_route_subgraph_overloaded(benchmark, client, monkeypatch):
+    # 唯一的执行槽被占用且不排队，请求立即返回429而不是等到超时
+    controller = AdmissionController(slots=1, max_queue=1, max_wait=0)
+    monkeypatch.setattr("siwi.app.handlers.ADMISSION", controller)
+    with controller.admit():
+        response = benchmark(client.get, "/api/v1/subgraph/player150/2")
+    assert response.status_code == 429
+    assert response.get_json()["retry_after"] > 0
+
+
+def test_sample_subgraph_fused_deadline(graph, fake_pool):
+    # 融合遍历已经返回，中心节点的补充查询之前截止时间已过：返回部分结果而不是504
+    slow = FakeConnectionPool(graph, latency=0.02)
+    sampler = SubgraphSampler(slow)
+    with deadline(0.015):
+        result = sampler.sample_subgraph(center_vid="player999999", n_hops=2)
+    assert result['partial']
+
+
+def test_coalescer_leader_deadline(fake_pool):
+    # leader的截止时间在批量查询中到期，不影响共享同一批结果的其他请求
+    started = threading.Event()
+
+    def fetch(keys):
+        started.set()
+        time.sleep(0.05)
+        check()
+        return {key: key for key in keys}
+
+    coalescer = LookupCoalescer(fetch, name="test")
+    with ThreadPoolExecutor(2) as executor:
+        def lead():
+            with deadline(0.01):
+                return coalescer.get("player101")
+
+        leader = executor.submit(lead)
+        started.wait()
+        follower = executor.submit(coalescer.get, "player101")
+        assert follower.result() == "player101"
+        assert leader.result() == "player101"
+
+
+def test_coalescer_waiter_deadline(fake_pool):
+    # 等待中的调用方按自己的剩余时间返回，抛出DeadlineExceeded
+    started = threading.Event()
+
+    def fetch(keys):
+        started.set()
+        time.sleep(0.1)
+        return {key: key for key in keys}
+
+    coalescer = LookupCoalescer(fetch, name="test")
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(coalescer.get, "player101")
+        started.wait()
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded), deadline(0.01):
+            coalescer.get("player101")
+        assert time.monotonic() - start < 0.08
+        assert leader.result() == "player101"
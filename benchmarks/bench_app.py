@@ -0,0 +1,70 @@
+"""Flask路由基准测试，经由test_client调用，不经过网络"""
+
+import asyncio
+
+import pytest
+
+from siwi.app import create_app
+
+QUESTIONS = [
+    "Whom does Tim Duncan follow?",
+    "Which team had Yao Ming served?",
+    "What is the relationship between Yao Ming and Lakers?",
+    "Whom does Tim Duncan follow?",
+]
+
+
+@pytest.fixture
+def client(fake_pool):
+    return create_app().test_client()
+
+
+def test_route_query(run_benchmark, client):
+    run_benchmark(client.post, "/query", json={"question": QUESTIONS[0]})
+
+
+def test_route_query_batch(run_benchmark, client):
+    run_benchmark(client.post, "/query/batch", json={"questions": QUESTIONS})
+
+
+def test_route_entity_embedding(run_benchmark, client):
+    run_benchmark(client.get, "/api/v1/entity/player/player150/embedding")
+
+
+@pytest.mark.parametrize("n_hops", [1, 2])
+def test_route_subgraph(run_benchmark, client, n_hops):
+    run_benchmark(client.get, f"/api/v1/subgraph/player150/{n_hops}")
+
+
+def test_route_pyg(run_benchmark, client):
+    run_benchmark(client.get, "/api/v1/pyg/player150/2")
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/batch"])
+@pytest.mark.parametrize("body", [[], "x", 1])
+def test_route_query_non_object_body(client, path, body):
+    # 不是JSON对象的请求体返回400而不是500
+    assert client.post(path, json=body).status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/batch"])
+def test_asgi_query_non_object_body(fake_pool, path):
+    from siwi.app.asgi import application
+
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"[]", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b""}
+    asyncio.run(application(scope, receive, send))
+    assert messages[0]["status"] == 400
+
+
+@pytest.mark.parametrize("questions", [[123], [{"a": 1}], [QUESTIONS[0], 1.5]])
+def test_route_query_batch_non_string_question(client, questions):
+    # 一个不是字符串的问题使整个批次返回400，而不是在分类时抛出异常返回500
+    assert client.post("/query/batch", json={"questions": questions}).status_code == 400
@@ -0,0 +1,144 @@
+"""BulkWriter、NebulaFeatureStore和NebulaGraphStore写回的基准测试"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+import torch
+
+from siwi.bulk_writer import BulkWriter
+from siwi.disk_cache import DISK_CACHE
+from siwi.neighborhood_index import NEIGHBORHOOD_INDEX
+from siwi.remote_backend import NebulaFeatureStore, NebulaGraphStore
+from siwi.testing import SyntheticGraph
+
+
+@pytest.fixture(scope="module")
+def graph():
+    # insert模式会覆盖标签的其他属性，使用独立的图避免影响其他基准测试
+    return SyntheticGraph(num_players=2000)
+
+
+@pytest.mark.parametrize("mode", ["upsert", "insert"])
+def test_bulk_writer_write_vertices(run_benchmark, fake_pool, mode):
+    writer = BulkWriter(fake_pool, batch_size=256, max_workers=4)
+    vids = [f"player{100 + i}" for i in range(2000)]
+    rows = [[i / 2000] for i in range(2000)]
+
+    def write():
+        result = writer.write_vertices("player", ["embedding1"], vids, rows, mode)
+        assert result.ok and result.written_rows == len(vids)
+    run_benchmark(write)
+
+
+def test_feature_store_put_tensor(run_benchmark, fake_pool):
+    feature_store = NebulaFeatureStore(write_back="sync")
+    feature_store.id_mapper = lambda idx: f"player{100 + idx}"
+    tensor = torch.rand(2000)
+
+    def put():
+        assert feature_store._put_tensor("player", "embedding1", tensor)
+    run_benchmark(put)
+    assert fake_pool.graph.vertices["player150"]["player"]["embedding1"] == pytest.approx(
+        float(tensor[50]))
+
+
+def test_graph_store_put_edge_index(run_benchmark, fake_pool):
+    graph_store = NebulaGraphStore(write_back=True, write_batch_size=512, write_workers=4)
+    graph_store.id_mapper = lambda idx: f"player{100 + idx}"
+    # 随机生成的kNN式边集，包含重复边
+    generator = torch.Generator().manual_seed(0)
+    src = torch.randint(0, 2000, (20000,), generator=generator)
+    dst = torch.randint(0, 2000, (20000,), generator=generator)
+    edge_index = torch.stack([src, dst])
+    degree = torch.randint(0, 100, (20000,), generator=generator)
+
+    def put():
+        assert graph_store._put_edge_index(
+            ("player", "follow", "player"), edge_index, edge_attr={"degree": degree})
+    run_benchmark(put)
+    assert graph_store.last_write_result.written_rows < 20000
+
+
+def test_feature_store_put_tensor_placeholder_vids(fake_pool):
+    # 默认只保存在本地；没有id_mapper时写回被拒绝，不会创建player0这样的顶点
+    tensor = torch.rand(10)
+    fake_pool.reset_counters()
+    assert NebulaFeatureStore()._put_tensor("player", "embedding1", tensor)
+    with pytest.raises(ValueError):
+        NebulaFeatureStore(write_back="sync")._put_tensor("player", "embedding1", tensor)
+    assert fake_pool.round_trips == 0
+    assert "player0" not in fake_pool.graph.vertices
+
+
+def test_graph_store_put_edge_index_placeholder_vids(fake_pool):
+    # 默认只保存在本地；没有id_mapper时位置索引不是VID，写回被拒绝
+    edge_index = torch.tensor([[0, 1], [1, 2]])
+    fake_pool.reset_counters()
+    assert NebulaGraphStore()._put_edge_index(("player", "follow", "player"), edge_index)
+    with pytest.raises(ValueError):
+        NebulaGraphStore(write_back=True)._put_edge_index(
+            ("player", "follow", "player"), edge_index)
+    assert fake_pool.round_trips == 0
+
+
+def test_bulk_writer_write_edges_invalidates_after_batch(fake_pool, monkeypatch):
+    # 批次执行之后才失效：先让磁盘缓存中的子图失效，再刷新物化邻域
+    calls = []
+    monkeypatch.setattr(DISK_CACHE, "bump_generation",
+                        lambda space: calls.append(("bump", fake_pool.round_trips)))
+    monkeypatch.setattr(NEIGHBORHOOD_INDEX, "invalidate",
+                        lambda space, vids: calls.append(("neighborhood", fake_pool.round_trips)))
+    writer = BulkWriter(fake_pool, batch_size=2, max_workers=1)
+    fake_pool.reset_counters()
+    result = writer.write_edges("follow", ["player100", "player101"], ["player101", "player102"])
+    assert result.ok
+    # 每个批次一次USE和一次INSERT EDGE
+    assert calls == [("bump", 2), ("neighborhood", 2)]
+
+
+def test_bulk_writer_drops_stale_feature_puts(fake_pool, graph, disk_cache_db, shm_cache_segment):
+    # 写回之前开始的读取在失效之后才写入缓存：代数已经变化，旧值不再写入
+    space = graph.space_name
+    shm_generation = shm_cache_segment.generation()
+    disk_generation = disk_cache_db.generation(space)
+    writer = BulkWriter(fake_pool, batch_size=2, max_workers=1)
+    assert writer.write_vertices("player", ["embedding1"], ["player101"], [[0.5]]).ok
+    shm_cache_segment.put_features(space, "player", "embedding1", ["player101"], [0.1],
+                                   shm_generation)
+    disk_cache_db.put_features(space, "player", "embedding1", ["player101"], [0.1],
+                               disk_generation)
+    disk_cache_db.flush()
+    assert not shm_cache_segment.get_features(space, "player", ["player101"], ["embedding1"])
+    assert not disk_cache_db.get_features(space, "player", ["player101"], ["embedding1"])
+    # 失效之后开始的读取照常写入
+    shm_cache_segment.put_features(space, "player", "embedding1", ["player101"], [0.5],
+                                   shm_cache_segment.generation())
+    disk_cache_db.put_features(space, "player", "embedding1", ["player101"], [0.5],
+                               disk_cache_db.generation(space))
+    disk_cache_db.flush()
+    assert shm_cache_segment.get_features(space, "player", ["player101"], ["embedding1"])
+    assert disk_cache_db.get_features(space, "player", ["player101"], ["embedding1"])
+
+
+WRITE_BEHIND_EXIT = """
+import atexit
+from siwi.bulk_writer import BulkWriter, WriteBehindBuffer
+from siwi.testing import FakeConnectionPool, SyntheticGraph
+graph = SyntheticGraph(num_players=300)
+pool = FakeConnectionPool(graph)
+# 先注册的函数在缓冲的atexit刷新之后运行
+atexit.register(lambda: print("embedding1=%s" % graph.vertices["player101"]["player"]["embedding1"]))
+buffer = WriteBehindBuffer(BulkWriter(pool, batch_size=2, max_workers=2), flush_interval=60)
+buffer.put("player", ["embedding1"], ["player101"], [[7.5]])
+"""
+
+
+def test_write_behind_flushes_at_exit():
+    # 没有调用close()的写后缓冲在解释器退出前写入剩余数据
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    result = subprocess.run(
+        [sys.executable, "-c", WRITE_BEHIND_EXIT], cwd=src,
+        env={**os.environ, "PYTHONPATH": src}, capture_output=True, text=True, check=True)
+    assert "embedding1=7.5" in result.stdout.split()
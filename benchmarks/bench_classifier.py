@@ -0,0 +1,87 @@
+"""SiwiClassifier基准测试：逐句分类、批量分类和编译后的分类器快照"""
+
+import os
+import shutil
+
+import pytest
+
+from siwi.bot import snapshot
+from siwi.bot.classifier import SiwiClassifier
+
+SENTENCES = [
+    "What is the relationship between Yao Ming and Lakers?",
+    "How does Tracy McGrady and Lakers connected?",
+    "Which team had Jonathon Simmons served?",
+    "Whom does Tim Duncan follow?",
+    "Who are Tracy McGrady's friends?",
+] * 13
+
+
+def test_classifier_init(benchmark):
+    benchmark(SiwiClassifier)
+
+
+def test_classifier_get(benchmark):
+    classifier = SiwiClassifier()
+    benchmark(lambda: [classifier.get(sentence) for sentence in SENTENCES])
+
+
+def test_classifier_get_batch(benchmark):
+    classifier = SiwiClassifier()
+    benchmark(classifier.get_batch, SENTENCES)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """示例数据的副本，加上一份合成的大词典"""
+    for filename in snapshot.source_paths():
+        shutil.copy(filename, tmp_path)
+    with open(tmp_path / "example_players.yaml", "a") as file:
+        file.write("\n")
+        for index in range(20000):
+            file.write(f"Synthetic Player {index}: player{100000 + index}\n")
+    return tmp_path
+
+
+def test_snapshot_compile(benchmark, data_dir, tmp_path):
+    benchmark(snapshot.compile_snapshot, str(tmp_path / "classifier.snapshot"), str(data_dir))
+
+
+def test_snapshot_load(benchmark, data_dir, tmp_path):
+    # 启动时只映射文件并校验源文件的摘要，不解析YAML
+    path = str(tmp_path / "classifier.snapshot")
+    snapshot.compile_snapshot(path, str(data_dir))
+    loaded = benchmark(snapshot.load_snapshot, path, True, str(data_dir))
+    index = loaded.find_name("Synthetic Player 42")
+    assert loaded.vids[index] == "player100042"
+    assert loaded.names[loaded.find_vid("player100")] == "Tim Duncan"
+    assert loaded.entity_type(loaded.find_name("Lakers")) == "team"
+
+
+def test_classifier_init_snapshot(benchmark, data_dir, tmp_path):
+    path = str(tmp_path / "classifier.snapshot")
+    snapshot.compile_snapshot(path, str(data_dir))
+    loaded = snapshot.load_snapshot(path, data_dir=str(data_dir))
+    classifier = benchmark(SiwiClassifier, loaded)
+    assert classifier.get_batch(SENTENCES[:5]) == SiwiClassifier().get_batch(SENTENCES[:5])
+
+
+def test_classifier_init_snapshot_rebuild(benchmark, data_dir, tmp_path):
+    # 没有预先构建的实体自动机时逐个添加实体名
+    path = str(tmp_path / "classifier.snapshot")
+    snapshot.compile_snapshot(path, str(data_dir))
+    loaded = snapshot.load_snapshot(path, data_dir=str(data_dir))
+    os.unlink(snapshot.automaton_path(path, loaded.digest))
+    classifier = benchmark(SiwiClassifier, loaded)
+    assert classifier.get_batch(SENTENCES[:5]) == SiwiClassifier().get_batch(SENTENCES[:5])
+
+
+def test_snapshot_stale(data_dir, tmp_path):
+    path = str(tmp_path / "classifier.snapshot")
+    snapshot.compile_snapshot(path, str(data_dir))
+    with open(data_dir / "example_teams.yaml", "a") as file:
+        file.write("\nSynthetic Team: team999\n")
+    with pytest.raises(snapshot.StaleSnapshot):
+        snapshot.load_snapshot(path, data_dir=str(data_dir))
+    # 不校验摘要时仍然可以使用旧的快照
+    assert snapshot.load_snapshot(path, check=False).find_name("Synthetic Team") is None
@@ -0,0 +1,39 @@
+"""siwi.decoder基准测试：整列解码与逐格ValueWrapper解码的对比"""
+
+import pytest
+
+from siwi.decoder import column, decode_floats, decode_strings, decode_vids
+
+
+@pytest.fixture
+def fetch_result(fake_pool, graph):
+    # 所有球员的id、name和embedding1，约2000行
+    vids = ", ".join(f'"{vid}"' for vid in graph.vertices if "player" in graph.vertices[vid])
+    session = fake_pool.get_session("root", "nebula")
+    try:
+        return session.execute(
+            f"USE {graph.space_name}; FETCH PROP ON player {vids} "
+            f"YIELD id(vertex) AS id, properties(vertex).name AS name, "
+            f"properties(vertex).embedding1 AS embedding")
+    finally:
+        session.release()
+
+
+def test_decode_row_values(benchmark, fetch_result):
+    # 原来的逐格解码方式，作为对照
+    def decode():
+        rows = []
+        for i in range(fetch_result.row_size()):
+            row = fetch_result.row_values(i)
+            rows.append((row[0].as_string(), row[1].as_string(), row[2].as_double()))
+        return rows
+    assert len(benchmark(decode)) == fetch_result.row_size()
+
+
+def test_decode_columns(benchmark, fetch_result):
+    def decode():
+        return (decode_vids(column(fetch_result, 0))[0],
+                decode_strings(column(fetch_result, 1))[0],
+                decode_floats(column(fetch_result, 2))[0])
+    vids, _, _ = benchmark(decode)
+    assert len(vids) == fetch_result.row_size()
@@ -0,0 +1,47 @@
+"""INT64 VID图空间的基准测试：索引直接作为VID，结果直接解码为整数"""
+
+import pytest
+import torch
+
+from siwi import space
+from siwi.remote_backend import NebulaFeatureStore
+from siwi.subgraph_sampler import SubgraphSampler
+from siwi.testing import SyntheticGraph
+
+
+@pytest.fixture(scope="module")
+def graph():
+    # 球员VID为100..2099的整数，与字符串VID的基准测试规模相同
+    return SyntheticGraph(num_players=2000, vid_type="INT64")
+
+
+@pytest.mark.parametrize("num_nodes", [16, 256])
+def test_feature_store_get_tensor_int_vids(run_benchmark, fake_pool, num_nodes):
+    feature_store = NebulaFeatureStore()
+    index = torch.arange(100, 100 + num_nodes)
+    run_benchmark(feature_store.get_tensor, "player", "embedding1", index)
+
+
+@pytest.mark.parametrize("n_hops", [1, 2, 3])
+def test_sample_subgraph_int_vids(run_benchmark, fake_pool, n_hops):
+    sampler = SubgraphSampler(fake_pool)
+    run_benchmark(sampler.sample_subgraph, center_vid=150, n_hops=n_hops)
+
+
+def test_sample_subgraph_hub_int_vids(run_benchmark, fake_pool, graph):
+    sampler = SubgraphSampler(fake_pool)
+    hub = graph.hubs(1, tag="player")[0]
+    run_benchmark(sampler.sample_subgraph, center_vid=hub, n_hops=2)
+
+
+def test_vid_type_failure_not_retried(fake_pool, monkeypatch):
+    # 查询失败的图空间在SIWI_VID_TYPE_RETRY秒内不再重复执行DESCRIBE SPACE
+    monkeypatch.setenv("SIWI_VID_TYPE_RETRY", "30")
+    fake_pool.reset_counters()
+    assert space.get_vid_type("missing_space", fake_pool) == space.DEFAULT_VID_TYPE
+    assert space.get_vid_type("missing_space", fake_pool) == space.DEFAULT_VID_TYPE
+    assert fake_pool.round_trips == 1
+    monkeypatch.setenv("SIWI_VID_TYPE_RETRY", "0")
+    space.get_vid_type("missing_space", fake_pool)
+    assert fake_pool.round_trips == 2
+    space.clear_vid_types("missing_space")
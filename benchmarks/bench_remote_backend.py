@@ -0,0 +1,120 @@
+"""NebulaFeatureStore、NebulaGraphStore和SimpleNeighborLoader基准测试"""
+
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import torch
+
+from siwi import miss_cache
+from siwi.feature_store import get_entity_embedding
+from siwi.neighbor_loader import SimpleNeighborLoader
+from siwi.remote_backend import NebulaFeatureStore, NebulaGraphStore
+from siwi.warmup import warm_up
+
+
+@pytest.mark.parametrize("num_nodes", [16, 256])
+def test_feature_store_get_tensor(run_benchmark, num_nodes):
+    feature_store = NebulaFeatureStore()
+    # 默认ID映射为 f"{group}{idx}"，合成图中的球员从player100开始
+    index = torch.arange(100, 100 + num_nodes)
+    run_benchmark(feature_store.get_tensor, "player", "embedding1", index)
+
+
+@pytest.mark.parametrize("num_threads", [1, 16])
+def test_get_entity_embedding_concurrent(run_benchmark, fake_pool, num_threads):
+    # 多个线程同时查询不同实体，并发的查询合并为多VID的FETCH PROP。
+    # 往返没有延迟时线程之间几乎不重叠，这里至少注入1毫秒的往返延迟
+    fake_pool.latency = max(fake_pool.latency, 0.001)
+    vids = [f"player{100 + i}" for i in range(64)]
+
+    def lookup_all():
+        with ThreadPoolExecutor(num_threads) as executor:
+            assert None not in executor.map(get_entity_embedding, vids)
+    run_benchmark(lookup_all)
+
+
+def test_feature_store_get_tensor_misses(run_benchmark):
+    # 合成图中没有player5000...player5255，第一次读取后由负缓存在本地判定，不再查询graphd
+    feature_store = NebulaFeatureStore()
+    index = torch.arange(5000, 5256)
+    feature_store.get_tensor("player", "embedding1", index)
+    run_benchmark(feature_store.get_tensor, "player", "embedding1", index)
+
+
+def test_get_entity_embedding_vid_filter(run_benchmark, fake_pool, graph):
+    # 从未查询过的不存在的VID由Bloom过滤器判定
+    miss_cache.VID_FILTERS.build(graph.space_name, "player", fake_pool)
+    vids = [f"unknown{i}" for i in range(256)]
+
+    def lookup_all():
+        miss_cache.NEGATIVE_CACHE.clear()
+        assert all(get_entity_embedding(vid) is None for vid in vids)
+    run_benchmark(lookup_all)
+
+
+def test_feature_store_multi_get_tensor(run_benchmark):
+    # 同一组节点上的两个特征合并为一条FETCH PROP
+    feature_store = NebulaFeatureStore()
+    index = torch.arange(100, 356)
+    run_benchmark(feature_store.multi_get_tensor,
+                  [("player", "embedding1", index), ("player", "age", index)])
+
+
+@pytest.mark.parametrize("num_nodes", [4, 32])
+def test_graph_store_get_edge_index(run_benchmark, num_nodes):
+    graph_store = NebulaGraphStore()
+    graph_store.id_mapper = lambda idx: f"player{idx}"
+    index = torch.arange(100, 100 + num_nodes)
+    run_benchmark(graph_store.get_edge_index, ("player", "follow", "player"),
+                  index=(index, index))
+
+
+@pytest.mark.parametrize("num_nodes", [4, 32])
+def test_graph_store_get_edge_index_warm(run_benchmark, graph, num_nodes):
+    # 预热缓存了一跳邻接的源节点不再采样
+    warm_up(graph.space_name, top_k=len(graph.vertices))
+    graph_store = NebulaGraphStore()
+    graph_store.id_mapper = lambda idx: f"player{idx}"
+    index = torch.arange(100, 100 + num_nodes)
+    run_benchmark(graph_store.get_edge_index, ("player", "follow", "player"),
+                  index=(index, index))
+
+
+def test_feature_store_get_tensor_warm(run_benchmark, graph):
+    # 预热缓存了全部顶点后读取特征不再查询graphd
+    warm_up(graph.space_name, top_k=len(graph.vertices))
+    feature_store = NebulaFeatureStore()
+    run_benchmark(feature_store.get_tensor, "player", "embedding1", torch.arange(100, 356))
+
+
+def test_feature_store_get_tensor_disk(run_benchmark, disk_cache_db):
+    # 另一个NebulaFeatureStore读取过的特征行从磁盘缓存读取
+    index = torch.arange(100, 356)
+    NebulaFeatureStore().get_tensor("player", "embedding1", index)
+    disk_cache_db.flush()
+    feature_store = NebulaFeatureStore()
+    run_benchmark(feature_store.get_tensor, "player", "embedding1", index)
+
+
+def test_feature_store_get_tensor_shm(run_benchmark, fake_pool, shm_cache_segment):
+    # 另一个worker进程读取过的特征行从共享内存读取
+    index = torch.arange(100, 356)
+    child = multiprocessing.get_context("fork").Process(
+        target=NebulaFeatureStore().get_tensor, args=("player", "embedding1", index))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    feature_store = NebulaFeatureStore()
+    run_benchmark(feature_store.get_tensor, "player", "embedding1", index)
+
+
+def test_warm_up(run_benchmark, graph):
+    result = run_benchmark(warm_up, graph.space_name, top_k=500)
+    assert result.stopped == "done" and result.adjacency == 500
+
+
+@pytest.mark.parametrize("num_hops", [1, 2])
+def test_neighbor_loader_load_data(run_benchmark, num_hops):
+    loader = SimpleNeighborLoader(NebulaFeatureStore(), NebulaGraphStore())
+    run_benchmark(loader.load_data, ["player150"], [0], num_hops)
@@ -0,0 +1,34 @@
+"""RoutingConnectionPool基准测试：一个graphd变慢时的采样延迟"""
+
+import pytest
+
+from siwi.routing import RoutingConnectionPool
+from siwi.subgraph_sampler import SubgraphSampler
+from siwi.testing import FakeConnectionPool
+
+
+@pytest.fixture
+def degraded_pool(graph, fake_pool):
+    # 第二个graphd每次往返慢20到40毫秒
+    slow = FakeConnectionPool(graph, latency=0.02, jitter=0.02)
+    router = RoutingConnectionPool([(("graphd-1", 9669), fake_pool), (("graphd-2", 9669), slow)],
+                                   explore=60)
+    yield router, slow
+    router.close()
+
+
+@pytest.mark.parametrize("hedge", [False, True])
+def test_sample_subgraph_routed(run_benchmark, fake_pool, degraded_pool, hedge):
+    # 慢节点只收到探索和对冲请求，延迟接近单个健康节点
+    router, slow = degraded_pool
+    router.hedge = hedge
+    sampler = SubgraphSampler(router)
+    for _ in range(5):
+        sampler.sample_subgraph(center_vid="player150", n_hops=2)
+    # 探索和超过p95的对冲会把少量请求发给慢节点，只限制它们的占比
+    slow.reset_counters()
+    fake_pool.reset_counters()
+    for i in range(50):
+        sampler.sample_subgraph(center_vid=f"player{100 + i}", n_hops=2)
+    assert slow.round_trips <= 0.1 * (slow.round_trips + fake_pool.round_trips)
+    run_benchmark(sampler.sample_subgraph, center_vid="player150", n_hops=2)
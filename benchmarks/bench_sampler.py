@@ -0,0 +1,90 @@
+"""SubgraphSampler基准测试：不同跳数、普通顶点与热点顶点"""
+
+import pytest
+
+from siwi.neighborhood_index import build_index
+from siwi.subgraph_sampler import SubgraphSampler
+
+
+@pytest.mark.parametrize("n_hops", [1, 2, 3])
+def test_sample_subgraph(run_benchmark, fake_pool, n_hops):
+    sampler = SubgraphSampler(fake_pool)
+    run_benchmark(sampler.sample_subgraph, center_vid="player150", n_hops=n_hops)
+
+
+@pytest.mark.parametrize("n_hops", [1, 2])
+def test_sample_subgraph_hub(run_benchmark, fake_pool, graph, n_hops):
+    sampler = SubgraphSampler(fake_pool)
+    hub = graph.hubs(1, tag="player")[0]
+    run_benchmark(sampler.sample_subgraph, center_vid=hub, n_hops=n_hops)
+
+
+@pytest.mark.parametrize("n_hops", [1, 2])
+def test_sample_subgraph_hub_indexed(run_benchmark, fake_pool, graph, n_hops):
+    # 热点顶点的邻域已物化，采样变为内存查找
+    build_index(graph.space_name, top_n=10, hops=[n_hops], tags=["player"], connection_pool=fake_pool)
+    sampler = SubgraphSampler(fake_pool)
+    hub = graph.hubs(1, tag="player")[0]
+    run_benchmark(sampler.sample_subgraph, center_vid=hub, n_hops=n_hops)
+
+
+@pytest.mark.parametrize("n_hops", [2, 3])
+def test_sample_subgraph_disk(run_benchmark, fake_pool, disk_cache_db, n_hops):
+    # 另一个worker（或重启之前）采样过的子图从磁盘缓存读取
+    SubgraphSampler(fake_pool).sample_subgraph(center_vid="player150", n_hops=n_hops)
+    disk_cache_db.flush()
+    sampler = SubgraphSampler(fake_pool)
+    run_benchmark(sampler.sample_subgraph, center_vid="player150", n_hops=n_hops)
+
+
+@pytest.mark.parametrize("direction", ["out", "in", "both"])
+def test_sample_subgraph_hub_pushdown(run_benchmark, fake_pool, graph, direction):
+    # 热点顶点只沿follow边遍历，serve边在服务端被过滤
+    sampler = SubgraphSampler(fake_pool)
+    hub = graph.hubs(1, tag="player")[0]
+    run_benchmark(sampler.sample_subgraph, center_vid=hub, n_hops=2,
+                  edge_types=["follow"], direction=direction)
+
+
+@pytest.mark.parametrize("n_hops", [2, 3])
+def test_sample_subgraph_projection(run_benchmark, fake_pool, n_hops):
+    # 只读取player的embedding1，team节点不读取特征
+    sampler = SubgraphSampler(fake_pool)
+    run_benchmark(sampler.sample_subgraph, center_vid="player150", n_hops=n_hops,
+                  node_attrs={"player": ["embedding1"]})
+
+
+@pytest.mark.parametrize("n_hops", [1, 2, 3])
+def test_sample_subgraph_unfused(run_benchmark, fake_pool, n_hops):
+    # 遍历、标签查询、FETCH PROP分阶段执行的原始路径，作为融合模式的对照
+    sampler = SubgraphSampler(fake_pool)
+    run_benchmark(sampler.sample_subgraph, center_vid="player150", n_hops=n_hops, fused=False)
+
+
+@pytest.mark.parametrize("n_hops", [1, 3])
+def test_sample_subgraph_edge_props(run_benchmark, fake_pool, n_hops):
+    # 边属性与拓扑在同一查询中返回，往返次数应与不取属性时相同
+    sampler = SubgraphSampler(fake_pool)
+    run_benchmark(sampler.sample_subgraph, center_vid="player150", n_hops=n_hops,
+                  edge_props={"follow": ["degree"]})
+
+
+def test_convert_to_pyg_data(benchmark, fake_pool):
+    sampler = SubgraphSampler(fake_pool)
+    subgraph = sampler.sample_subgraph(center_vid="player150", n_hops=2)
+    benchmark(sampler.convert_to_pyg_data, subgraph)
+
+
+@pytest.mark.parametrize("coalesce", [False, True])
+def test_create_edge_index(benchmark, fake_pool, graph, coalesce):
+    # 整个合成图的边，衡量纯CPU的edge_index构建开销
+    edges = [
+        (src, dst, etype)
+        for src, out_edges in graph.out_edges.items()
+        for etype, dst, _, _ in out_edges]
+
+    def build():
+        sampler = SubgraphSampler(fake_pool)
+        return sampler._create_edge_index(edges, True, coalesce)
+    edge_index = benchmark(build)
+    assert edge_index.shape[1] <= 2 * len(edges)
@@ -0,0 +1,44 @@
+"""冷启动基准测试：云函数入口（src/main.py）在新进程中的导入耗时和加载的模块
+
+SIWI_BENCH_IMPORT_MS 导入main的耗时上限（毫秒，python -X importtime统计），默认1000
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+# 只处理问答的进程不应加载的模块
+HEAVY_MODULES = ("torch", "torch_geometric", "flask")
+
+REPORT_LOADED = f"import sys; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+
+
+def _python(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=SRC,
+        env={**os.environ, "PYTHONPATH": SRC}, capture_output=True, text=True, check=True)
+
+
+def test_import_entry_point(benchmark):
+    result = _python("import main; " + REPORT_LOADED)
+    assert result.stdout.split() == []
+    # importtime的最后一列是包含子模块的累计耗时（微秒）
+    match = re.search(r"\|\s*(\d+) \| main$", result.stderr, re.MULTILINE)
+    assert int(match.group(1)) / 1000 < float(os.environ.get("SIWI_BENCH_IMPORT_MS", 1000))
+    benchmark.pedantic(_python, args=("import main",), rounds=3, iterations=1)
+
+
+def test_query_entry_point():
+    # 处理问答请求之后仍然没有加载torch、PyG和Flask
+    result = _python(
+        "from siwi.connection import set_connection_pool\n"
+        "from siwi.testing import FakeConnectionPool, SyntheticGraph\n"
+        "set_connection_pool(FakeConnectionPool(SyntheticGraph(num_players=200)))\n"
+        "import main\n"
+        "class Request:\n"
+        "    def get_json(self):\n"
+        "        return {'question': 'Whom does Tim Duncan follow?'}\n"
+        "assert main.siwi_api(Request())['answer']\n" + REPORT_LOADED)
+    assert result.stdout.split() == []
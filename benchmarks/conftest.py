@@ -0,0 +1,100 @@
+"""
+离线基准测试的公共fixture
+
+所有基准测试都运行在siwi.testing.FakeConnectionPool之上，不需要graphd。
+可以通过环境变量调整:
+    SIWI_BENCH_PLAYERS      合成图中的球员数，默认2000
+    SIWI_BENCH_TEAMS        合成图中的球队数，默认30
+    SIWI_BENCH_LATENCY_MS   每次往返注入的延迟（毫秒），默认0
+    SIWI_BENCH_JITTER_MS    在延迟之上叠加的随机抖动上限（毫秒），默认0
+
+运行: pytest benchmarks
+"""
+
+import os
+import sys
+
+# 确保src目录在Python路径中
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import pytest
+
+from siwi import (connection, disk_cache, metrics, miss_cache, neighborhood_index, shm_cache, space,
+                  vertex_cache)
+from siwi.testing import FakeConnectionPool, SyntheticGraph
+
+# 测试名 -> (经过metrics.execute的往返次数, FakeConnectionPool收到的往返次数)
+_round_trips = {}
+
+
+@pytest.fixture(scope="session")
+def graph():
+    return SyntheticGraph(
+        num_players=int(os.environ.get("SIWI_BENCH_PLAYERS", 2000)),
+        num_teams=int(os.environ.get("SIWI_BENCH_TEAMS", 30)))
+
+
+@pytest.fixture
+def fake_pool(graph):
+    """注入到siwi.connection中的FakeConnectionPool"""
+    pool = FakeConnectionPool(
+        graph,
+        latency=float(os.environ.get("SIWI_BENCH_LATENCY_MS", 0)) / 1000,
+        jitter=float(os.environ.get("SIWI_BENCH_JITTER_MS", 0)) / 1000)
+    connection.set_connection_pool(pool)
+    # 每个测试的合成图可能使用不同的VID类型，预先查询一次，不计入单次调用的往返次数
+    space.clear_vid_types()
+    space.get_vid_type(graph.space_name, pool)
+    # 未命中缓存属于上一个测试的图
+    miss_cache.NEGATIVE_CACHE.clear()
+    miss_cache.VID_FILTERS.clear()
+    vertex_cache.VERTEX_CACHE.clear()
+    neighborhood_index.NEIGHBORHOOD_INDEX.clear()
+    yield pool
+    connection.set_connection_pool(None)
+
+
+@pytest.fixture
+def disk_cache_db(tmp_path, fake_pool):
+    """在临时目录中启用siwi.disk_cache.DISK_CACHE"""
+    disk_cache.DISK_CACHE.open(str(tmp_path / "siwi-cache.sqlite3"))
+    yield disk_cache.DISK_CACHE
+    disk_cache.DISK_CACHE.close()
+
+
+@pytest.fixture
+def shm_cache_segment(fake_pool):
+    """启用siwi.shm_cache.SHM_CACHE，使用本测试独占的共享内存"""
+    shm_cache.SHM_CACHE.open(f"siwi-bench-{os.getpid()}", 8 * 2 ** 20)
+    yield shm_cache.SHM_CACHE
+    shm_cache.SHM_CACHE.close()
+    shm_cache.SHM_CACHE.unlink()
+
+
+@pytest.fixture
+def run_benchmark(request, benchmark, fake_pool):
+    """运行基准测试，并在结果中记录单次调用的往返次数
+
+    先单独调用一次统计往返次数（metrics.track统计经过metrics.execute的请求，
+    pool_round_trips统计FakeConnectionPool实际收到的请求），再交给benchmark计时。
+    """
+    def run(func, *args, **kwargs):
+        fake_pool.reset_counters()
+        with metrics.track("benchmark") as tracker:
+            func(*args, **kwargs)
+        benchmark.extra_info["round_trips"] = tracker.count
+        benchmark.extra_info["pool_round_trips"] = fake_pool.round_trips
+        _round_trips[request.node.name] = (tracker.count, fake_pool.round_trips)
+        return benchmark(func, *args, **kwargs)
+    return run
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _round_trips:
+        return
+    terminalreporter.section("NebulaGraph round trips per call")
+    width = max(len(name) for name in _round_trips)
+    for name in sorted(_round_trips):
+        tracked, received = _round_trips[name]
+        terminalreporter.write_line(
+            f"{name:<{width}}  tracked={tracked:<6} pool={received}")
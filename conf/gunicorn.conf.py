@@ -0,0 +1,41 @@
+# gunicorn配置: 多进程 + 多线程的WSGI服务
+#
+#   gunicorn --config conf/gunicorn.conf.py wsgi:application
+#
+# 应用在master中preload，fork之后每个worker在post_fork中创建自己的
+# NebulaGraph连接池，进程之间不共享socket。
+import multiprocessing
+import os
+
+bind = f":{os.environ.get('PORT', 5000)}"
+
+# worker数随CPU核数扩展，每个worker内用线程处理阻塞在graphd上的请求
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("SIWI_THREADS", 8))
+
+# 每个线程同时最多占用一个连接，连接池不应小于线程数
+os.environ.setdefault("NG_MAX_CONN_POOL_SIZE", str(threads))
+# bot的批量查询线程池同样受连接池大小约束
+os.environ.setdefault("SIWI_BATCH_MAX_WORKERS", str(threads))
+
+preload_app = True
+timeout = int(os.environ.get("SIWI_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    from siwi.app import init_app
+    init_app()
+
+
+def worker_exit(server, worker):
+    from siwi.connection import close_connection_pool
+    close_connection_pool()
+
+
+def on_exit(server):
+    # 共享内存特征缓存属于所有worker，master退出时删除
+    from siwi.shm_cache import SHM_CACHE
+    SHM_CACHE.unlink()
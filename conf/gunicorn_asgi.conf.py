@@ -0,0 +1,28 @@
+# gunicorn配置: 以uvicorn worker运行ASGI版本的路由
+#
+#   gunicorn --config conf/gunicorn_asgi.conf.py siwi.app.asgi:application
+#
+# 每个worker在ASGI lifespan启动阶段创建自己的连接池，
+# 请求在worker内的有界线程池（SIWI_ASGI_THREADS）中执行。
+import multiprocessing
+import os
+
+bind = f":{os.environ.get('PORT', 5000)}"
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+threads = int(os.environ.get("SIWI_ASGI_THREADS", 8))
+os.environ.setdefault("SIWI_ASGI_THREADS", str(threads))
+os.environ.setdefault("NG_MAX_CONN_POOL_SIZE", str(threads))
+os.environ.setdefault("SIWI_BATCH_MAX_WORKERS", str(threads))
+
+timeout = int(os.environ.get("SIWI_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_exit(server):
+    # 共享内存特征缓存属于所有worker，master退出时删除
+    from siwi.shm_cache import SHM_CACHE
+    SHM_CACHE.unlink()
@@ -0,0 +1,212 @@
+"""
+请求代价估算与准入控制
+
+几个热点顶点上的3跳采样就能占满worker的所有线程，其余请求排在后面直到超时。
+处理函数在执行之前按度数估算请求的代价，再经AdmissionController准入:
+
+- CostEstimator: 采样请求的代价估算为遍历的边数。中心节点的度数取自预热缓存的
+  一跳邻接或之前的1跳采样，未知时取观测到的平均度数；n跳的代价为
+  度数 × 平均度数^(n-1)。同一 (中心节点, 跳数) 采样之后记录实际的边数
+- AdmissionController: 所有请求共享SIWI_ADMISSION_SLOTS个执行槽（默认与
+  SIWI_THREADS相同），代价不低于SIWI_HEAVY_COST（默认5000条边）的重请求还要先取得
+  SIWI_ADMISSION_HEAVY_SLOTS个（默认执行槽的四分之一）重请求槽之一，因此重请求
+  不会占满所有线程。槽满时请求按到达顺序排队，每类最多SIWI_ADMISSION_QUEUE个
+  （默认执行槽的两倍）；队列已满、或排队超过SIWI_ADMISSION_WAIT_MS（默认1000）
+  或请求的剩余时间时抛出Overloaded，处理函数返回429
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional
+
+from siwi import deadline, metrics
+from siwi.vertex_cache import VERTEX_CACHE
+
+# 没有观测值时假设的平均度数
+_DEFAULT_DEGREE = 10.0
+_ALPHA = 0.05
+
+ADMISSION_ACTIVE = metrics.gauge(
+    "siwi_admission_active",
+    "Requests holding an admission slot by class (all or heavy)",
+    ("kind",))
+ADMISSION_QUEUED = metrics.gauge(
+    "siwi_admission_queued",
+    "Requests waiting for an admission slot by class (all or heavy)",
+    ("kind",))
+ADMISSION_REJECTED = metrics.counter(
+    "siwi_admission_rejected_total",
+    "Requests rejected by admission control by class and reason (queue_full or timeout)",
+    ("kind", "reason"))
+REQUEST_COST = metrics.histogram(
+    "siwi_request_cost_edges",
+    "Estimated cost of admitted sampling requests in traversed edges",
+    buckets=(10, 100, 1000, 5000, 10000, 50000, 100000, 1000000))
+
+
+class Overloaded(Exception):
+    """准入控制拒绝了请求
+
+    Attributes:
+        retry_after: 建议的重试间隔（秒）
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CostEstimator:
+    """按中心节点的度数估算采样请求遍历的边数
+
+    Args:
+        max_entries: 记录的 (中心节点, 跳数) 观测值个数上限
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        # (space, str(vid), n_hops) -> 实际的边数
+        self._observed: "OrderedDict[tuple, int]" = OrderedDict()
+        self.avg_degree = _DEFAULT_DEGREE
+        self._lock = threading.Lock()
+
+    def degree(self, space: str, vid) -> Optional[int]:
+        """中心节点的度数，不知道时返回None"""
+        adjacency = VERTEX_CACHE.get_adjacency(space, vid)
+        if adjacency is not None:
+            return len(adjacency)
+        return self._observed.get((space, str(vid), 1))
+
+    def estimate(self, space: str, vid, n_hops: int) -> float:
+        """n_hops跳采样的估算边数"""
+        observed = self._observed.get((space, str(vid), n_hops))
+        if observed is not None:
+            return float(observed)
+        degree = self.degree(space, vid)
+        degree = self.avg_degree if degree is None else degree
+        return degree * self.avg_degree ** max(n_hops - 1, 0)
+
+    def record(self, space: str, vid, n_hops: int, num_edges: int) -> None:
+        """记录一次采样实际取得的边数"""
+        # HTTP参数中的VID是字符串，INT64 VID按字符串形式记录
+        key = (space, str(vid), n_hops)
+        with self._lock:
+            self._observed[key] = num_edges
+            self._observed.move_to_end(key)
+            while len(self._observed) > self.max_entries:
+                self._observed.popitem(last=False)
+            if n_hops == 1:
+                self.avg_degree += _ALPHA * (max(num_edges, 1) - self.avg_degree)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._observed.clear()
+            self.avg_degree = _DEFAULT_DEGREE
+
+
+class _Bulkhead:
+    """有界的执行槽和先进先出的等待队列"""
+
+    def __init__(self, kind: str, slots: int, max_queue: int):
+        self.kind = kind
+        self.slots = slots
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiting: deque = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: Optional[float]) -> None:
+        with self._cond:
+            if self.active < self.slots and not self._waiting:
+                self.active += 1
+                ADMISSION_ACTIVE.set(self.active, kind=self.kind)
+                return
+            if len(self._waiting) >= self.max_queue:
+                ADMISSION_REJECTED.inc(kind=self.kind, reason="queue_full")
+                raise Overloaded(f"{self.kind}请求的等待队列已满")
+            ticket = object()
+            self._waiting.append(ticket)
+            ADMISSION_QUEUED.set(len(self._waiting), kind=self.kind)
+            try:
+                admitted = self._cond.wait_for(
+                    lambda: self._waiting[0] is ticket and self.active < self.slots, timeout)
+                if not admitted:
+                    ADMISSION_REJECTED.inc(kind=self.kind, reason="timeout")
+                    raise Overloaded(f"{self.kind}请求等待执行槽超时")
+                self.active += 1
+                ADMISSION_ACTIVE.set(self.active, kind=self.kind)
+            finally:
+                self._waiting.remove(ticket)
+                ADMISSION_QUEUED.set(len(self._waiting), kind=self.kind)
+                # 队首变化，唤醒下一个等待者
+                self._cond.notify_all()
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            ADMISSION_ACTIVE.set(self.active, kind=self.kind)
+            self._cond.notify_all()
+
+
+class AdmissionController:
+    """按代价分类的准入控制
+
+    Args:
+        slots: 所有请求共享的执行槽数，默认读取SIWI_ADMISSION_SLOTS
+        heavy_slots: 重请求的执行槽数，默认读取SIWI_ADMISSION_HEAVY_SLOTS
+        max_queue: 每类请求的等待队列长度，默认读取SIWI_ADMISSION_QUEUE
+        heavy_cost: 重请求的代价下限（边数），默认读取SIWI_HEAVY_COST
+        max_wait: 排队的最长时间（秒），默认读取SIWI_ADMISSION_WAIT_MS
+    """
+
+    def __init__(self, slots: Optional[int] = None,
+                 heavy_slots: Optional[int] = None,
+                 max_queue: Optional[int] = None,
+                 heavy_cost: Optional[float] = None,
+                 max_wait: Optional[float] = None):
+        slots = slots or int(os.environ.get(
+            "SIWI_ADMISSION_SLOTS", os.environ.get("SIWI_THREADS", 8)))
+        heavy_slots = heavy_slots or int(os.environ.get(
+            "SIWI_ADMISSION_HEAVY_SLOTS", max(slots // 4, 1)))
+        max_queue = max_queue or int(os.environ.get("SIWI_ADMISSION_QUEUE", 2 * slots))
+        self.heavy_cost = heavy_cost or float(os.environ.get("SIWI_HEAVY_COST", 5000))
+        self.max_wait = (float(os.environ.get("SIWI_ADMISSION_WAIT_MS", 1000)) / 1000
+                         if max_wait is None else max_wait)
+        self._all = _Bulkhead("all", slots, max_queue)
+        self._heavy = _Bulkhead("heavy", min(heavy_slots, slots), max_queue)
+
+    def _timeout(self, start: float) -> float:
+        timeout = self.max_wait - (time.monotonic() - start)
+        budget = deadline.remaining()
+        if budget is not None:
+            timeout = min(timeout, budget)
+        return max(timeout, 0.0)
+
+    @contextmanager
+    def admit(self, cost: float = 0.0):
+        """取得执行槽后执行with块，被拒绝时抛出Overloaded
+
+        重请求先在重请求队列中等待，取得重请求槽之后才占用共享的执行槽。
+        """
+        start = time.monotonic()
+        heavy = cost >= self.heavy_cost
+        if cost:
+            REQUEST_COST.observe(cost)
+        if heavy:
+            self._heavy.acquire(self._timeout(start))
+        try:
+            self._all.acquire(self._timeout(start))
+            try:
+                yield
+            finally:
+                self._all.release()
+        finally:
+            if heavy:
+                self._heavy.release()
+
+
+ESTIMATOR = CostEstimator()
+ADMISSION = AdmissionController()
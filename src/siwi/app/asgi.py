@@ -0,0 +1,131 @@
+"""
+Siwi API的ASGI版本
+
+不依赖额外的Web框架，直接实现ASGI协议，路由与Flask版本一致并共用
+siwi.app.handlers中的处理函数。nebula3客户端是同步的，所以处理函数在
+有界线程池中执行，事件循环只负责收发HTTP。
+
+启动命令:
+    gunicorn --config conf/gunicorn_asgi.conf.py siwi.app.asgi:application
+或:
+    uvicorn siwi.app.asgi:application --workers 4
+"""
+
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from siwi.app import handlers, init_app
+from siwi.connection import close_connection_pool
+
+# 线程池大小应不超过NG_MAX_CONN_POOL_SIZE，否则线程会等待连接
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SIWI_ASGI_THREADS', 8)),
+    thread_name_prefix="siwi-asgi")
+
+_ROUTES = [
+    ("GET", re.compile(r"^/$"),
+     lambda match, args, body: ("Hey There?", 200)),
+    ("GET", re.compile(r"^/metrics$"),
+     lambda match, args, body: handlers.handle_metrics()),
+    ("POST", re.compile(r"^/query$"),
+     lambda match, args, body: handlers.handle_query(body)),
+    ("POST", re.compile(r"^/query/batch$"),
+     lambda match, args, body: handlers.handle_query_batch(body)),
+    ("GET", re.compile(r"^/api/v1/entity/(?P<entity_tag>[^/]+)/(?P<entity_id>[^/]+)/embedding$"),
+     lambda match, args, body: handlers.handle_entity_embedding(
+         match["entity_tag"], match["entity_id"])),
+    ("GET", re.compile(r"^/api/v1/subgraph/(?P<entity_id>[^/]+)/(?P<n_hops>\d+)$"),
+     lambda match, args, body: handlers.handle_subgraph(
+         match["entity_id"], int(match["n_hops"]), args)),
+    ("GET", re.compile(r"^/api/v1/pyg/(?P<entity_id>[^/]+)/(?P<n_hops>\d+)$"),
+     lambda match, args, body: handlers.handle_pyg_subgraph(
+         match["entity_id"], int(match["n_hops"]), args)),
+]
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def _send_response(send, payload, status: int,
+                         content_type: bytes = b"text/html; charset=utf-8") -> None:
+    if isinstance(payload, str):
+        content = payload.encode("utf-8")
+    else:
+        content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        content_type = b"application/json"
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(len(content)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": content})
+
+
+async def _lifespan(receive, send) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # 每个worker进程在启动时创建自己的连接池和bot
+            await loop.run_in_executor(_executor, init_app)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await loop.run_in_executor(_executor, close_connection_pool)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"]
+    method = scope["method"]
+    for route_method, pattern, handler in _ROUTES:
+        match = pattern.match(path)
+        if match is None:
+            continue
+        if route_method != method:
+            await _send_response(send, {"error": "Method Not Allowed"}, 405)
+            return
+
+        body = None
+        if method == "POST":
+            raw_body = await _read_body(receive)
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+            except ValueError:
+                await _send_response(send, {"error": "invalid json body"}, 400)
+                return
+        args = dict(parse_qsl(scope.get("query_string", b"").decode("utf-8")))
+
+        loop = asyncio.get_running_loop()
+        if path == "/metrics":
+            # 指标渲染只读内存，不需要进入线程池
+            payload, status = handler(match, args, body)
+            await _send_response(
+                send, payload, status, b"text/plain; version=0.0.4")
+            return
+        payload, status = await loop.run_in_executor(
+            _executor, handler, match, args, body)
+        await _send_response(send, payload, status)
+        return
+
+    await _send_response(send, {"error": "Not Found"}, 404)
@@ -0,0 +1,301 @@
+"""
+与Web框架无关的路由处理函数
+
+每个处理函数接收已解析的参数，返回 (响应字典, HTTP状态码)。
+Flask路由（WSGI）和ASGI路由共用这些函数，保证两条服务路径行为一致。
+
+每个请求在截止时间（timeout_ms参数，不超过SIWI_REQUEST_TIMEOUT_MS，默认10000）内
+执行，并经siwi.admission准入：超出负载的请求立即返回429，截止时间已过仍没有任何
+结果时返回504，跳过了部分查询的子图带有"partial": true。
+
+依赖torch的模块（siwi.feature_store、siwi.subgraph_sampler）在处理函数中导入，
+只处理问答请求的进程（云函数入口src/main.py）不加载torch和PyG。
+"""
+
+import os
+
+from siwi import metrics
+from siwi.admission import ADMISSION, ESTIMATOR, Overloaded
+from siwi.connection import get_connection_pool
+from siwi.deadline import DeadlineExceeded, deadline
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+_siwi_bot = None
+
+
+def get_bot():
+    """获取当前进程的SiwiBot，首次调用时创建"""
+    global _siwi_bot
+    connection_pool = get_connection_pool()
+    if _siwi_bot is None:
+        from siwi.bot import bot
+        _siwi_bot = bot.SiwiBot(connection_pool)
+    elif _siwi_bot.connection_pool is not connection_pool:
+        # 连接池被替换（set_connection_pool）后，bot跟随当前连接池
+        _siwi_bot.connection_pool = connection_pool
+    return _siwi_bot
+
+
+def _reset_after_fork() -> None:
+    global _siwi_bot
+    # bot持有父进程的连接池和线程池，子进程需要重新创建
+    _siwi_bot = None
+
+
+def _request_timeout(args: dict) -> float:
+    """请求的时间预算（秒）：timeout_ms参数，不超过SIWI_REQUEST_TIMEOUT_MS"""
+    limit = float(os.environ.get("SIWI_REQUEST_TIMEOUT_MS", 10000))
+    timeout = float((args or {}).get("timeout_ms", limit))
+    if timeout <= 0:
+        raise ValueError("timeout_ms should be positive")
+    return min(timeout, limit) / 1000
+
+
+def _max_nodes(args: dict) -> int:
+    """max_nodes参数，不超过SIWI_MAX_NODES（默认1000）"""
+    limit = int(os.environ.get("SIWI_MAX_NODES", 1000))
+    max_nodes = int(args.get("max_nodes", limit))
+    if max_nodes <= 0:
+        raise ValueError("max_nodes should be positive")
+    return min(max_nodes, limit)
+
+
+def _overloaded(error: Overloaded) -> tuple:
+    return {"success": False, "error": str(error), "retry_after": error.retry_after}, 429
+
+
+def _deadline_exceeded(error: DeadlineExceeded) -> tuple:
+    return {"success": False, "error": str(error)}, 504
+
+
+def handle_metrics() -> tuple:
+    return metrics.render_prometheus(), 200
+
+
+def handle_query(request_data: dict) -> tuple:
+    if request_data is not None and not isinstance(request_data, dict):
+        return {"error": "request body should be a json object"}, 400
+    question = (request_data or {}).get("question", "")
+    if question:
+        try:
+            with deadline(_request_timeout({})), ADMISSION.admit(), metrics.track("query"):
+                answer = get_bot().query(question)
+        except Overloaded as e:
+            return _overloaded(e)
+        except DeadlineExceeded as e:
+            return _deadline_exceeded(e)
+    else:
+        answer = "Sorry, what did you say?"
+    return {"answer": answer}, 200
+
+
+def handle_query_batch(request_data: dict) -> tuple:
+    if request_data is not None and not isinstance(request_data, dict):
+        return {"error": "request body should be a json object"}, 400
+    questions = (request_data or {}).get("questions", [])
+    if not isinstance(questions, list):
+        return {"error": "questions should be a list"}, 400
+    if not all(q is None or isinstance(q, str) for q in questions):
+        return {"error": "questions should be a list of strings"}, 400
+    # 空问题不进入查询，保持与 /query 一致的回复
+    asked = [q for q in questions if q]
+    try:
+        with deadline(_request_timeout({})), ADMISSION.admit(), metrics.track("query_batch"):
+            answers = iter(get_bot().query_batch(asked)) if asked else iter([])
+    except Overloaded as e:
+        return _overloaded(e)
+    except DeadlineExceeded as e:
+        return _deadline_exceeded(e)
+    return {
+        "answers": [
+            next(answers) if q else "Sorry, what did you say?"
+            for q in questions
+        ]
+    }, 200
+
+
+def handle_entity_embedding(entity_tag: str, entity_id: str) -> tuple:
+    from siwi.feature_store import get_entity_embedding
+    try:
+        with deadline(_request_timeout({})), ADMISSION.admit(), metrics.track("entity_embedding"):
+            embedding_value = get_entity_embedding(entity_id, entity_tag)
+        if embedding_value is None:
+            return {
+                "success": False,
+                "error": f"无法找到实体 {entity_tag}:{entity_id} 的embedding1值"
+            }, 404
+        return {
+            "success": True,
+            "entity_id": entity_id,
+            "entity_type": entity_tag,
+            "embedding": embedding_value
+        }, 200
+    except Overloaded as e:
+        return _overloaded(e)
+    except DeadlineExceeded as e:
+        return _deadline_exceeded(e)
+    except Exception as e:
+        logger.exception("Error in get_entity_embedding_api")
+        return {"success": False, "error": str(e)}, 500
+
+
+def _traversal_args(args: dict) -> dict:
+    """解析遍历参数：edge_types（逗号分隔）和direction（out/in/both）"""
+    from siwi.subgraph_sampler import DIRECTIONS
+    direction = args.get("direction") or None
+    if direction is not None and direction not in DIRECTIONS:
+        raise ValueError(f"direction should be one of {', '.join(DIRECTIONS)}")
+    edge_types = [name.strip() for name in args.get("edge_types", "").split(",") if name.strip()]
+    return {"edge_types": edge_types or None, "direction": direction}
+
+
+def handle_subgraph(entity_id: str, n_hops: int, args: dict) -> tuple:
+    try:
+        traversal = _traversal_args(args)
+        timeout = _request_timeout(args)
+        max_nodes = _max_nodes(args)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    try:
+        n_hops = min(n_hops, 3)
+        space_name = args.get("space", "basketballplayer")
+        # 按度数估算遍历的边数，重请求只能占用一部分线程
+        cost = ESTIMATOR.estimate(space_name, entity_id, n_hops)
+
+        with deadline(timeout), ADMISSION.admit(cost):
+            from siwi.subgraph_sampler import SubgraphSampler
+            sampler = SubgraphSampler(get_connection_pool()) # 传递连接池
+            subgraph_data = sampler.sample_subgraph(
+                center_vid=entity_id,
+                n_hops=n_hops,
+                space_name=space_name,
+                max_nodes=max_nodes,
+                **traversal
+            )
+        return _serialize_subgraph(entity_id, subgraph_data), 200
+    except Overloaded as e:
+        return _overloaded(e)
+    except DeadlineExceeded as e:
+        return _deadline_exceeded(e)
+    except Exception as e:
+        logger.exception("Error in get_subgraph")
+        return {"success": False, "error": str(e)}, 500
+
+
+@metrics.span("serialization")
+def _serialize_subgraph(entity_id: str, subgraph_data: dict) -> dict:
+    """把采样结果转换为可JSON序列化的节点和边列表"""
+    # 确保 subgraph_data 中的必要字段存在且格式正确
+    center_idx = subgraph_data.get('center_node_idx', 0)
+    num_nodes = subgraph_data.get('num_nodes', 0)
+    edge_index = subgraph_data.get('edge_index')
+    num_edges = edge_index.shape[1] if edge_index is not None and hasattr(edge_index, 'shape') else 0
+
+    nodes_list = []
+    if 'idx_to_vid' in subgraph_data and isinstance(subgraph_data['idx_to_vid'], list):
+        for idx, vid_val in enumerate(subgraph_data['idx_to_vid']):
+            node_info = {
+                "idx": idx,
+                "vid": vid_val,
+                "type": subgraph_data.get('node_types', {}).get(vid_val, "unknown"),
+                "name": subgraph_data.get('node_features', {}).get(vid_val, {}).get('name', "")
+            }
+            nodes_list.append(node_info)
+
+    edges_list = []
+    if edge_index is not None and num_edges > 0 and 'idx_to_vid' in subgraph_data:
+        for i in range(num_edges):
+            src_idx = int(edge_index[0, i])
+            tgt_idx = int(edge_index[1, i])
+            edge_info = {
+                "source_idx": src_idx,
+                "target_idx": tgt_idx,
+                "source_vid": subgraph_data['idx_to_vid'][src_idx] if src_idx < len(subgraph_data['idx_to_vid']) else "unknown_src",
+                "target_vid": subgraph_data['idx_to_vid'][tgt_idx] if tgt_idx < len(subgraph_data['idx_to_vid']) else "unknown_tgt"
+            }
+            edges_list.append(edge_info)
+
+    return {
+        "success": True,
+        "partial": bool(subgraph_data.get('partial', False)),
+        "subgraph": {
+            "center_node": entity_id,
+            "center_idx": int(center_idx),
+            "num_nodes": int(num_nodes),
+            "num_edges": int(num_edges),
+            "nodes": nodes_list,
+            "edges": edges_list
+        }
+    }
+
+
+def handle_pyg_subgraph(entity_id: str, n_hops: int, args: dict) -> tuple:
+    try:
+        traversal = _traversal_args(args)
+        timeout = _request_timeout(args)
+        max_nodes = _max_nodes(args)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    try:
+        n_hops = min(n_hops, 3)
+        space_name = args.get("space", "basketballplayer")
+        cost = ESTIMATOR.estimate(space_name, entity_id, n_hops)
+
+        with deadline(timeout), ADMISSION.admit(cost):
+            from siwi.subgraph_sampler import SubgraphSampler
+            sampler = SubgraphSampler(get_connection_pool()) # 传递连接池
+            subgraph_data = sampler.sample_subgraph(
+                center_vid=entity_id,
+                n_hops=n_hops,
+                space_name=space_name,
+                max_nodes=max_nodes,
+                **traversal
+            )
+
+        return _serialize_pyg_subgraph(subgraph_data), 200
+    except Overloaded as e:
+        return _overloaded(e)
+    except DeadlineExceeded as e:
+        return _deadline_exceeded(e)
+    except Exception as e:
+        logger.exception("Error in get_pyg_subgraph")
+        return {"success": False, "error": str(e)}, 500
+
+
+@metrics.span("serialization")
+def _serialize_pyg_subgraph(subgraph_data: dict) -> dict:
+    """把采样结果转换为可JSON序列化的PyG数据"""
+    edge_index = subgraph_data.get('edge_index')
+    num_edges = edge_index.shape[1] if edge_index is not None and hasattr(edge_index, 'shape') else 0
+
+    edge_index_list = []
+    if edge_index is not None and num_edges > 0:
+         edge_index_list = [
+            [int(edge_index[0, i]), int(edge_index[1, i])]
+            for i in range(num_edges)
+        ]
+
+    node_features_list = [0.0] * subgraph_data.get('num_nodes', 0)
+    if 'idx_to_vid' in subgraph_data and 'node_features' in subgraph_data:
+        for idx, vid_val in enumerate(subgraph_data['idx_to_vid']):
+            node_feature_data = subgraph_data['node_features'].get(vid_val, {})
+            if 'embedding' in node_feature_data and hasattr(node_feature_data['embedding'], 'item'):
+                node_features_list[idx] = float(node_feature_data['embedding'].item())
+
+    return {
+        "success": True,
+        "partial": bool(subgraph_data.get('partial', False)),
+        "pyg_data": {
+            "x": node_features_list,
+            "edge_index": edge_index_list,
+            "num_nodes": subgraph_data.get('num_nodes', 0),
+            "center_node_idx": int(subgraph_data.get('center_node_idx', 0)),
+            "idx_to_vid": subgraph_data.get('idx_to_vid', [])
+        }
+    }
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,107 @@
+"""
+Siwi API的Flask路由（WSGI）
+
+路由挂在Blueprint上，处理函数在siwi.app.handlers中，与ASGI版本共用。
+"""
+
+import logging
+
+from flask import Blueprint, Flask, Response, jsonify, request
+
+from siwi.app import handlers
+from siwi.connection import close_connection_pool
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+# --- Route Definitions ---
+# 由create_app注册到每个Flask实例
+api = Blueprint("siwi", __name__)
+
+@api.route("/")
+def root():
+    return "Hey There?"
+
+@api.route("/query", methods=["POST"])
+def query_route(): # 避免与内置的 query 重名
+    payload, status = handlers.handle_query(request.get_json())
+    return jsonify(payload), status
+
+@api.route("/query/batch", methods=["POST"])
+def query_batch_route():
+    payload, status = handlers.handle_query_batch(request.get_json())
+    return jsonify(payload), status
+
+@api.route("/api/v1/entity/<entity_tag>/<entity_id>/embedding", methods=["GET"])
+def get_entity_embedding_api(entity_tag, entity_id):
+    payload, status = handlers.handle_entity_embedding(entity_tag, entity_id)
+    return jsonify(payload), status
+
+@api.route("/api/v1/subgraph/<entity_id>/<int:n_hops>", methods=["GET"])
+def get_subgraph(entity_id, n_hops):
+    payload, status = handlers.handle_subgraph(entity_id, n_hops, request.args)
+    return jsonify(payload), status
+
+@api.route("/api/v1/pyg/<entity_id>/<int:n_hops>", methods=["GET"])
+def get_pyg_subgraph(entity_id, n_hops):
+    payload, status = handlers.handle_pyg_subgraph(entity_id, n_hops, request.args)
+    return jsonify(payload), status
+
+@api.route("/metrics")
+def metrics_route():
+    payload, status = handlers.handle_metrics()
+    return Response(payload, status=status,
+                    mimetype="text/plain; version=0.0.4")
+
+@api.route("/debug/routes")
+def debug_routes():
+    from flask import current_app
+    routes = []
+    for rule in current_app.url_map.iter_rules():
+        routes.append({
+            "endpoint": rule.endpoint,
+            "methods": list(rule.methods),
+            "path": str(rule)
+        })
+    return jsonify({
+        "routes": routes,
+        "total": len(routes)
+    })
+
+
+# --- Application Factory ---
+def create_app() -> Flask:
+    """创建Flask应用
+
+    创建应用时不连接NebulaGraph：连接池和SiwiBot在每个进程中首次使用时
+    创建（或由init_app在worker启动时创建），因此可以在gunicorn master中
+    preload应用后再fork出多个worker。
+    """
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(api)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for rule in flask_app.url_map.iter_rules():
+            logger.debug("已注册的路由 %s: %s", rule.endpoint, rule.rule)
+
+    return flask_app
+
+
+# 兼容直接导入 siwi.app.app 的用法
+app = create_app()
+
+
+def run_app():
+    # 输出所有已注册的路由，用于调试
+    for rule in app.url_map.iter_rules():
+        logger.info("已注册的路由 %s: %s Methods: %s",
+                    rule.endpoint, rule.rule, sorted(rule.methods))
+
+    app.run(host="0.0.0.0", port=5000, debug=True)
+
+
+if __name__ == "__main__":
+    try:
+        run_app()
+    finally:
+        close_connection_pool()
@@ -1,6 +1,11 @@
 import importlib
-import siwi
-import yaml
+
+from siwi import metrics
+from siwi.bot.snapshot import get_snapshot
+from siwi.decoder import column, decode_paths
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
 
 
 class SiwiActions():
@@ -9,11 +14,8 @@ class SiwiActions():
         self.load_data()
 
     def load_data(self) -> None:
-        # load data from yaml files
-        module_path = f"{ siwi.__path__[0] }/bot/test/data"
-
-        with open(f"{ module_path }/example_intents.yaml", "r") as file:
-            self.intent_map = yaml.safe_load(file)["intents"]
+        # intents of the compiled snapshot, see siwi.bot.snapshot
+        self.intent_map = get_snapshot().intents
 
     def get(self, intent: dict):
         """
@@ -44,37 +46,27 @@ class SiwiActionBase():
         self.error = False
 
     def load_test_data(self) -> None:
-        module_path = f"{ siwi.__path__[0] }/bot/test/data"
-
-        with open(f"{ module_path }/example_players.yaml", "r") as file:
-            self.players = yaml.safe_load(file)
-
-        with open(f"{ module_path }/example_teams.yaml", "r") as file:
-            self.teams = yaml.safe_load(file)
-
-        self.player_names = {
-            value: key for (key, value) in self.players.items()
-            }
-        self.team_names = {
-            value: key for (key, value) in self.teams.items()
-            }
+        # names and VIDs are looked up in the mmapped snapshot shared by
+        # all actions, nothing is parsed per action
+        self.entities = get_snapshot()
 
     def _name(self, vid: str) -> str:
+        index = self.entities.find_vid(vid)
+        if index is not None:
+            return self.entities.names[index]
         if vid.startswith("player"):
-            return self.player_names.get(vid, "unknown player")
+            return "unknown player"
         elif vid.startswith("team"):
-            return self.team_names.get(vid, "unkonwn team")
+            return "unkonwn team"
         else:
             return "unkonwn"
 
     def _vid(self, name: str) -> str:
-        if name in self.players:
-            return self.players[name]
-        elif name in self.teams:
-            return self.teams[name]
+        index = self.entities.find_name(name)
+        if index is not None:
+            return self.entities.vids[index]
         else:
-            print(
-                f"[ERROR] Something went wrong, unknown vertex name { name }")
+            logger.error("Something went wrong, unknown vertex name %s", name)
             raise
 
     def _error_check(self):
@@ -113,18 +105,16 @@ class RelationshipAction(SiwiActionBase):
     FROM "player100" TO "team204" OVER * BIDIRECT UPTO 4 STEPS YIELD path AS p;
     """
     def __init__(self, intent):
-        print(f"[DEBUG] RelationshipAction intent: { intent }")
+        logger.debug("RelationshipAction intent: %s", intent)
         super().__init__(intent)
         try:
             self.entity_left, self.entity_right = intent["entities"]
             self.left_vid = self._vid(self.entity_left)
             self.right_vid = self._vid(self.entity_right)
         except Exception:
-            print(
-                f"[WARN] RelationshipAction entities recognition Failure "
-                f"will fallback to FallbackAction, "
-                f"intent: { intent }"
-                )
+            logger.warning(
+                "RelationshipAction entities recognition Failure "
+                "will fallback to FallbackAction, intent: %s", intent)
             self.error = True
 
     def execute(self, connection_pool) -> str:
@@ -135,11 +125,9 @@ class RelationshipAction(SiwiActionBase):
             f'FROM "{self.left_vid}" TO "{self.right_vid}" '
             f'OVER * BIDIRECT UPTO 4 STEPS YIELD path AS p;'
             )
-        print(
-            f"[DEBUG] query for RelationshipAction :\n\t{ query }"
-            )
+        logger.debug("query for RelationshipAction: %s", query)
         with connection_pool.session_context("root", "nebula") as session:
-            result = session.execute(query)
+            result = metrics.execute(session, query)
 
         if not result.is_succeeded():
             return (
@@ -152,15 +140,13 @@ class RelationshipAction(SiwiActionBase):
                 f"There is no relationship between "
                 f"{ self.entity_left } and { self.entity_right }"
                 )
-        path = result.row_values(0)[0].as_path()
-        relationships = path.relationships()
-        relations_str = self._name(
-            relationships[0].start_vertex_id().as_string())
-        for rel_index in range(path.length()):
-            rel = relationships[rel_index]
+        # 每条路径解码为 [(src, dst, 边类型, 属性)]
+        relationships = decode_paths(column(result, 0)[:1])[0]
+        relations_str = self._name(relationships[0][0])
+        for _, end_vid, edge_name, _ in relationships:
             relations_str += (
-                f" { rel.edge_name() }s "
-                f"{ self._name(rel.end_vertex_id().as_string()) }")
+                f" { edge_name }s "
+                f"{ self._name(end_vid) }")
         return (
             f"There are at least { result.row_size() } relations between "
             f"{ self.entity_left } and { self.entity_right }, "
@@ -176,17 +162,15 @@ class ServeAction(SiwiActionBase):
          RETURN p LIMIT 100
     """
     def __init__(self, intent):
-        print(f"[DEBUG] ServeAction intent: { intent }")
+        logger.debug("ServeAction intent: %s", intent)
         super().__init__(intent)
         try:
             self.player0 = list(intent["entities"].keys())[0]
             self.player0_vid = self._vid(self.player0)
         except Exception:
-            print(
-                f"[WARN] ServeAction entities recognition Failure "
-                f"will fallback to FallbackAction, "
-                f"intent: { intent }"
-                )
+            logger.warning(
+                "ServeAction entities recognition Failure "
+                "will fallback to FallbackAction, intent: %s", intent)
             self.error = True
 
     def execute(self, connection_pool) -> str:
@@ -197,11 +181,9 @@ class ServeAction(SiwiActionBase):
             f'WHERE id(v) == "{ self.player0_vid }" '
             f'    RETURN p LIMIT 100;'
             )
-        print(
-            f"[DEBUG] query for RelationshipAction :\n\t{ query }"
-            )
+        logger.debug("query for ServeAction: %s", query)
         with connection_pool.session_context("root", "nebula") as session:
-            result = session.execute(query)
+            result = metrics.execute(session, query)
 
         if not result.is_succeeded():
             return (
@@ -215,12 +197,12 @@ class ServeAction(SiwiActionBase):
                 f"{ self.player0 }"
                 )
         serving_teams_str = ""
-        for index in range(result.row_size()):
-            rel = result.row_values(index)[0].as_path().relationships()[0]
+        for relationships in decode_paths(column(result, 0)):
+            _, end_vid, _, props = relationships[0]
             serving_teams_str += (
-                f"{ self._name(rel.end_vertex_id().as_string()) } "
-                f"from { rel.properties()['start_year'] } "
-                f"to { rel.properties()['start_year'] }; "
+                f"{ self._name(end_vid) } "
+                f"from { props['start_year'] } "
+                f"to { props['start_year'] }; "
                 )
         return (
             f"{ self.player0 } had served { result.row_size() } team"
@@ -237,17 +219,15 @@ class FollowAction(SiwiActionBase):
          RETURN p LIMIT 100
     """
     def __init__(self, intent):
-        print(f"[DEBUG] FollowAction intent: { intent }")
+        logger.debug("FollowAction intent: %s", intent)
         super().__init__(intent)
         try:
             self.player0 = list(intent["entities"].keys())[0]
             self.player0_vid = self._vid(self.player0)
         except Exception:
-            print(
-                f"[WARN] ServeAction entities recognition Failure "
-                f"will fallback to FallbackAction, "
-                f"intent: { intent }"
-                )
+            logger.warning(
+                "FollowAction entities recognition Failure "
+                "will fallback to FallbackAction, intent: %s", intent)
             self.error = True
 
     def execute(self, connection_pool) -> str:
@@ -258,11 +238,9 @@ class FollowAction(SiwiActionBase):
             f'WHERE id(v) == "{ self.player0_vid }" '
             f'    RETURN p LIMIT 100;'
             )
-        print(
-            f"[DEBUG] query for RelationshipAction :\n\t{ query }"
-            )
+        logger.debug("query for FollowAction: %s", query)
         with connection_pool.session_context("root", "nebula") as session:
-            result = session.execute(query)
+            result = metrics.execute(session, query)
 
         if not result.is_succeeded():
             return (
@@ -276,11 +254,11 @@ class FollowAction(SiwiActionBase):
                 f"{ self.player0 }"
                 )
         following_players_str = ""
-        for index in range(result.row_size()):
-            rel = result.row_values(index)[0].as_path().relationships()[0]
+        for relationships in decode_paths(column(result, 0)):
+            _, end_vid, _, props = relationships[0]
             following_players_str += (
-                f"{ self._name(rel.end_vertex_id().as_string()) } "
-                f"in degree { rel.properties()['degree'] }; "
+                f"{ self._name(end_vid) } "
+                f"in degree { props['degree'] }; "
                 )
         return (
             f"{ self.player0 } had followed { result.row_size() } player"
@@ -1,14 +1,90 @@
+import contextvars
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
 from siwi.bot.actions import SiwiActions
 from siwi.bot.classifier import SiwiClassifier
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
 
 
 class SiwiBot():
-    def __init__(self, connection_pool) -> None:
+    def __init__(self, connection_pool, max_workers: int = None) -> None:
         self.classifier = SiwiClassifier()
         self.actions = SiwiActions()
         self.connection_pool = connection_pool
+        # bounded pool for the graph queries of query_batch, it should not
+        # exceed the connection pool size or workers will wait on sessions
+        self.max_workers = max_workers or int(
+            os.environ.get('SIWI_BATCH_MAX_WORKERS', 8))
+        self._executor = None
 
     def query(self, sentence):
         intent = self.classifier.get(sentence)
         action = self.actions.get(intent)
         return action.execute(self.connection_pool)
+
+    def query_batch(self, sentences: list) -> list:
+        """
+        Answer a batch of sentences.
+        All sentences are classified in one pass, sentences with the same
+        (intent, entities) share one action, and the distinct actions are
+        executed concurrently on a bounded thread pool.
+
+        returns answers in the order of sentences.
+        """
+        intents = self.classifier.get_batch(sentences)
+
+        # group positions of sentences by (intents, entities)
+        groups = {}
+        for position, intent in enumerate(intents):
+            key = (
+                tuple(intent["intents"]),
+                tuple(intent["entities"].items())
+                )
+            groups.setdefault(key, []).append(position)
+
+        answers = [None] * len(sentences)
+        if not groups:
+            return answers
+
+        if len(groups) == 1:
+            # nothing to parallelize, skip the thread hop
+            positions = next(iter(groups.values()))
+            answer = self._execute(intents[positions[0]])
+            for position in positions:
+                answers[position] = answer
+            return answers
+
+        executor = self._get_executor()
+        # 在调用方的上下文中执行，round trip会计入调用方的metrics.track
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                self._execute, intents[positions[0]]): positions
+            for positions in groups.values()
+            }
+        for future, positions in futures.items():
+            answer = future.result()
+            for position in positions:
+                answers[position] = answer
+        return answers
+
+    def _execute(self, intent: dict) -> str:
+        try:
+            action = self.actions.get(intent)
+            return action.execute(self.connection_pool)
+        except Exception:
+            logger.exception("query_batch failed on intent: %s", intent)
+            return "Opps, something went wrong."
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # created lazily, so that a bot built before fork does not carry
+        # threads into the worker processes
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="siwi-bot")
+        return self._executor
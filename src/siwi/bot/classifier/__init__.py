@@ -1,46 +1,24 @@
 import ahocorasick
-import siwi
-import yaml
+import bisect
+
+from siwi.bot.snapshot import get_snapshot
 
 
 class SiwiClassifier():
-    def __init__(self) -> None:
-        self.players = {}
-        self.teams = {}
-        self.entity_type_map = {}
+    def __init__(self, snapshot=None) -> None:
+        self.snapshot = snapshot or get_snapshot()
         self.intents_map = {}
         self.setup_data()
 
     def setup_data(self) -> None:
-        self.load_entity_data()
+        self.intents = self.snapshot.intents
         self.setup_entity_tree()
         self.setup_intents_map()
 
-    def load_entity_data(self) -> None:
-        # load data from yaml files
-        module_path = f"{ siwi.__path__[0] }/bot/test/data"
-
-        with open(f"{ module_path }/example_players.yaml", "r") as file:
-            self.players = yaml.safe_load(file)
-
-        with open(f"{ module_path }/example_teams.yaml", "r") as file:
-            self.teams = yaml.safe_load(file)
-
-        with open(f"{ module_path }/example_intents.yaml", "r") as file:
-            self.intents = yaml.safe_load(file)["intents"]
-
     def setup_entity_tree(self) -> None:
-        self.entity_type_map.update({
-            key: "player" for key in self.players.keys()
-            })
-        self.entity_type_map.update({
-            key: "team" for key in self.teams.keys()
-            })
-
-        self.entity_tree = ahocorasick.Automaton()
-        for index, entity in enumerate(self.entity_type_map.keys()):
-            self.entity_tree.add_word(entity, (index, entity))
-        self.entity_tree.make_automaton()
+        # prebuilt with the snapshot, the automaton maps every entity name
+        # to its index in the snapshot tables
+        self.entity_tree = self.snapshot.entity_automaton()
 
     def setup_intents_map(self) -> None:
         for name, intent in self.intents.items():
@@ -48,6 +26,19 @@ class SiwiClassifier():
                 keyword: name for keyword in intent['keywords']
                 })
 
+        # keyword automaton, used to match intents of a batch in one pass
+        self.intent_tree = ahocorasick.Automaton()
+        for keyword in self.intents_map.keys():
+            self.intent_tree.add_word(keyword, keyword)
+        self.intent_tree.make_automaton()
+
+    def _entities(self, indexes: list) -> dict:
+        """{entity: entity_type} of matched snapshot indexes"""
+        return {
+            self.snapshot.names[index]: self.snapshot.entity_type(index)
+            for index in indexes
+            }
+
     def get_matched_entities(self, sentence: str) -> dict:
         """
         Consume a sentence to be matched with ahocorasick
@@ -55,10 +46,8 @@ class SiwiClassifier():
         """
         entities_matched = []
         for item in self.entity_tree.iter(sentence):
-            entities_matched.append(item[1][1])
-        return {
-            entity: self.entity_type_map[entity] for entity in entities_matched
-            }
+            entities_matched.append(item[1])
+        return self._entities(entities_matched)
 
     def get_matched_intents(self, sentence: str) -> tuple:
         intents_matched = set()
@@ -96,3 +85,39 @@ class SiwiClassifier():
             "entities": entities,
             "intents": intents
         }
+
+    def get_batch(self, sentences: list) -> list:
+        """
+        Classify a batch of sentences in one pass.
+        Sentences are joined into one text, entities and intent keywords
+        are matched over it with the automatons once, and each match is
+        routed back to its sentence by offset.
+
+        returns a list of intents in the order of sentences, each of them
+        is the same as what get() returns.
+        """
+        separator = "\n"
+        starts = []
+        offset = 0
+        for sentence in sentences:
+            starts.append(offset)
+            offset += len(sentence) + len(separator)
+        text = separator.join(sentences)
+
+        entities_matched = [[] for _ in sentences]
+        for end_index, index in self.entity_tree.iter(text):
+            position = bisect.bisect_right(starts, end_index) - 1
+            entities_matched[position].append(index)
+
+        intents_matched = [set() for _ in sentences]
+        for end_index, keyword in self.intent_tree.iter(text):
+            position = bisect.bisect_right(starts, end_index) - 1
+            intents_matched[position].add(self.intents_map[keyword])
+
+        return [
+            {
+                "entities": self._entities(entities_matched[position]),
+                "intents": tuple(intents_matched[position])
+            }
+            for position in range(len(sentences))
+            ]
@@ -0,0 +1,388 @@
+"""
+Compiled classifier data.
+
+compile_snapshot() parses the entity dictionaries (name -> VID of every
+player and team) and the intent table from the YAML sources once, and writes
+them to a versioned binary file without pickle. Processes map that file with
+mmap, names and VIDs are decoded from the mapping on demand, and gunicorn
+workers share its pages, so starting a bot no longer parses any YAML.
+
+The entity Aho-Corasick automaton is built at compile time as well and saved
+next to the snapshot (<path>.<digest>.ac, pyahocorasick's own binary format
+storing the entity indexes, no pickle). pyahocorasick can only load it from a
+path into process memory, so unlike the tables its pages are not shared
+between workers; loading it is still several times faster than adding every
+name again. Without that file (an in-memory snapshot, or one copied without
+it) the classifier rebuilds the automaton from the names.
+
+Compile ahead of time (the Docker image does this at build time):
+
+    python -m siwi.bot.snapshot [path]
+
+The file records a digest of its sources. get_snapshot() recompiles it when
+it is missing, written by another format version or older than the sources;
+SIWI_CLASSIFIER_SNAPSHOT_CHECK=0 skips the digest for large prebuilt
+dictionaries.
+
+Layout (little-endian, every section 8-byte aligned):
+
+    header    magic, format version (u32), section count (u32),
+              blake2b digest of the sources (32 bytes)
+    sections  (offset u64, length u64) for each of _SECTIONS, then the data;
+              a string table is a count (u64), count + 1 offsets (u64) and one
+              UTF-8 blob, an array is a count (u64) and u32 values
+"""
+
+import glob
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+import ahocorasick
+import numpy as np
+
+import siwi
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+DATA_DIR = os.path.join(siwi.__path__[0], "bot", "test", "data")
+# (entity type, YAML file mapping names to VIDs), later types win on duplicate names
+ENTITY_SOURCES = (
+    ("player", "example_players.yaml"),
+    ("team", "example_teams.yaml"),
+)
+INTENT_SOURCE = "example_intents.yaml"
+
+MAGIC = b"SIWICLS\0"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sII32s")
+_SECTION = struct.Struct("<QQ")
+_COUNT = struct.Struct("<Q")
+_SECTIONS = (
+    "names", "vids", "types", "type_names", "name_order", "vid_order",
+    "intent_names", "intent_actions", "keywords", "keyword_intents",
+)
+
+
+class StaleSnapshot(ValueError):
+    """The snapshot is missing, malformed, or does not match its sources."""
+
+
+class StringTable():
+    """Read-only sequence of the strings of a string table section."""
+    def __init__(self, buffer, offset: int) -> None:
+        count, = _COUNT.unpack_from(buffer, offset)
+        self._offsets = np.frombuffer(
+            buffer, dtype="<u8", count=count + 1, offset=offset + _COUNT.size)
+        self._base = offset + _COUNT.size + self._offsets.nbytes
+        self._view = memoryview(buffer)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start = self._base + int(self._offsets[index])
+        end = self._base + int(self._offsets[index + 1])
+        return str(self._view[start:end], "utf-8")
+
+
+def _read_array(buffer, offset: int) -> np.ndarray:
+    count, = _COUNT.unpack_from(buffer, offset)
+    return np.frombuffer(buffer, dtype="<u4", count=count, offset=offset + _COUNT.size)
+
+
+def _search(table: StringTable, order: np.ndarray, key: str):
+    """binary search of key in table sorted by order, returns its index or None"""
+    low, high = 0, len(order)
+    while low < high:
+        middle = (low + high) // 2
+        if table[int(order[middle])] < key:
+            low = middle + 1
+        else:
+            high = middle
+    if low < len(order) and table[int(order[low])] == key:
+        return int(order[low])
+    return None
+
+
+class ClassifierSnapshot():
+    """
+    Entity and intent tables of a compiled snapshot.
+
+    Entity i is names[i] of type entity_type(i) with VID vids[i]. intents
+    maps an intent name to {"action": ..., "keywords": [...]}, the same as
+    the YAML source.
+    """
+    def __init__(self, buffer, path: str = None) -> None:
+        self.path = path
+        try:
+            magic, version, count, self.digest = _HEADER.unpack_from(buffer, 0)
+            if magic != MAGIC:
+                raise StaleSnapshot(f"{path} is not a classifier snapshot")
+            if version != FORMAT_VERSION or count != len(_SECTIONS):
+                raise StaleSnapshot(
+                    f"{path} has format version {version}, "
+                    f"expected {FORMAT_VERSION}")
+            offsets = {}
+            for index, name in enumerate(_SECTIONS):
+                offset, length = _SECTION.unpack_from(
+                    buffer, _HEADER.size + index * _SECTION.size)
+                if offset + length > len(buffer):
+                    raise StaleSnapshot(f"{path} is truncated")
+                offsets[name] = offset
+        except struct.error as e:
+            raise StaleSnapshot(f"{path} is truncated") from e
+        # keep the mapping alive as long as the tables reference it
+        self._buffer = buffer
+
+        self.names = StringTable(buffer, offsets["names"])
+        self.vids = StringTable(buffer, offsets["vids"])
+        self.type_names = list(StringTable(buffer, offsets["type_names"]))
+        self._types = _read_array(buffer, offsets["types"])
+        self._name_order = _read_array(buffer, offsets["name_order"])
+        self._vid_order = _read_array(buffer, offsets["vid_order"])
+
+        intent_names = StringTable(buffer, offsets["intent_names"])
+        intent_actions = StringTable(buffer, offsets["intent_actions"])
+        self.intents = {
+            name: {"action": action, "keywords": []}
+            for name, action in zip(intent_names, intent_actions)
+            }
+        keywords = StringTable(buffer, offsets["keywords"])
+        keyword_intents = _read_array(buffer, offsets["keyword_intents"])
+        for keyword, index in zip(keywords, keyword_intents):
+            self.intents[intent_names[int(index)]]["keywords"].append(keyword)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def entity_type(self, index: int) -> str:
+        return self.type_names[self._types[index]]
+
+    def find_name(self, name: str):
+        """index of the entity with this name, None if unknown"""
+        return _search(self.names, self._name_order, name)
+
+    def find_vid(self, vid: str):
+        """index of the entity with this VID, None if unknown"""
+        return _search(self.vids, self._vid_order, vid)
+
+    def entity_automaton(self) -> ahocorasick.Automaton:
+        """
+        Automaton mapping every entity name to its index.
+        Loaded from the file saved by compile_snapshot(), rebuilt from the
+        names when there is no usable file.
+        """
+        if self.path is not None:
+            path = automaton_path(self.path, self.digest)
+            try:
+                automaton = ahocorasick.load(path, bytes)
+                if len(automaton) == len(self):
+                    return automaton
+                logger.warning("Entity automaton %s does not match its snapshot", path)
+            except (OSError, ValueError) as e:
+                logger.info("Rebuilding entity automaton, cannot load %s: %s", path, e)
+        return build_entity_automaton(self.names)
+
+
+def build_entity_automaton(names) -> ahocorasick.Automaton:
+    automaton = ahocorasick.Automaton(ahocorasick.STORE_INTS)
+    for index, name in enumerate(names):
+        automaton.add_word(name, index)
+    automaton.make_automaton()
+    return automaton
+
+
+def automaton_path(path: str, digest: bytes) -> str:
+    """the entity automaton saved with the snapshot at path"""
+    return f"{path}.{digest.hex()[:16]}.ac"
+
+
+def _write_atomic(path: str, write) -> None:
+    """call write(tmp_path) and move the result to path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".classifier-")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def source_paths(data_dir: str = None) -> list:
+    data_dir = data_dir or DATA_DIR
+    return [
+        os.path.join(data_dir, filename)
+        for filename in [f for _, f in ENTITY_SOURCES] + [INTENT_SOURCE]
+        ]
+
+
+def source_digest(paths: list) -> bytes:
+    digest = hashlib.blake2b(digest_size=32)
+    for path in paths:
+        with open(path, "rb") as file:
+            digest.update(os.path.basename(path).encode("utf-8"))
+            digest.update(_COUNT.pack(os.fstat(file.fileno()).st_size))
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.digest()
+
+
+def _string_table(strings: list) -> bytes:
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum(
+        np.fromiter((len(data) for data in encoded), dtype="<u8", count=len(encoded)))
+    return _COUNT.pack(len(encoded)) + offsets.tobytes() + b"".join(encoded)
+
+
+def _array(values: list) -> bytes:
+    values = np.asarray(values, dtype="<u4")
+    return _COUNT.pack(len(values)) + values.tobytes()
+
+
+def compile_snapshot(path: str = None, data_dir: str = None) -> bytes:
+    """
+    Parse the YAML sources into the snapshot format.
+    The snapshot is written to path atomically when given, together with
+    its entity automaton.
+
+    returns the content of the snapshot.
+    """
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+    data_dir = data_dir or DATA_DIR
+    # digest first: sources changed while compiling make the result stale
+    digest = source_digest(source_paths(data_dir))
+
+    entities = {}
+    for type_index, (_, filename) in enumerate(ENTITY_SOURCES):
+        with open(os.path.join(data_dir, filename), "r") as file:
+            for name, vid in (yaml.load(file, Loader=loader) or {}).items():
+                entities[str(name)] = (type_index, str(vid))
+    with open(os.path.join(data_dir, INTENT_SOURCE), "r") as file:
+        intents = yaml.load(file, Loader=loader)["intents"]
+
+    names = list(entities.keys())
+    vids = [vid for _, vid in entities.values()]
+    intent_names = list(intents.keys())
+    keywords = [
+        (keyword, index)
+        for index, name in enumerate(intent_names)
+        for keyword in intents[name].get("keywords") or []
+        ]
+    sections = {
+        "names": _string_table(names),
+        "vids": _string_table(vids),
+        "types": _array([type_index for type_index, _ in entities.values()]),
+        "type_names": _string_table([entity_type for entity_type, _ in ENTITY_SOURCES]),
+        "name_order": _array(sorted(range(len(names)), key=names.__getitem__)),
+        "vid_order": _array(sorted(range(len(vids)), key=vids.__getitem__)),
+        "intent_names": _string_table(intent_names),
+        "intent_actions": _string_table(
+            [intents[name]["action"] for name in intent_names]),
+        "keywords": _string_table([keyword for keyword, _ in keywords]),
+        "keyword_intents": _array([index for _, index in keywords]),
+    }
+
+    offset = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    table, body = [], []
+    for name in _SECTIONS:
+        data = sections[name]
+        padding = -len(data) % 8
+        table.append(_SECTION.pack(offset, len(data)))
+        body.append(data + b"\0" * padding)
+        offset += len(data) + padding
+    content = b"".join(
+        [_HEADER.pack(MAGIC, FORMAT_VERSION, len(_SECTIONS), digest)] + table + body)
+
+    if path:
+        def write_content(tmp_path):
+            with open(tmp_path, "wb") as file:
+                file.write(content)
+
+        # the automaton goes first, a snapshot is never visible without it
+        current = automaton_path(path, digest)
+        _write_atomic(current, build_entity_automaton(names).save)
+        _write_atomic(path, write_content)
+        for previous in glob.glob(glob.escape(path) + ".*.ac"):
+            if previous != current:
+                try:
+                    os.unlink(previous)
+                except OSError:
+                    pass
+    return content
+
+
+def load_snapshot(path: str, check: bool = True, data_dir: str = None) -> ClassifierSnapshot:
+    """
+    Map a compiled snapshot read-only.
+    Raises StaleSnapshot when it cannot be used, or when check is set and
+    the sources changed since it was compiled.
+    """
+    try:
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        # ValueError: an empty file cannot be mapped
+        raise StaleSnapshot(f"cannot map {path}: {e}") from e
+    snapshot = ClassifierSnapshot(buffer, path)
+    if check and snapshot.digest != source_digest(source_paths(data_dir)):
+        raise StaleSnapshot(f"{path} is older than its sources")
+    return snapshot
+
+
+def snapshot_path() -> str:
+    return os.environ.get(
+        "SIWI_CLASSIFIER_SNAPSHOT", os.path.join(DATA_DIR, "classifier.snapshot"))
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_snapshot() -> ClassifierSnapshot:
+    """
+    The snapshot shared by the classifier and the actions of this process.
+    A missing or stale snapshot is recompiled and written back, or kept in
+    memory when its path is not writable.
+    """
+    global _snapshot
+    with _lock:
+        if _snapshot is None:
+            path = snapshot_path()
+            check = os.environ.get("SIWI_CLASSIFIER_SNAPSHOT_CHECK", "1") != "0"
+            try:
+                _snapshot = load_snapshot(path, check)
+            except StaleSnapshot as e:
+                logger.info("Compiling classifier snapshot: %s", e)
+                try:
+                    compile_snapshot(path)
+                    _snapshot = load_snapshot(path, check=False)
+                except OSError as e:
+                    logger.warning("Cannot write classifier snapshot %s: %s", path, e)
+                    _snapshot = ClassifierSnapshot(compile_snapshot())
+        return _snapshot
+
+
+def reset_snapshot() -> None:
+    """drop the snapshot of this process, the next get_snapshot() reloads it"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else snapshot_path()
+    compile_snapshot(target)
+    logger.info("Classifier snapshot written to %s", target)
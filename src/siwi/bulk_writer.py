@@ -0,0 +1,494 @@
+"""
+批量写回NebulaGraph
+
+把大量顶点属性（例如重新计算的embedding）或边（例如预测的链接、kNN图）
+切分成多行批次，在连接池上并发执行，每个批次一次往返。BulkWriter同步写入
+并返回逐批次的失败信息，WriteBehindBuffer在后台按大小或时间刷新，调用方
+无需等待写入完成。
+
+两种写入模式:
+    upsert  每行一条 UPSERT VERTEX ON <tag> <vid> SET ...，多条语句用分号
+            拼成一个请求；只修改给出的属性，顶点的其他属性保持不变
+    insert  一条 INSERT VERTEX <tag>(...) VALUES <vid>:(...), ... 多行语句；
+            写入速度最快，但会覆盖该标签下未给出的属性
+
+边统一使用多行 INSERT EDGE [IF NOT EXISTS] <type>(...) VALUES <src>-><dst>@<rank>:(...)。
+"""
+
+import atexit
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from siwi import metrics
+from siwi.connection import get_connection_pool
+from siwi.disk_cache import DISK_CACHE
+from siwi.log import get_logger
+from siwi.miss_cache import record_written
+from siwi.neighborhood_index import NEIGHBORHOOD_INDEX
+from siwi.ngql import format_literal, format_vid
+from siwi.shm_cache import SHM_CACHE
+from siwi.vertex_cache import VERTEX_CACHE
+
+logger = get_logger(__name__)
+
+WRITE_MODES = ("upsert", "insert")
+
+BULK_WRITE_ROWS = metrics.counter(
+    "siwi_bulk_write_rows_total",
+    "Rows written by the bulk writer by status",
+    ("status",))
+BULK_WRITE_BATCHES = metrics.counter(
+    "siwi_bulk_write_batches_total",
+    "Batches executed by the bulk writer by status",
+    ("status",))
+
+
+class BatchFailure:
+    """一个失败的批次
+
+    Attributes:
+        batch: 批次序号（从0开始）
+        keys: 该批次包含的行标识（顶点为VID）
+        error: 错误信息
+    """
+
+    def __init__(self, batch: int, keys: list, error: str):
+        self.batch = batch
+        self.keys = keys
+        self.error = error
+
+    def __repr__(self):
+        return f"BatchFailure(batch={self.batch}, rows={len(self.keys)}, error={self.error!r})"
+
+
+class BulkWriteResult:
+    """一次批量写入的结果"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.written_rows = 0
+        self.batches = 0
+        self.failures: List[BatchFailure] = []
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+    @property
+    def failed_keys(self) -> list:
+        return [key for failure in self.failures for key in failure.keys]
+
+    def merge(self, other: "BulkWriteResult") -> None:
+        """合并另一次写入的结果，批次序号顺延"""
+        for failure in other.failures:
+            self.failures.append(BatchFailure(
+                failure.batch + self.batches, failure.keys, failure.error))
+        self.total_rows += other.total_rows
+        self.written_rows += other.written_rows
+        self.batches += other.batches
+        self.elapsed += other.elapsed
+
+    def __repr__(self):
+        return (f"BulkWriteResult(rows={self.written_rows}/{self.total_rows}, "
+                f"batches={self.batches}, failures={len(self.failures)}, "
+                f"elapsed={self.elapsed:.3f}s)")
+
+
+def vertex_upsert_statement(tag: str, props: Sequence[str],
+                            vids: Sequence, rows: Sequence[Sequence]) -> str:
+    """生成多条UPSERT VERTEX语句，用分号拼接为一个请求"""
+    statements = []
+    for vid, row in zip(vids, rows):
+        assignments = ", ".join(
+            f"{prop} = {format_literal(value)}" for prop, value in zip(props, row))
+        statements.append(f"UPSERT VERTEX ON {tag} {format_vid(vid)} SET {assignments}")
+    return "; ".join(statements)
+
+
+def vertex_insert_statement(tag: str, props: Sequence[str],
+                            vids: Sequence, rows: Sequence[Sequence],
+                            if_not_exists: bool = False) -> str:
+    """生成一条多行INSERT VERTEX语句"""
+    values = ", ".join(
+        f"{format_vid(vid)}:({', '.join(format_literal(value) for value in row)})"
+        for vid, row in zip(vids, rows))
+    clause = "IF NOT EXISTS " if if_not_exists else ""
+    return f"INSERT VERTEX {clause}{tag}({', '.join(props)}) VALUES {values}"
+
+
+def edge_insert_statement(edge_type: str, props: Sequence[str],
+                          edges: Sequence[Tuple], rows: Optional[Sequence[Sequence]] = None,
+                          if_not_exists: bool = True) -> str:
+    """生成一条多行INSERT EDGE语句
+
+    Args:
+        edge_type: 边类型
+        props: 属性名称列表，可以为空
+        edges: (src_vid, dst_vid, rank) 列表
+        rows: 与edges一一对应的属性值列表，props为空时可省略
+        if_not_exists: 为True时跳过已存在的边（相同的src、dst和rank）
+    """
+    values = []
+    for i, (src, dst, rank) in enumerate(edges):
+        row = rows[i] if rows is not None else ()
+        values.append(
+            f"{format_vid(src)}->{format_vid(dst)}@{int(rank)}:"
+            f"({', '.join(format_literal(value) for value in row)})")
+    clause = "IF NOT EXISTS " if if_not_exists else ""
+    return f"INSERT EDGE {clause}{edge_type}({', '.join(props)}) VALUES {', '.join(values)}"
+
+
+def unique_edges(src: np.ndarray, dst: np.ndarray, rank: np.ndarray) -> np.ndarray:
+    """返回去重后每条边首次出现的位置，按 (src, dst, rank) 排序
+
+    排序后同一起点的边相邻，写入时落在同一个分区上。
+    """
+    if len(src) == 0:
+        return np.zeros(0, dtype=np.int64)
+    keys = np.stack([src, dst, rank], axis=1)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    return first
+
+
+def _to_list(values) -> list:
+    # NumPy数组和张量转换为Python标量，保证字面量格式化正确
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+class BulkWriter:
+    """在连接池上并发执行批量写入
+
+    每个工作线程持有自己的会话，会话上只执行一次USE；同时在途的批次数
+    不超过max_workers的两倍，批次由生成器按需产生，写入上千万行时内存
+    占用保持平稳。
+
+    Args:
+        connection_pool: 连接池，默认使用当前进程的连接池
+        space_name: 图空间名称
+        batch_size: 每个批次的行数，默认读取SIWI_WRITE_BATCH_SIZE（256）
+        max_workers: 并发批次数，应不超过连接池大小，默认读取SIWI_WRITE_WORKERS（4）
+    """
+
+    def __init__(self, connection_pool=None,
+                 space_name: str = "basketballplayer",
+                 batch_size: Optional[int] = None,
+                 max_workers: Optional[int] = None,
+                 user: str = "root", password: str = "nebula"):
+        self.connection_pool = connection_pool or get_connection_pool()
+        self.space_name = space_name
+        self.batch_size = batch_size or int(os.environ.get('SIWI_WRITE_BATCH_SIZE', 256))
+        self.max_workers = max_workers or int(os.environ.get('SIWI_WRITE_WORKERS', 4))
+        self.user = user
+        self.password = password
+
+    def write_vertices(self, tag: str, props: Sequence[str],
+                       vids: Sequence, rows: Sequence[Sequence],
+                       mode: str = "upsert") -> BulkWriteResult:
+        """批量写入顶点属性
+
+        Args:
+            tag: 标签名称
+            props: 属性名称列表
+            vids: 顶点ID列表
+            rows: 与vids一一对应的属性值列表，每行的顺序与props一致
+            mode: "upsert"或"insert"
+
+        Returns:
+            BulkWriteResult，failures中的keys为失败批次的VID
+        """
+        if mode not in WRITE_MODES:
+            raise ValueError(f"不支持的写入模式: {mode}，可选 {WRITE_MODES}")
+        if len(vids) != len(rows):
+            raise ValueError(f"vids与rows长度不一致: {len(vids)} != {len(rows)}")
+        props = list(props)
+
+        def batches():
+            for start in range(0, len(vids), self.batch_size):
+                batch_vids = list(vids[start:start + self.batch_size])
+                batch_rows = rows[start:start + self.batch_size]
+                if mode == "upsert":
+                    stmt = vertex_upsert_statement(tag, props, batch_vids, batch_rows)
+                else:
+                    stmt = vertex_insert_statement(tag, props, batch_vids, batch_rows)
+                yield stmt, batch_vids
+
+        result = self.execute_batches(batches())
+        # 写入成功的顶点不再按未命中处理
+        failed = set(result.failed_keys)
+        record_written(self.space_name, tag,
+                       [vid for vid in vids if vid not in failed] if failed else vids)
+        # 失败的批次可能已经执行了其中一部分UPSERT语句，缓存中的旧属性全部失效；
+        # 物化邻域最后失效，它的后台刷新不会再读到其他缓存中的旧属性
+        VERTEX_CACHE.invalidate(self.space_name, vids)
+        SHM_CACHE.invalidate(self.space_name, tag, vids, props)
+        DISK_CACHE.invalidate_vertices(self.space_name, tag, vids)
+        NEIGHBORHOOD_INDEX.invalidate(self.space_name, vids)
+        return result
+
+    def write_edges(self, edge_type: str, src: Sequence, dst: Sequence,
+                    rank: Optional[Sequence[int]] = None,
+                    props: Sequence[str] = (),
+                    columns: Sequence[Sequence] = (),
+                    vid_mapper: Optional[Callable] = None,
+                    if_not_exists: bool = True) -> BulkWriteResult:
+        """批量写入边
+
+        输入按列给出（列表或NumPy数组均可），VID映射和属性行在生成每个批次时
+        才构造，写入上千万条边时不需要预先生成全部VID和属性行。
+
+        Args:
+            edge_type: 边类型
+            src: 起点列（VID，或配合vid_mapper使用的整数索引）
+            dst: 终点列
+            rank: rank列，默认为0
+            props: 属性名称列表
+            columns: 与props一一对应的属性值列，长度与边数相同
+            vid_mapper: 把src/dst中的元素转换为VID的函数
+            if_not_exists: 为True时跳过已存在的边
+
+        Returns:
+            BulkWriteResult，failures中的keys为失败批次的 (src, dst, rank)
+        """
+        if len(src) != len(dst):
+            raise ValueError(f"src与dst长度不一致: {len(src)} != {len(dst)}")
+        props = list(props)
+        if len(columns) != len(props):
+            raise ValueError(f"props与columns数量不一致: {len(props)} != {len(columns)}")
+        for prop, column in zip(props, columns):
+            if len(column) != len(src):
+                raise ValueError(f"属性{prop}的长度与边数不一致: {len(column)} != {len(src)}")
+
+        def batches():
+            for start in range(0, len(src), self.batch_size):
+                end = start + self.batch_size
+                batch_src = _to_list(src[start:end])
+                batch_dst = _to_list(dst[start:end])
+                if vid_mapper is not None:
+                    batch_src = [vid_mapper(item) for item in batch_src]
+                    batch_dst = [vid_mapper(item) for item in batch_dst]
+                if rank is None:
+                    batch_rank = [0] * len(batch_src)
+                else:
+                    batch_rank = _to_list(rank[start:end])
+                edges = list(zip(batch_src, batch_dst, batch_rank))
+                rows = None
+                if props:
+                    rows = list(zip(*(_to_list(column[start:end]) for column in columns)))
+                yield edge_insert_statement(
+                    edge_type, props, edges, rows, if_not_exists), edges
+
+        def invalidate(edges: list) -> None:
+            # 批次执行之后才失效（失败的批次也可能已部分写入）。磁盘缓存中的子图
+            # 按图空间整体失效，之后才失效两端顶点的一跳邻接和物化邻域，
+            # 邻域的后台刷新不会采样到旧图或读到磁盘缓存中的旧子图
+            DISK_CACHE.bump_generation(self.space_name)
+            endpoints = [src for src, _, _ in edges] + [dst for _, dst, _ in edges]
+            VERTEX_CACHE.invalidate_adjacency(self.space_name, endpoints)
+            NEIGHBORHOOD_INDEX.invalidate(self.space_name, endpoints)
+
+        return self.execute_batches(batches(), on_batch_done=invalidate)
+
+    def execute_batches(self, batches: Iterable[Tuple[str, list]],
+                        on_batch_done: Optional[Callable[[list], None]] = None) -> BulkWriteResult:
+        """并发执行 (语句, 行标识列表) 形式的批次
+
+        单个批次失败不会中断其他批次，失败信息记录在结果的failures中。
+        on_batch_done在每个批次执行完成（无论成败）后以该批次的行标识调用。
+        """
+        result = BulkWriteResult()
+        start = time.perf_counter()
+        local = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+
+        def run(batch_no: int, stmt: str, keys: list):
+            session = getattr(local, "session", None)
+            try:
+                if session is None:
+                    session = self.connection_pool.get_session(self.user, self.password)
+                    with sessions_lock:
+                        sessions.append(session)
+                    local.session = session
+                    resp = metrics.execute(session, f"USE {self.space_name}")
+                    if not resp.is_succeeded():
+                        local.session = None
+                        return BatchFailure(batch_no, keys, resp.error_msg())
+                resp = metrics.execute(session, stmt)
+                if not resp.is_succeeded():
+                    return BatchFailure(batch_no, keys, resp.error_msg())
+            except Exception as e:
+                # 连接错误等异常：丢弃该线程的会话，下个批次重新获取
+                local.session = None
+                return BatchFailure(batch_no, keys, f"{type(e).__name__}: {e}")
+            return None
+
+        def collect(done) -> None:
+            for future in done:
+                batch_no, keys = pending.pop(future)
+                failure = future.result()
+                if failure is None:
+                    result.written_rows += len(keys)
+                    BULK_WRITE_BATCHES.inc(status="ok")
+                    BULK_WRITE_ROWS.inc(len(keys), status="ok")
+                else:
+                    logger.warning("批次%s写入失败（%s行）: %s",
+                                   batch_no, len(keys), failure.error)
+                    result.failures.append(failure)
+                    BULK_WRITE_BATCHES.inc(status="error")
+                    BULK_WRITE_ROWS.inc(len(keys), status="error")
+                if on_batch_done is not None:
+                    on_batch_done(keys)
+
+        pending = {}
+        with metrics.track("bulk_write"), ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="siwi-bulk-write") as executor:
+            for batch_no, (stmt, keys) in enumerate(batches):
+                if len(pending) >= self.max_workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                # 在工作线程中沿用当前上下文，往返次数计入调用方的track()
+                try:
+                    future = executor.submit(
+                        contextvars.copy_context().run, run, batch_no, stmt, keys)
+                except RuntimeError:
+                    # 解释器退出时（WriteBehindBuffer的atexit刷新）线程池不再接受任务，
+                    # 在当前线程中依次执行
+                    future = Future()
+                    future.set_result(run(batch_no, stmt, keys))
+                pending[future] = (batch_no, keys)
+                result.batches += 1
+                result.total_rows += len(keys)
+            collect(wait(pending).done)
+
+        for session in sessions:
+            try:
+                session.release()
+            except Exception:
+                logger.debug("释放会话失败", exc_info=True)
+        result.failures.sort(key=lambda failure: failure.batch)
+        result.elapsed = time.perf_counter() - start
+        logger.info("批量写入完成: %s", result)
+        return result
+
+
+class WriteBehindBuffer:
+    """写后缓冲：累积顶点属性更新，按行数或时间间隔在后台批量写入
+
+    同一 (tag, 属性列表, 模式) 下同一VID的多次写入只保留最后一次。
+    后台刷新的结果累积在results中，失败时记录日志；可以随时调用flush()同步写入剩余数据。
+    没有调用close()时，解释器退出前经atexit写入剩余数据。
+
+    Args:
+        writer: 执行写入的BulkWriter
+        flush_rows: 待写行数达到该值时触发刷新，默认为batch_size * max_workers
+        flush_interval: 最长刷新间隔（秒）
+        max_pending_rows: 待写行数的上限，超过时put会阻塞等待刷新，防止内存无限增长
+    """
+
+    def __init__(self, writer: BulkWriter,
+                 flush_rows: Optional[int] = None,
+                 flush_interval: float = 1.0,
+                 max_pending_rows: Optional[int] = None):
+        self.writer = writer
+        self.flush_rows = flush_rows or writer.batch_size * writer.max_workers
+        self.flush_interval = flush_interval
+        self.max_pending_rows = max_pending_rows or self.flush_rows * 8
+        self.results = BulkWriteResult()
+        # (tag, props, mode) -> {vid: row}
+        self._pending = {}
+        self._pending_rows = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="siwi-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self._close_at_exit)
+
+    def put(self, tag: str, props: Sequence[str], vids: Sequence,
+            rows: Sequence[Sequence], mode: str = "upsert") -> None:
+        """加入待写队列，立即返回"""
+        if mode not in WRITE_MODES:
+            raise ValueError(f"不支持的写入模式: {mode}，可选 {WRITE_MODES}")
+        key = (tag, tuple(props), mode)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("WriteBehindBuffer已关闭")
+            while self._pending_rows >= self.max_pending_rows:
+                self._condition.notify_all()
+                self._condition.wait()
+            pending = self._pending.setdefault(key, {})
+            before = len(pending)
+            for vid, row in zip(vids, rows):
+                pending[vid] = row
+            self._pending_rows += len(pending) - before
+            if self._pending_rows >= self.flush_rows:
+                self._condition.notify_all()
+
+    @property
+    def pending_rows(self) -> int:
+        return self._pending_rows
+
+    def flush(self) -> BulkWriteResult:
+        """同步写入当前所有待写数据，返回本次刷新的结果"""
+        with self._flush_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+                self._pending_rows = 0
+                self._condition.notify_all()
+            result = BulkWriteResult()
+            for (tag, props, mode), rows_by_vid in pending.items():
+                result.merge(self.writer.write_vertices(
+                    tag, props, list(rows_by_vid), list(rows_by_vid.values()), mode))
+            with self._condition:
+                self.results.merge(result)
+            return result
+
+    def close(self) -> BulkWriteResult:
+        """停止后台线程并写入剩余数据"""
+        atexit.unregister(self._close_at_exit)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        return self.flush()
+
+    def _close_at_exit(self) -> None:
+        pending = self._pending_rows
+        if pending:
+            logger.info("退出前写入写后缓冲中的%s行", pending)
+        result = self.close()
+        if not result.ok:
+            logger.error("退出前写入失败，%s行丢失: %s",
+                         len(result.failed_keys), result.failures[0].error)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while (not self._closed
+                       and self._pending_rows < self.flush_rows):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+                has_pending = self._pending_rows > 0
+            if has_pending:
+                try:
+                    result = self.flush()
+                except Exception:
+                    logger.exception("后台刷新失败")
+                    continue
+                if not result.ok:
+                    logger.warning("后台刷新有%s行写入失败: %s",
+                                   len(result.failed_keys), result.failures[0].error)
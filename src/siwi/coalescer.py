@@ -0,0 +1,167 @@
+"""
+并发单点查询的合并
+
+Flask等多线程服务中，许多线程会在同一时刻各自查询一个VID（例如实体embedding），
+每个请求单独获取会话、USE、FETCH PROP。LookupCoalescer把一个短时间窗口内
+（或累积到max_batch个键之前）到达的查询合并为一次批量查询，再把结果分发给
+每个等待的调用方；同一个键已经在等待或查询中时直接共享同一个Future。
+
+没有其他线程同时查询时不等待窗口，单线程调用不会增加延迟。批量查询在
+第一个到达的线程（leader）中执行，往返次数计入它的metrics.track()。
+批量查询不受leader的截止时间（siwi.deadline）限制，否则leader超时会让同一批中
+的其他请求一起失败；每个调用方按自己的剩余时间等待结果，超时抛出DeadlineExceeded。
+
+典型用法::
+
+    coalescer = LookupCoalescer(lambda vids: fetch_embeddings(vids), name="embedding")
+    value = coalescer.get("player150")
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from siwi import deadline, metrics
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+COALESCER_BATCHES = metrics.counter(
+    "siwi_coalescer_batches_total",
+    "Batched lookups issued by request coalescers",
+    ("coalescer",))
+COALESCER_KEYS = metrics.counter(
+    "siwi_coalescer_keys_total",
+    "Keys requested through request coalescers by result (fetched or shared)",
+    ("coalescer", "result"))
+
+
+class LookupCoalescer:
+    """把并发的单点查询合并为批量查询
+
+    Args:
+        fetch: 批量查询函数，参数为不重复的键列表，返回 {键: 值}；
+            结果中没有的键取default
+        window: 第一个键到达后最多等待的秒数，默认读取SIWI_COALESCE_WINDOW_MS（2毫秒）
+        max_batch: 每次批量查询的最大键数，累积到该数量时立即查询，
+            默认读取SIWI_COALESCE_MAX_KEYS（256）
+        name: 指标中的coalescer标签
+        default: 查询结果中不存在的键的值
+    """
+
+    def __init__(self, fetch: Callable[[List[Hashable]], Dict[Hashable, Any]],
+                 window: Optional[float] = None,
+                 max_batch: Optional[int] = None,
+                 name: str = "lookup",
+                 default: Any = None):
+        self.fetch = fetch
+        if window is None:
+            window = float(os.environ.get("SIWI_COALESCE_WINDOW_MS", 2)) / 1000
+        self.window = window
+        self.max_batch = max_batch or int(os.environ.get("SIWI_COALESCE_MAX_KEYS", 256))
+        self.name = name
+        self.default = default
+        self._condition = threading.Condition()
+        # 等待下一次批量查询的键 -> Future
+        self._pending: Dict[Hashable, Future] = {}
+        # 已经发出、尚未完成的键 -> Future
+        self._inflight: Dict[Hashable, Future] = {}
+        self._has_leader = False
+        # 当前正在get_many中的线程数
+        self._callers = 0
+
+    def get(self, key: Hashable, timeout: Optional[float] = None) -> Any:
+        """查询单个键"""
+        return self.get_many([key], timeout)[0]
+
+    def get_many(self, keys: Iterable[Hashable], timeout: Optional[float] = None) -> List[Any]:
+        """查询多个键，返回与keys一一对应的值
+
+        批量查询失败时抛出fetch抛出的异常；当前请求的截止时间已过或在等待中
+        到期时抛出DeadlineExceeded。
+        """
+        deadline.check()
+        keys = list(keys)
+        futures = {}
+        lead = False
+        with self._condition:
+            self._callers += 1
+            fetched = shared = 0
+            for key in dict.fromkeys(keys):
+                future = self._pending.get(key) or self._inflight.get(key)
+                if future is None:
+                    future = self._pending[key] = Future()
+                    fetched += 1
+                else:
+                    shared += 1
+                futures[key] = future
+            if self._pending and not self._has_leader:
+                self._has_leader = lead = True
+            elif len(self._pending) >= self.max_batch:
+                self._condition.notify_all()
+        if fetched:
+            COALESCER_KEYS.inc(fetched, coalescer=self.name, result="fetched")
+        if shared:
+            COALESCER_KEYS.inc(shared, coalescer=self.name, result="shared")
+        try:
+            if lead:
+                self._lead()
+            return [self._result(futures[key], timeout) for key in keys]
+        finally:
+            with self._condition:
+                self._callers -= 1
+
+    @staticmethod
+    def _result(future: Future, timeout: Optional[float]) -> Any:
+        """等待结果，等待时间不超过timeout和当前请求的剩余时间"""
+        remaining = deadline.remaining()
+        if remaining is not None:
+            timeout = max(remaining, 0) if timeout is None else min(timeout, max(remaining, 0))
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError as e:
+            if future.done() or not deadline.expired():
+                raise
+            raise deadline.DeadlineExceeded("等待合并查询的结果时截止时间已过") from e
+
+    def _lead(self) -> None:
+        """等待窗口结束或键数达到上限，然后逐批执行，直到没有待查询的键"""
+        while True:
+            with self._condition:
+                window_end = time.monotonic() + self.window
+                # 只有其他线程也在查询时才值得等待
+                while len(self._pending) < self.max_batch and self._callers > 1:
+                    remaining = window_end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = {}
+                for key in list(self._pending)[:self.max_batch]:
+                    batch[key] = self._inflight[key] = self._pending.pop(key)
+                done = not self._pending
+                if done:
+                    # 之后到达的键由新的leader负责
+                    self._has_leader = False
+            self._dispatch(batch)
+            if done:
+                return
+
+    def _dispatch(self, batch: Dict[Hashable, Future]) -> None:
+        COALESCER_BATCHES.inc(coalescer=self.name)
+        try:
+            with deadline.detached():
+                values = self.fetch(list(batch))
+        except Exception as e:
+            logger.warning("%s: 批量查询%s个键失败: %s", self.name, len(batch), e)
+            for future in batch.values():
+                future.set_exception(e)
+        else:
+            for key, future in batch.items():
+                future.set_result(values.get(key, self.default))
+        finally:
+            with self._condition:
+                for key, future in batch.items():
+                    if self._inflight.get(key) is future:
+                        del self._inflight[key]
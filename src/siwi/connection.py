@@ -0,0 +1,107 @@
+"""
+NebulaGraph连接池管理
+
+每个进程持有自己的连接池。gunicorn等预fork服务器在fork之后，
+子进程会丢弃从父进程继承的连接池引用并在首次使用时重新创建，
+避免多个进程共享同一组socket。
+"""
+
+import os
+import threading
+
+from nebula3.gclient.net import ConnectionPool
+from nebula3.Config import Config
+
+from siwi.log import get_logger
+from siwi.routing import RoutingConnectionPool
+
+logger = get_logger(__name__)
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
+def parse_nebula_graphd_endpoint():
+    ng_endpoints_str = os.environ.get('NG_ENDPOINTS', '127.0.0.1:9669').split(",")
+    ng_endpoints = []
+    for endpoint in ng_endpoints_str:
+        if endpoint:
+            parts = endpoint.split(":")
+            if len(parts) == 2:
+                ng_endpoints.append((parts[0], int(parts[1])))
+    if not ng_endpoints: # 提供一个默认值，如果环境变量解析失败
+        ng_endpoints.append(('127.0.0.1', 9669))
+    return ng_endpoints
+
+
+def _init_pool(endpoints, ng_config: Config) -> ConnectionPool:
+    connection_pool = ConnectionPool()
+    if not connection_pool.init(endpoints, ng_config):
+        raise RuntimeError("Failed to initialize NebulaGraph connection pool")
+    return connection_pool
+
+
+def create_connection_pool():
+    """创建并初始化一个新的连接池
+
+    连接池大小由NG_MAX_CONN_POOL_SIZE控制，多线程worker中应不小于线程数。
+    NG_ENDPOINTS列出多个graphd时，每个graphd一个连接池，由
+    siwi.routing.RoutingConnectionPool按延迟路由、对冲只读请求并隔离故障节点；
+    SIWI_ROUTING=0时改用nebula3的ConnectionPool在所有graphd之间轮询。
+    """
+    ng_config = Config()
+    ng_config.max_connection_pool_size = int(os.environ.get('NG_MAX_CONN_POOL_SIZE', 10))
+    endpoints = parse_nebula_graphd_endpoint()
+    if len(endpoints) < 2 or os.environ.get('SIWI_ROUTING', '1') == '0':
+        return _init_pool(endpoints, ng_config)
+
+    pools = []
+    for endpoint in endpoints:
+        try:
+            pools.append((endpoint, _init_pool([endpoint], ng_config)))
+        except Exception as e:
+            # 启动时不可用的graphd不参与路由，其余节点照常服务
+            logger.warning("graphd %s:%s不可用，不参与路由: %s", endpoint[0], endpoint[1], e)
+    if not pools:
+        raise RuntimeError("Failed to initialize NebulaGraph connection pool")
+    return RoutingConnectionPool(pools)
+
+
+def get_connection_pool() -> ConnectionPool:
+    """获取当前进程的连接池，首次调用时创建"""
+    global _connection_pool
+    if _connection_pool is None:
+        with _connection_pool_lock:
+            if _connection_pool is None:
+                _connection_pool = create_connection_pool()
+    return _connection_pool
+
+
+def set_connection_pool(connection_pool) -> None:
+    """替换当前进程的连接池
+
+    用于注入实现了相同接口的连接池，例如siwi.testing中的FakeConnectionPool
+    """
+    global _connection_pool
+    with _connection_pool_lock:
+        _connection_pool = connection_pool
+
+
+def close_connection_pool() -> None:
+    """关闭当前进程的连接池"""
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is not None:
+            _connection_pool.close()
+            _connection_pool = None
+
+
+def _reset_after_fork() -> None:
+    global _connection_pool, _connection_pool_lock
+    # 子进程中只丢弃引用，不能关闭：socket仍被父进程使用
+    _connection_pool = None
+    _connection_pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
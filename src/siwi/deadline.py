@@ -0,0 +1,89 @@
+"""
+请求截止时间
+
+每个API请求在处理函数中设置截止时间，经contextvars传到同一请求中的所有NebulaGraph调用:
+
+    with deadline(2.0):
+        sampler.sample_subgraph(...)
+
+- metrics.execute在截止时间之后不再发出请求，抛出DeadlineExceeded
+- RoutingConnectionPool等待对冲请求时不超过剩余时间
+- SubgraphSampler在剩余的跳数或批次之前检查截止时间，超时后跳过它们，
+  返回已经取得的部分结果并调用mark_partial()
+- LookupCoalescer代表多个请求执行的批量查询在detached()中执行，不受leader的
+  截止时间限制；每个等待的调用方按自己的剩余时间等待结果
+
+嵌套的deadline取较早的截止时间，与外层共享部分结果标记。
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# (截止时间（time.monotonic）, {"partial": bool})
+_current = contextvars.ContextVar("siwi_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求的截止时间已过"""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """在with块内设置截止时间；seconds为None时不限制"""
+    outer = _current.get()
+    if seconds is None and outer is None:
+        yield
+        return
+    expires = time.monotonic() + seconds if seconds is not None else outer[0]
+    state = {"partial": False}
+    if outer is not None:
+        expires = min(expires, outer[0])
+        state = outer[1]
+    token = _current.set((expires, state))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def detached():
+    """在with块内不受当前截止时间限制，用于代表多个请求执行的共享查询"""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """距截止时间的秒数（可能为负），没有截止时间时返回None"""
+    current = _current.get()
+    if current is None:
+        return None
+    return current[0] - time.monotonic()
+
+
+def expired() -> bool:
+    current = _current.get()
+    return current is not None and time.monotonic() >= current[0]
+
+
+def check() -> None:
+    """截止时间已过时抛出DeadlineExceeded"""
+    if expired():
+        raise DeadlineExceeded("请求的截止时间已过")
+
+
+def mark_partial() -> None:
+    """记录当前请求因截止时间跳过了部分查询"""
+    current = _current.get()
+    if current is not None:
+        current[1]["partial"] = True
+
+
+def is_partial() -> bool:
+    current = _current.get()
+    return current is not None and current[1]["partial"]
@@ -0,0 +1,181 @@
+"""
+nebula3 ResultSet的列式解码
+
+按列把整列thrift Value一次解码为NumPy数组，不经过ValueWrapper逐格包装和
+as_string()/as_double()等方法调用。每个解码函数返回 (数组, 掩码)，掩码为True
+表示该行的值存在且类型符合，NULL、EMPTY或类型不符的行用fill填充。
+
+典型用法::
+
+    resp = metrics.execute(session, query)
+    vids, _ = decode_vids(column(resp, "id"))
+    embedding, valid = decode_floats(column(resp, "embedding"))
+"""
+
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+from nebula3.common.ttypes import Value
+
+# thrift联合体的field编号即getType()的返回值，直接读取field/value属性
+_BVAL = Value.BVAL
+_IVAL = Value.IVAL
+_FVAL = Value.FVAL
+_SVAL = Value.SVAL
+_LVAL = Value.LVAL
+_NUMERIC = frozenset((_BVAL, _IVAL, _FVAL))
+
+
+def column(result, key: Union[int, str]) -> List[Value]:
+    """取出ResultSet中一列的原始thrift Value
+
+    Args:
+        result: nebula3 ResultSet
+        key: 列序号或列名
+
+    Returns:
+        该列的Value列表，查询失败或没有数据时为空列表
+    """
+    if not result.is_succeeded():
+        return []
+    index = key if isinstance(key, int) else result.keys().index(key)
+    return [row.values[index] for row in result.rows()]
+
+
+def _fields(values: Sequence[Value]) -> np.ndarray:
+    return np.fromiter((value.field for value in values), dtype=np.int8, count=len(values))
+
+
+def decode_floats(values: Sequence[Value], fill: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """把数值列（double、int、bool）解码为float64数组"""
+    fields = _fields(values)
+    mask = np.isin(fields, (_BVAL, _IVAL, _FVAL))
+    data = np.fromiter(
+        (value.value if value.field in _NUMERIC else fill for value in values),
+        dtype=np.float64, count=len(values))
+    return data, mask
+
+
+def decode_ints(values: Sequence[Value], fill: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """把整数列解码为int64数组"""
+    fields = _fields(values)
+    data = np.fromiter(
+        (value.value if value.field == _IVAL else fill for value in values),
+        dtype=np.int64, count=len(values))
+    return data, fields == _IVAL
+
+
+def decode_strings(values: Sequence[Value], fill=None,
+                   encoding: str = "utf-8") -> Tuple[np.ndarray, np.ndarray]:
+    """把字符串列解码为object数组；encoding为None时保留bytes"""
+    data = np.empty(len(values), dtype=object)
+    if encoding is None:
+        data[:] = [value.value if value.field == _SVAL else fill for value in values]
+    else:
+        data[:] = [
+            value.value.decode(encoding) if value.field == _SVAL else fill
+            for value in values]
+    return data, _fields(values) == _SVAL
+
+
+def decode_vids(values: Sequence[Value]) -> Tuple[np.ndarray, np.ndarray]:
+    """把VID列解码为object数组：字符串VID为str，INT64 VID为int"""
+    data = np.empty(len(values), dtype=object)
+    data[:] = [
+        value.value.decode("utf-8") if value.field == _SVAL
+        else value.value if value.field == _IVAL else None
+        for value in values]
+    fields = _fields(values)
+    return data, (fields == _SVAL) | (fields == _IVAL)
+
+
+def decode_scalar(value: Value):
+    """把单个标量Value解码为Python值，NULL和非标量返回None"""
+    field = value.field
+    if field == _SVAL:
+        return value.value.decode("utf-8")
+    if field in _NUMERIC:
+        return value.value
+    return None
+
+
+def decode_scalars(values: Sequence[Value]) -> Tuple[np.ndarray, np.ndarray]:
+    """把类型不固定的标量列解码为object数组"""
+    data = np.empty(len(values), dtype=object)
+    data[:] = [decode_scalar(value) for value in values]
+    fields = _fields(values)
+    return data, np.isin(fields, (_BVAL, _IVAL, _FVAL, _SVAL))
+
+
+def decode_lists(values: Sequence[Value], dtype=np.float64, fill=0.0,
+                 width: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """把列表列解码为 [行数, width] 的二维数组
+
+    较短的列表用fill补齐，较长的截断。dtype为object时元素按decode_scalar解码
+    （例如tags($$)的字符串列表），否则元素按数值解码。
+
+    Args:
+        values: 列表列
+        dtype: 结果的dtype
+        fill: 补齐值
+        width: 列数，默认为最长列表的长度
+
+    Returns:
+        (二维数组, 行掩码)，行掩码为False表示该行不是列表
+    """
+    items = [value.value.values if value.field == _LVAL else () for value in values]
+    if width is None:
+        width = max(map(len, items), default=0)
+    data = np.full((len(values), width), fill, dtype=dtype)
+    for row, row_items in enumerate(items):
+        if not row_items:
+            continue
+        row_items = row_items[:width]
+        if dtype is object:
+            data[row, :len(row_items)] = [decode_scalar(item) for item in row_items]
+        else:
+            data[row, :len(row_items)] = [
+                item.value if item.field in _NUMERIC else fill for item in row_items]
+    return data, _fields(values) == _LVAL
+
+
+def decode_vertices(values: Sequence[Value]) -> List[Tuple]:
+    """把顶点列解码为 [(vid, {标签: {属性名: 值}})]，不是顶点的行跳过"""
+    vertices = []
+    for value in values:
+        if value.field != Value.VVAL:
+            continue
+        vertex = value.value
+        tags = {
+            tag.name.decode("utf-8"): {
+                key.decode("utf-8"): decode_scalar(prop)
+                for key, prop in (tag.props or {}).items()}
+            for tag in vertex.tags or ()}
+        vertices.append((decode_scalar(vertex.vid), tags))
+    return vertices
+
+
+def decode_paths(values: Sequence[Value]) -> List[List[Tuple]]:
+    """把路径列解码为边列表，每条路径为 [(src_vid, dst_vid, 边类型, 属性dict)]
+
+    src和dst为边的实际方向：逆向经过的边（type为负）与nebula3的Relationship一致，
+    起点和终点互换。不是路径的行解码为空列表。
+    """
+    paths = []
+    for value in values:
+        if value.field != Value.PVAL:
+            paths.append([])
+            continue
+        path = value.value
+        edges = []
+        previous = decode_scalar(path.src.vid)
+        for step in path.steps:
+            reached = decode_scalar(step.dst.vid)
+            src, dst = (previous, reached) if step.type > 0 else (reached, previous)
+            props: Dict = {
+                key.decode("utf-8"): decode_scalar(prop)
+                for key, prop in (step.props or {}).items()}
+            edges.append((src, dst, step.name.decode("utf-8"), props))
+            previous = reached
+        paths.append(edges)
+    return paths
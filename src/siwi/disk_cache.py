@@ -0,0 +1,471 @@
+"""
+本地磁盘缓存
+
+进程内的缓存（vertex_cache、neighborhood_index、各实例的dict）在重启后全部丢失，
+多个worker各自保存一份。DiskCache是它们之下的持久层：一个SQLite数据库（WAL模式，
+同一台机器上的所有worker共享），保存
+
+- sample_subgraph的结果，键为 (图空间, 中心节点, 采样参数)
+- 特征行，键为 (图空间, 标签, VID, 属性名)，只保存数值
+
+读取顺序为进程内缓存 -> 磁盘 -> graphd，从graphd读取的结果写入磁盘，因此重启后和
+新worker启动时直接命中磁盘，进程内缓存因内存限制淘汰的项也不再回到网络。
+
+写入由后台线程批量提交，不阻塞请求。每项有TTL（SIWI_DISK_CACHE_TTL秒，默认3600）；
+数据库超过SIWI_DISK_CACHE_MB（默认1024）时删除过期项和最早写入的项，并回收空闲页。
+子图包含多个顶点和边，经BulkWriter写入任何顶点或边都会使该图空间的全部子图失效
+（按图空间的代数判断，对共享数据库的所有进程生效），特征行按VID精确失效。
+特征行写入时带上读取graphd之前的代数，后台线程发现代数已经变化时丢弃这次写入，
+读取期间被写入的顶点不会在删除之后以旧值回到缓存。
+
+设置SIWI_DISK_CACHE_DIR后启用，例如 SIWI_DISK_CACHE_DIR=/var/cache/siwi。
+序列化使用JSON头加NumPy原始缓冲区，不使用pickle。
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import closing
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from siwi import metrics
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite单条语句的参数个数上限为999（旧版本），IN列表分块查询
+_CHUNK = 500
+# 每写入多少项检查一次数据库大小
+_COMPACT_EVERY = 256
+# 压缩时删除到上限的比例
+_COMPACT_TARGET = 0.8
+
+DISK_CACHE_BYTES = metrics.gauge(
+    "siwi_disk_cache_bytes",
+    "Size of the on-disk cache database")
+DISK_CACHE_COMPACTIONS = metrics.counter(
+    "siwi_disk_cache_compactions_total",
+    "Size-based compactions of the on-disk cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subgraphs (
+    key TEXT PRIMARY KEY,
+    space TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    blob BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS features (
+    space TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    vid NOT NULL,
+    prop TEXT NOT NULL,
+    value REAL NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (space, tag, vid, prop)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS generations (
+    space TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS subgraphs_created ON subgraphs (created);
+CREATE INDEX IF NOT EXISTS features_created ON features (created);
+"""
+
+
+def _native(vid):
+    # NumPy标量不能直接绑定为SQLite参数
+    return vid.item() if isinstance(vid, np.generic) else vid
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, torch.Tensor):
+        return {"__tensor__": value.tolist(), "dtype": str(value.dtype).replace("torch.", "")}
+    raise TypeError(f"无法序列化{type(value).__name__}")
+
+
+def _json_hook(obj):
+    if "__tensor__" in obj:
+        return torch.tensor(obj["__tensor__"], dtype=getattr(torch, obj["dtype"]))
+    return obj
+
+
+def encode_subgraph(result: Dict) -> bytes:
+    """把sample_subgraph的结果序列化为 长度 + JSON头 + 数组缓冲区
+
+    VID可能是整数，节点类型和特征按 [VID, 值] 列表保存；edge_index、edge_type、
+    edge_attr按原始字节保存在头之后。
+    """
+    arrays = {
+        "edge_index": result['edge_index'].numpy().astype(np.int32),
+        "edge_type": result['edge_type'].numpy().astype(np.int32),
+    }
+    if result.get('edge_attr') is not None:
+        arrays["edge_attr"] = result['edge_attr'].numpy()
+    header = {
+        "center_node_idx": result['center_node_idx'],
+        "idx_to_vid": result['idx_to_vid'],
+        "node_types": list(result['node_types'].items()),
+        "node_features": list(result['node_features'].items()),
+        "edge_type_names": result['edge_type_names'],
+        "edge_attr_names": result['edge_attr_names'],
+        "arrays": [[name, str(array.dtype), list(array.shape)] for name, array in arrays.items()],
+    }
+    head = json.dumps(header, default=_json_default, ensure_ascii=False).encode("utf-8")
+    return b"".join([struct.pack("<I", len(head)), head]
+                    + [np.ascontiguousarray(array).tobytes() for array in arrays.values()])
+
+
+def decode_subgraph(blob: bytes) -> Dict:
+    """encode_subgraph的逆操作，重建sample_subgraph的结果字典"""
+    (length,) = struct.unpack_from("<I", blob)
+    header = json.loads(blob[4:4 + length].decode("utf-8"), object_hook=_json_hook)
+    offset = 4 + length
+    arrays = {}
+    for name, dtype, shape in header["arrays"]:
+        count = int(np.prod(shape))
+        array = np.frombuffer(blob, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += array.nbytes
+        arrays[name] = array
+
+    edge_index = torch.from_numpy(arrays["edge_index"].astype(np.int64))
+    edge_type = torch.from_numpy(arrays["edge_type"].astype(np.int64))
+    edge_attr = torch.from_numpy(arrays["edge_attr"].copy()) if "edge_attr" in arrays else None
+    type_names = header["edge_type_names"]
+    attr_columns = [tuple(name.split(".", 1)) for name in header["edge_attr_names"]]
+    # 结果中的边按类型排列，每种类型是一段切片
+    counts = torch.bincount(edge_type, minlength=len(type_names)).tolist()
+    edge_indices = {}
+    edge_attr_by_type = {}
+    start = 0
+    for name, count in zip(type_names, counts):
+        edge_indices[name] = edge_index[:, start:start + count]
+        if edge_attr is not None:
+            columns = [i for i, (etype, _) in enumerate(attr_columns) if etype == name]
+            edge_attr_by_type[name] = edge_attr[start:start + count, columns]
+        start += count
+    idx_to_vid = header["idx_to_vid"]
+    return {
+        'center_node_idx': header["center_node_idx"],
+        'edge_index': edge_index,
+        'num_nodes': len(idx_to_vid),
+        'vid_to_idx': {vid: idx for idx, vid in enumerate(idx_to_vid)},
+        'idx_to_vid': idx_to_vid,
+        'node_types': dict(header["node_types"]),
+        'edge_indices_by_type': edge_indices,
+        'edge_type': edge_type,
+        'edge_type_names': type_names,
+        'edge_attr': edge_attr,
+        'edge_attr_names': header["edge_attr_names"],
+        'edge_attr_by_type': edge_attr_by_type,
+        'node_features': dict(header["node_features"]),
+    }
+
+
+def subgraph_key(space: str, center, params: Tuple) -> str:
+    """子图的键；params为neighborhood_index.NeighborhoodIndex.key中冻结后的采样参数"""
+    return json.dumps([space, center, params], default=_json_default, ensure_ascii=False)
+
+
+class DiskCache:
+    """SQLite上的子图和特征行缓存
+
+    Args:
+        path: 数据库文件路径，默认为SIWI_DISK_CACHE_DIR下的siwi-cache.sqlite3；
+            都没有给出时不启用，所有读取返回未命中，写入被忽略
+        max_bytes: 数据库大小上限，默认读取SIWI_DISK_CACHE_MB
+        ttl: 每项的有效期（秒），默认读取SIWI_DISK_CACHE_TTL
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        if path is None and os.environ.get("SIWI_DISK_CACHE_DIR"):
+            path = os.path.join(os.environ["SIWI_DISK_CACHE_DIR"], "siwi-cache.sqlite3")
+        self.path = path
+        self.max_bytes = max_bytes or int(float(os.environ.get("SIWI_DISK_CACHE_MB", 1024)) * 2 ** 20)
+        self.ttl = float(os.environ.get("SIWI_DISK_CACHE_TTL", 3600)) if ttl is None else ttl
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._writes = 0
+        if self.path:
+            self.open(self.path)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def open(self, path: str) -> None:
+        """使用path处的数据库（不存在时创建），之前打开的数据库不再使用"""
+        self.flush()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(sqlite3.connect(path, timeout=10, isolation_level=None)) as conn:
+            # auto_vacuum只能在建表和切换WAL之前设置，已有的数据库保持原设置
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.executescript(_SCHEMA)
+        self.path = path
+
+    def close(self) -> None:
+        """等待写入完成后停用缓存，之后的读取返回未命中"""
+        self.flush()
+        self.path = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # 每个线程一个连接；fork之后（gunicorn preload）子进程或open()之后重新连接
+        key, conn = getattr(self._local, "conn", (None, None))
+        if conn is None or key != (os.getpid(), self.path):
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = ((os.getpid(), self.path), conn)
+        return conn
+
+    # --- 子图 ---
+
+    def generation(self, space: str) -> int:
+        """图空间当前的代数，每次写入顶点或边后加一"""
+        if not self.enabled:
+            return 0
+        try:
+            row = self._connection().execute(
+                "SELECT generation FROM generations WHERE space = ?", (space,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("读取磁盘缓存失败: %s", e)
+            # 以无效的代数写入的子图不会被读取
+            return -1
+        return row[0] if row else 0
+
+    def get_subgraph(self, space: str, key: str) -> Optional[Dict]:
+        """读取子图，不存在、过期或图空间已被写入时返回None"""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT blob FROM subgraphs WHERE key = ? AND expires > ? AND generation = "
+                "COALESCE((SELECT generation FROM generations WHERE space = ?), 0)",
+                (key, time.time(), space)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("读取磁盘缓存失败: %s", e)
+            row = None
+        metrics.record_cache("disk_cache", row is not None)
+        return decode_subgraph(row[0]) if row is not None else None
+
+    def put_subgraph(self, space: str, key: str, result: Dict, generation: int) -> None:
+        """在后台写入子图；generation为采样开始前读取的代数"""
+        if not self.enabled:
+            return
+        try:
+            blob = encode_subgraph(result)
+        except (TypeError, ValueError) as e:
+            logger.debug("子图无法序列化，不写入磁盘缓存: %s", e)
+            return
+        now = time.time()
+        self._submit((
+            "INSERT OR REPLACE INTO subgraphs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(key, space, generation, blob, len(blob), now, now + self.ttl)]))
+
+    # --- 特征行 ---
+
+    def get_features(self, space: str, tag: str, vids: Sequence,
+                     props: Sequence[str]) -> Dict[object, List[float]]:
+        """读取特征行，只返回props全部命中的VID: {VID: 与props对齐的值}"""
+        if not self.enabled or not vids or not props:
+            return {}
+        found: Dict[object, Dict[str, float]] = {}
+        now = time.time()
+        prop_marks = ", ".join("?" * len(props))
+        try:
+            conn = self._connection()
+            for start in range(0, len(vids), _CHUNK):
+                chunk = [_native(vid) for vid in vids[start:start + _CHUNK]]
+                rows = conn.execute(
+                    f"SELECT vid, prop, value FROM features WHERE space = ? AND tag = ? "
+                    f"AND prop IN ({prop_marks}) AND vid IN ({', '.join('?' * len(chunk))}) "
+                    f"AND expires > ?",
+                    [space, tag, *props, *chunk, now]).fetchall()
+                for vid, prop, value in rows:
+                    found.setdefault(vid, {})[prop] = value
+        except sqlite3.Error as e:
+            logger.warning("读取磁盘缓存失败: %s", e)
+            found = {}
+        rows = {vid: [values[prop] for prop in props]
+                for vid, values in found.items() if len(values) == len(props)}
+        if rows:
+            metrics.record_cache("disk_cache", True, len(rows))
+        if len(rows) < len(vids):
+            metrics.record_cache("disk_cache", False, len(vids) - len(rows))
+        return rows
+
+    def put_features(self, space: str, tag: str, prop: str,
+                     vids: Iterable, values: Iterable[float],
+                     generation: Optional[int] = None) -> None:
+        """在后台写入一个属性的多个数值
+
+        generation为读取这些值之前的代数；写入时图空间的代数已经变化则丢弃。
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        rows = [(space, tag, _native(vid), prop, float(value), now, now + self.ttl)
+                for vid, value in zip(vids, values)]
+        if rows:
+            self._submit(("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?, ?)", rows),
+                         None if generation is None else (space, generation))
+
+    # --- 失效 ---
+
+    def invalidate_vertices(self, space: str, tag: str, vids: Sequence) -> None:
+        """顶点属性被写入：删除特征行，并使图空间的子图失效
+
+        删除经后台线程执行，排在之前提交的特征行写入之后。
+        """
+        if not self.enabled:
+            return
+        self.bump_generation(space)
+        self._submit(("DELETE FROM features WHERE space = ? AND tag = ? AND vid = ?",
+                      [(space, tag, _native(vid)) for vid in vids]))
+
+    def bump_generation(self, space: str) -> None:
+        """边或顶点被写入：图空间的所有子图失效"""
+        if not self.enabled:
+            return
+        try:
+            self._connection().execute(
+                "INSERT INTO generations VALUES (?, 1) "
+                "ON CONFLICT (space) DO UPDATE SET generation = generation + 1", (space,))
+        except sqlite3.Error as e:
+            logger.warning("更新磁盘缓存的代数失败: %s", e)
+
+    # --- 后台写入和压缩 ---
+
+    def _submit(self, item: Tuple[str, list],
+                guard: Optional[Tuple[str, int]] = None) -> None:
+        # guard为 (图空间, 代数)，写入线程在代数不同时跳过这一项
+        self._queue.put((*item, guard))
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="siwi-disk-cache", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=1)
+            except queue.Empty:
+                return
+            # 一次事务提交队列中已有的所有写入
+            items = [item]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    generations = {}
+                    for sql, rows, guard in items:
+                        if guard is not None:
+                            space, generation = guard
+                            if space not in generations:
+                                row = conn.execute(
+                                    "SELECT generation FROM generations WHERE space = ?",
+                                    (space,)).fetchone()
+                                generations[space] = row[0] if row else 0
+                            if generations[space] != generation:
+                                continue
+                        conn.executemany(sql, rows)
+                        self._writes += len(rows)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                if self._writes >= _COMPACT_EVERY:
+                    self._writes = 0
+                    self.compact()
+            except Exception as e:
+                logger.warning("写入磁盘缓存失败: %s", e)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """等待已提交的写入完成"""
+        if self.enabled:
+            self._queue.join()
+
+    def size(self) -> int:
+        """数据库中已使用页的字节数"""
+        conn = self._connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def compact(self) -> None:
+        """删除过期项；仍然超过上限时按写入时间删除最早的项，再回收空闲页"""
+        if not self.enabled:
+            return
+        conn = self._connection()
+        now = time.time()
+        conn.execute("DELETE FROM subgraphs WHERE expires <= ?", (now,))
+        conn.execute("DELETE FROM features WHERE expires <= ?", (now,))
+        size = self.size()
+        if size > self.max_bytes:
+            DISK_CACHE_COMPACTIONS.inc()
+            excess = size - int(self.max_bytes * _COMPACT_TARGET)
+            # 已用页包含索引和页内空隙，按比例换算成要删除的子图字节数
+            blob_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM subgraphs").fetchone()[0]
+            target = blob_bytes * excess // size
+            # 子图占大部分空间，先按写入时间删除子图，再删除特征行
+            cutoff = conn.execute(
+                "SELECT created FROM (SELECT created, SUM(size) OVER (ORDER BY created) AS total "
+                "FROM subgraphs) WHERE total >= ? ORDER BY created LIMIT 1", (target,)).fetchone()
+            if cutoff is not None:
+                conn.execute("DELETE FROM subgraphs WHERE created <= ?", cutoff)
+            else:
+                conn.execute("DELETE FROM subgraphs")
+                # 每个特征行约占64字节
+                conn.execute(
+                    "DELETE FROM features WHERE (space, tag, vid, prop) IN (SELECT space, tag, vid, prop "
+                    "FROM features ORDER BY created LIMIT ?)", (max((excess - blob_bytes) // 64, 1),))
+            self._reclaim(conn)
+            logger.info("磁盘缓存压缩: %s -> %s字节", size, self.size())
+        DISK_CACHE_BYTES.set(self.size())
+
+    def clear(self) -> None:
+        if not self.enabled:
+            return
+        self.flush()
+        conn = self._connection()
+        conn.execute("DELETE FROM subgraphs")
+        conn.execute("DELETE FROM features")
+        conn.execute("DELETE FROM generations")
+        self._reclaim(conn)
+        DISK_CACHE_BYTES.set(self.size())
+
+    @staticmethod
+    def _reclaim(conn: sqlite3.Connection) -> None:
+        # execute()只执行incremental_vacuum的第一步（回收一页），executescript执行到完成
+        conn.executescript("PRAGMA incremental_vacuum;")
+        # 回收的页在检查点之后才从文件中截掉
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+DISK_CACHE = DiskCache()
@@ -1,29 +1,82 @@
+import threading
+
 import torch
-from nebula3.gclient.net import ConnectionPool
-from nebula3.Config import Config
 
-NEBULA_HOST = '127.0.0.1'
-NEBULA_PORT = 9669
+from siwi import metrics
+from siwi.coalescer import LookupCoalescer
+from siwi.deadline import DeadlineExceeded
+from siwi.decoder import column, decode_floats, decode_vids
+from siwi.disk_cache import DISK_CACHE
+from siwi.connection import get_connection_pool
+from siwi.log import get_logger
+from siwi.miss_cache import known_misses, record_fetch
+from siwi.ngql import format_vids
+from siwi.shm_cache import SHM_CACHE
+from siwi.vertex_cache import VERTEX_CACHE, as_float, is_missing
+
+logger = get_logger(__name__)
+
 NEBULA_USER = 'root'
 NEBULA_PASSWORD = 'nebula'
 NEBULA_GRAPH_SPACE = 'basketballplayer'
 
-_connection_pool = None
-
 def get_nebula_connection_pool():
-    global _connection_pool
-    if _connection_pool is None:
-        config = Config()
-        config.max_connection_pool_size = 10
-        _connection_pool = ConnectionPool()
-        if not _connection_pool.init([(NEBULA_HOST, NEBULA_PORT)], config):
-            raise RuntimeError("Failed to initialize NebulaGraph connection pool")
-    return _connection_pool
+    # 连接池按进程管理，地址由NG_ENDPOINTS配置（默认127.0.0.1:9669）
+    return get_connection_pool()
+
+def _fetch_embeddings(entity_tag: str, embedding_field: str, entity_ids: list) -> dict:
+    """用一条FETCH PROP读取多个实体的embedding，返回 {实体ID: 浮点数}，非数值的属性不返回"""
+    pool = get_nebula_connection_pool()
+    # 读取之前的写入代数，读取期间有顶点被写入时不把旧值写入缓存
+    shm_generation = SHM_CACHE.generation()
+    disk_generation = DISK_CACHE.generation(NEBULA_GRAPH_SPACE)
+    session = pool.get_session(NEBULA_USER, NEBULA_PASSWORD)
+    try:
+        result = metrics.execute(
+            session,
+            f"USE {NEBULA_GRAPH_SPACE}; FETCH PROP ON {entity_tag} {format_vids(entity_ids)} "
+            f"YIELD id(vertex) AS id, properties(vertex).{embedding_field} AS embedding")
+    finally:
+        session.release()
+    if not result.is_succeeded():
+        raise RuntimeError(f"FETCH PROP失败: {result.error_msg()}")
+    ids, _ = decode_vids(column(result, 0))
+    embeddings, valid = decode_floats(column(result, 1))
+    record_fetch(NEBULA_GRAPH_SPACE, entity_tag, entity_ids, ids.tolist(),
+                 {embedding_field: ids[~valid].tolist()})
+    SHM_CACHE.put_features(NEBULA_GRAPH_SPACE, entity_tag, embedding_field,
+                           ids[valid].tolist(), embeddings[valid].tolist(), shm_generation)
+    DISK_CACHE.put_features(NEBULA_GRAPH_SPACE, entity_tag, embedding_field,
+                            ids[valid].tolist(), embeddings[valid].tolist(), disk_generation)
+    return {entity_id: float(value)
+            for entity_id, value, ok in zip(ids, embeddings, valid) if ok}
+
+
+_embedding_coalescers = {}
+_embedding_coalescers_lock = threading.Lock()
+
+
+def _embedding_coalescer(entity_tag: str, embedding_field: str) -> LookupCoalescer:
+    """每个 (标签, 字段) 一个合并器，同一时刻的查询合并为一条FETCH PROP"""
+    key = (entity_tag, embedding_field)
+    with _embedding_coalescers_lock:
+        coalescer = _embedding_coalescers.get(key)
+        if coalescer is None:
+            coalescer = _embedding_coalescers[key] = LookupCoalescer(
+                lambda entity_ids: _fetch_embeddings(entity_tag, embedding_field, entity_ids),
+                name=f"embedding:{entity_tag}.{embedding_field}")
+        return coalescer
+
 
 def get_entity_embedding(entity_id: str, entity_tag: str = "player", embedding_field: str = "embedding1") -> float | None:
     """
     从 NebulaGraph 中获取指定实体的 embedding 值。
     
+    预热加载到siwi.vertex_cache中的实体，以及siwi.shm_cache（同一台机器上的worker
+    共享）和siwi.disk_cache中的embedding直接从本地读取。其他实体的并发查询经LookupCoalescer合并为一条多VID的FETCH PROP，同一
+    实体的并发查询共享同一个结果。不存在的实体和空的embedding经siwi.miss_cache
+    在本地判定，不再查询graphd。
+    
     参数:
     - entity_id: 实体ID
     - entity_tag: 实体类型标签，默认为"player"
@@ -31,35 +84,33 @@ def get_entity_embedding(entity_id: str, entity_tag: str = "player", embedding_f
     
     返回:
     - 浮点数形式的embedding值
-    - 如果获取失败，返回None
+    - 如果获取失败，返回None；请求的截止时间已过时抛出DeadlineExceeded
     """
-    pool = get_nebula_connection_pool()
-    session = None
+    cached = VERTEX_CACHE.get_prop(NEBULA_GRAPH_SPACE, entity_id, entity_tag, embedding_field)
+    if VERTEX_CACHE.has_vertices():
+        metrics.record_cache("vertex_cache", not is_missing(cached))
+    if not is_missing(cached):
+        return as_float(cached)
+    if known_misses(NEBULA_GRAPH_SPACE, entity_tag, [entity_id], [embedding_field])[0]:
+        return None
+    if SHM_CACHE.enabled:
+        row = SHM_CACHE.get_features(NEBULA_GRAPH_SPACE, entity_tag, [entity_id], [embedding_field])
+        if row:
+            return row[entity_id][0]
+    if DISK_CACHE.enabled:
+        shm_generation = SHM_CACHE.generation()
+        row = DISK_CACHE.get_features(NEBULA_GRAPH_SPACE, entity_tag, [entity_id], [embedding_field])
+        if row:
+            SHM_CACHE.put_features(NEBULA_GRAPH_SPACE, entity_tag, embedding_field,
+                                   [entity_id], row[entity_id], shm_generation)
+            return row[entity_id][0]
     try:
-        session = pool.get_session(NEBULA_USER, NEBULA_PASSWORD)
-        session.execute(f"USE {NEBULA_GRAPH_SPACE};")
-        
-        query = f'FETCH PROP ON {entity_tag} "{entity_id}" YIELD properties(vertex).{embedding_field}'
-        
-        result = session.execute(query)
-        if not result.is_succeeded() or result.row_size() == 0:
-            # 查询失败或没有结果，直接返回None
-            return None
-        
-        embedding_value_wrapper = result.row_values(0)[0]
-        if embedding_value_wrapper.is_empty():
-            # 属性不存在，返回None
-            return None
-        
-        # 返回浮点数值
-        return embedding_value_wrapper.as_double()
-
+        return _embedding_coalescer(entity_tag, embedding_field).get(entity_id)
+    except DeadlineExceeded:
+        raise
     except Exception:
         # 出现异常，返回None
         return None
-    finally:
-        if session:
-            session.release()
 
 def convert_embedding_to_tensor(embedding_value: float | None) -> torch.Tensor | None:
     """
@@ -78,7 +129,7 @@ def convert_embedding_to_tensor(embedding_value: float | None) -> torch.Tensor |
         # 将单个值转换为1维tensor
         return torch.tensor([float(embedding_value)], dtype=torch.float32)
     except Exception as e:
-        print(f"Error converting to PyTorch Tensor: {e}")
+        logger.warning("Error converting to PyTorch Tensor: %s", e)
         return None
 
 def get_entity_embedding_tensor(entity_id: str, entity_tag: str = "player", 
@@ -0,0 +1,185 @@
+"""
+siwi日志子系统
+
+- 按模块获取logger: logger = get_logger(__name__)
+- 惰性格式化: 使用 logger.debug("... %s", value)，只有记录真正输出时才格式化
+- 分级: SIWI_LOG_LEVEL 设置默认级别（默认INFO），
+  SIWI_LOG_LEVELS 按模块设置，例如 "siwi.remote_backend=DEBUG,siwi.bot=WARNING"
+- 采样: 同一条消息模板在 SIWI_LOG_SAMPLE_WINDOW 秒内最多输出
+  SIWI_LOG_SAMPLE_BURST 次，其余丢弃并在下一条输出中附带 suppressed=N
+- 异步: 记录经队列交给后台线程写出，调用线程不会阻塞在stdout锁上
+- 结构化: 默认logfmt风格，SIWI_LOG_FORMAT=json 时输出JSON；
+  extra中的字段会作为键值对输出
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+ROOT_LOGGER_NAME = "siwi"
+
+# LogRecord自带的属性，其余属性视为extra中的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime"}
+
+_setup_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """把日志记录格式化为logfmt或JSON，extra字段作为键值对附加在后面"""
+
+    def __init__(self, fmt_type: str = "logfmt"):
+        super().__init__()
+        self.fmt_type = fmt_type
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            "ts": time.strftime(
+                "%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                fields[key] = value
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+
+        if self.fmt_type == "json":
+            return json.dumps(fields, ensure_ascii=False, default=str)
+        return " ".join(
+            f"{key}={self._quote(value)}" for key, value in fields.items())
+
+    @staticmethod
+    def _quote(value) -> str:
+        value = str(value)
+        if not value or any(c in value for c in ' ="\n'):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+
+class SamplingFilter(logging.Filter):
+    """对重复日志采样
+
+    以 (logger, 消息模板) 为键，每个时间窗口内最多放行burst条记录。
+    被丢弃的条数记在下一条放行记录的suppressed字段中。
+    """
+
+    def __init__(self, burst: int = 20, window: float = 1.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        # key -> [窗口开始时间, 窗口内已放行条数, 已丢弃条数]
+        self._state = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.msg)
+        now = record.created
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state is not None else 0
+                self._state[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """不在调用线程中格式化的QueueHandler
+
+    队列只在本进程内使用，记录不需要序列化，消息格式化推迟到后台线程
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_levels(levels: str) -> dict:
+    result = {}
+    for item in levels.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        result[name.strip()] = level.strip().upper()
+    return result
+
+
+def _start_listener() -> None:
+    global _listener
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        StructuredFormatter(os.environ.get("SIWI_LOG_FORMAT", "logfmt")))
+    _listener = logging.handlers.QueueListener(
+        _handler.queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+
+def setup_logging() -> None:
+    """配置siwi日志（幂等），get_logger会自动调用"""
+    global _handler
+    if _handler is not None:
+        return
+    with _setup_lock:
+        if _handler is not None:
+            return
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel(os.environ.get("SIWI_LOG_LEVEL", "INFO").upper())
+        root.propagate = False
+        for name, level in _parse_levels(
+                os.environ.get("SIWI_LOG_LEVELS", "")).items():
+            logging.getLogger(name).setLevel(level)
+
+        handler = _InProcessQueueHandler(queue.SimpleQueue())
+        handler.addFilter(SamplingFilter(
+            burst=int(os.environ.get("SIWI_LOG_SAMPLE_BURST", 20)),
+            window=float(os.environ.get("SIWI_LOG_SAMPLE_WINDOW", 1.0))))
+        root.addHandler(handler)
+        _handler = handler
+        _start_listener()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """停止后台线程，写出队列中剩余的记录"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork() -> None:
+    # 后台线程不会被fork到子进程中，需要用新的队列重新启动
+    if _handler is not None:
+        _handler.queue = queue.SimpleQueue()
+        _start_listener()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """获取模块logger，name通常为__name__"""
+    setup_logging()
+    if name != ROOT_LOGGER_NAME and not name.startswith(ROOT_LOGGER_NAME + "."):
+        name = f"{ROOT_LOGGER_NAME}.{name}"
+    return logging.getLogger(name)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
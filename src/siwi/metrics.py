@@ -0,0 +1,293 @@
+"""
+siwi运行指标
+
+- execute(session, stmt): 所有nGQL请求都经过这里，记录按语句类型分组的
+  请求数、失败数和延迟，并计入当前操作的往返次数；请求的截止时间
+  （siwi.deadline）已过时不再发出
+- track(operation): 统计一次高层操作（sample_subgraph、get_tensor、/query等）
+  的耗时和NebulaGraph往返次数
+- span(stage): 统计操作内部各阶段（遍历、标签查询、特征获取、边索引构建、序列化）的耗时
+- record_cache(cache, hit): 记录缓存命中与未命中
+- render_prometheus(): 以Prometheus文本格式导出，由 /metrics 路由返回
+
+指标在进程内聚合，每次记录只有一次加锁和一次二分查找，可以在生产环境常开。
+多worker部署时每个worker各自导出自己的指标。
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from siwi import deadline
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# 语句类型标签只取固定集合，避免标签基数随查询内容增长
+_STATEMENT_TYPES = {
+    "GO", "FETCH", "MATCH", "GET", "FIND", "LOOKUP", "INSERT", "UPDATE",
+    "UPSERT", "DELETE", "USE", "DESCRIBE", "SHOW", "YIELD"}
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.extend(extra.items())
+        if not pairs:
+            return ""
+        body = ",".join(
+            '{}="{}"'.format(
+                name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in pairs)
+        return "{" + body + "}"
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{self._format_labels(key)} {value}"
+            for key, value in items]
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [每个桶的计数..., +Inf桶计数, 总和]
+        self._values = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            state[position] += 1
+            state[-1] += value
+
+    def _render_samples(self) -> list:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{self._format_labels(key, {'le': bound})} {cumulative}")
+            cumulative += state[len(self.buckets)]
+            lines.append(
+                f"{self.name}_bucket"
+                f"{self._format_labels(key, {'le': '+Inf'})} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (),
+              buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+NEBULA_REQUESTS = counter(
+    "siwi_nebula_requests_total",
+    "NebulaGraph round trips by statement type and status",
+    ("statement", "status"))
+NEBULA_LATENCY = histogram(
+    "siwi_nebula_request_seconds",
+    "Latency of NebulaGraph round trips by statement type",
+    ("statement",))
+OPERATION_LATENCY = histogram(
+    "siwi_operation_seconds",
+    "Latency of high level operations",
+    ("operation",))
+OPERATION_ROUND_TRIPS = histogram(
+    "siwi_operation_round_trips",
+    "NebulaGraph round trips per high level operation",
+    ("operation",), ROUND_TRIP_BUCKETS)
+STAGE_LATENCY = histogram(
+    "siwi_stage_seconds",
+    "Latency of stages inside an operation",
+    ("stage",))
+CACHE_REQUESTS = counter(
+    "siwi_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ("cache", "result"))
+
+
+class _RoundTripTracker:
+    __slots__ = ("count", "parent", "_lock")
+
+    def __init__(self, parent=None):
+        self.count = 0
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def add(self, amount: int = 1) -> None:
+        # 可能在多个线程中同时累加（例如批量查询的线程池）
+        with self._lock:
+            self.count += amount
+
+
+_current_tracker = contextvars.ContextVar("siwi_round_trip_tracker", default=None)
+
+
+def statement_type(stmt: str) -> str:
+    """取nGQL语句的类型，"USE x; GO ..." 取USE之后的语句"""
+    stmt = stmt.lstrip()
+    if stmt[:3].upper() == "USE" and ";" in stmt:
+        rest = stmt.split(";", 1)[1].lstrip()
+        if rest:
+            stmt = rest
+    verb = stmt.split(None, 1)[0].upper() if stmt else ""
+    return verb if verb in _STATEMENT_TYPES else "OTHER"
+
+
+def execute(session, stmt: str):
+    """执行nGQL并记录指标，替代直接调用session.execute
+
+    当前请求的截止时间已过时抛出siwi.deadline.DeadlineExceeded，不发出请求。
+    """
+    deadline.check()
+    label = statement_type(stmt)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        result = session.execute(stmt)
+        if result.is_succeeded():
+            status = "ok"
+        return result
+    finally:
+        NEBULA_LATENCY.observe(time.perf_counter() - start, statement=label)
+        NEBULA_REQUESTS.inc(statement=label, status=status)
+        tracker = _current_tracker.get()
+        if tracker is not None:
+            tracker.add()
+
+
+def current_round_trips() -> int:
+    """当前track()范围内已经发生的往返次数"""
+    tracker = _current_tracker.get()
+    return tracker.count if tracker is not None else 0
+
+
+@contextmanager
+def track(operation: str):
+    """统计一次高层操作的耗时和往返次数，嵌套时往返次数也计入外层操作"""
+    tracker = _RoundTripTracker(_current_tracker.get())
+    token = _current_tracker.set(tracker)
+    start = time.perf_counter()
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+        OPERATION_LATENCY.observe(time.perf_counter() - start, operation=operation)
+        OPERATION_ROUND_TRIPS.observe(tracker.count, operation=operation)
+        if tracker.parent is not None:
+            tracker.parent.add(tracker.count)
+
+
+@contextmanager
+def span(stage: str):
+    """统计操作内部某个阶段的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_cache(cache: str, hit: bool, count: int = 1) -> None:
+    CACHE_REQUESTS.inc(count, cache=cache, result="hit" if hit else "miss")
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
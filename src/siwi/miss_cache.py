@@ -0,0 +1,314 @@
+"""
+不存在的VID和空属性的本地缓存
+
+默认的 f"{group}{idx}" 映射、NebulaToTorch的 unknown{idx} 等会产生大量不存在的VID，
+每次读取都要去graphd确认一遍。这里提供两层本地判断:
+
+- NegativeCache: 查询过的不存在的顶点、存在但属性为空的 (顶点, 属性)，在TTL内
+  （SIWI_MISS_CACHE_TTL秒，默认60）直接判定为未命中
+- VidFilters: 每个标签一个已知VID的Bloom过滤器，由 LOOKUP ON <tag> 全量扫描建立，
+  之后经本进程的写入增量加入，并按SIWI_VID_FILTER_REFRESH秒（默认300）在后台重建。
+  过滤器判定不存在的VID一定不存在（其他进程在两次重建之间新建的顶点除外），
+  判定存在时仍需查询。只为SIWI_VID_FILTER_TAGS（逗号分隔，默认为空）列出的标签
+  自动建立，也可以调用 VID_FILTERS.build() 显式建立
+
+经BulkWriter写入的顶点会从负缓存中移除并加入过滤器。
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from siwi import metrics
+from siwi.connection import get_connection_pool
+from siwi.decoder import column, decode_vids
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def _vid_bytes(vid) -> bytes:
+    return str(vid).encode("utf-8")
+
+
+class BloomFilter:
+    """位数组和双重哈希实现的Bloom过滤器
+
+    Args:
+        capacity: 预计的元素数
+        error_rate: 元素数不超过capacity时的误判率
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(int(capacity), 1)
+        self.num_bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.capacity = capacity
+        self.count = 0
+        self._bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self._lock = threading.Lock()
+
+    def _hashes(self, key) -> Tuple[int, int]:
+        digest = hashlib.blake2b(_vid_bytes(key), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def add(self, key) -> None:
+        self.add_many([key])
+
+    def add_many(self, keys: Iterable) -> None:
+        hashes = [self._hashes(key) for key in keys]
+        if not hashes:
+            return
+        h1, h2 = (np.array(column, dtype=np.uint64) for column in zip(*hashes))
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        # uint64溢出按模2^64回绕，不影响位置的均匀性
+        with np.errstate(over="ignore"):
+            positions = (h1[:, None] + steps * h2[:, None]) % np.uint64(self.num_bits)
+        positions = positions.ravel().astype(np.int64)
+        with self._lock:
+            np.bitwise_or.at(self._bits, positions >> 3,
+                             (1 << (positions & 7)).astype(np.uint8))
+            self.count += len(hashes)
+
+    def __contains__(self, key) -> bool:
+        h1, h2 = self._hashes(key)
+        bits = self._bits
+        for i in range(self.num_hashes):
+            position = ((h1 + i * h2) & 0xFFFFFFFFFFFFFFFF) % self.num_bits
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class NegativeCache:
+    """带TTL的未命中缓存
+
+    每个 (图空间, 标签, VID) 一项：值为None表示顶点不存在，否则为属性为空的属性名集合。
+    项数超过max_entries时淘汰最早加入的项。
+
+    Args:
+        ttl: 未命中的有效期（秒），默认读取SIWI_MISS_CACHE_TTL（60），为0时不缓存
+        max_entries: 最大项数，默认读取SIWI_MISS_CACHE_SIZE（100000）
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = float(os.environ.get("SIWI_MISS_CACHE_TTL", 60)) if ttl is None else ttl
+        self.max_entries = max_entries or int(os.environ.get("SIWI_MISS_CACHE_SIZE", 100000))
+        self._entries: "OrderedDict[Tuple, Tuple[float, Optional[frozenset]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _put(self, key: Tuple, props: Optional[frozenset]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, props)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def add_missing(self, space: str, tag: str, vids: Iterable) -> None:
+        """记录不存在的顶点"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            for vid in vids:
+                self._put((space, tag, vid), None)
+
+    def add_empty(self, space: str, tag: str, vids: Iterable, prop: str) -> None:
+        """记录顶点存在但属性为空（NULL或不是数值）"""
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for vid in vids:
+                key = (space, tag, vid)
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now and entry[1] is None:
+                    continue
+                props = entry[1] if entry is not None and entry[0] > now else frozenset()
+                self._put(key, props | {prop})
+
+    def is_miss(self, space: str, tag: str, vid, props: Sequence[str] = ()) -> bool:
+        """顶点在TTL内查询过不存在，或者props都查询过为空"""
+        entry = self._entries.get((space, tag, vid))
+        if entry is None:
+            return False
+        expiry, empty_props = entry
+        if expiry <= time.monotonic():
+            with self._lock:
+                if self._entries.get((space, tag, vid)) is entry:
+                    del self._entries[(space, tag, vid)]
+            return False
+        if empty_props is None:
+            return True
+        return bool(props) and all(prop in empty_props for prop in props)
+
+    def invalidate(self, space: str, tag: str, vids: Iterable) -> None:
+        """顶点被写入后移除对应的项"""
+        if not self._entries:
+            return
+        with self._lock:
+            for vid in vids:
+                self._entries.pop((space, tag, vid), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class VidFilters:
+    """按 (图空间, 标签) 管理已知VID的Bloom过滤器
+
+    Args:
+        tags: 自动建立过滤器的标签，默认读取SIWI_VID_FILTER_TAGS
+        refresh_interval: 过滤器重建的间隔（秒），默认读取SIWI_VID_FILTER_REFRESH（300）
+        error_rate: 过滤器的误判率
+        user: NebulaGraph用户名
+        password: NebulaGraph密码
+    """
+
+    def __init__(self, tags: Optional[Iterable[str]] = None,
+                 refresh_interval: Optional[float] = None,
+                 error_rate: float = 0.01,
+                 user: str = "root", password: str = "nebula"):
+        if tags is None:
+            tags = [tag.strip() for tag in os.environ.get("SIWI_VID_FILTER_TAGS", "").split(",")]
+        self.tags = {tag for tag in tags if tag}
+        self.refresh_interval = (
+            float(os.environ.get("SIWI_VID_FILTER_REFRESH", 300))
+            if refresh_interval is None else refresh_interval)
+        self.error_rate = error_rate
+        self.user = user
+        self.password = password
+        # (space, tag) -> (BloomFilter, 建立时间)
+        self._filters: Dict[Tuple[str, str], Tuple[BloomFilter, float]] = {}
+        # 正在重建的 (space, tag) -> 重建期间写入的VID，重建完成后补入新过滤器
+        self._building: Dict[Tuple[str, str], List] = {}
+        self._lock = threading.Lock()
+
+    def build(self, space: str, tag: str, connection_pool=None) -> BloomFilter:
+        """扫描标签的所有VID，建立并启用新的过滤器"""
+        key = (space, tag)
+        with self._lock:
+            self._building.setdefault(key, [])
+        try:
+            pool = connection_pool or get_connection_pool()
+            session = pool.get_session(self.user, self.password)
+            try:
+                resp = metrics.execute(
+                    session, f"USE {space}; LOOKUP ON {tag} YIELD id(vertex) AS id")
+            finally:
+                session.release()
+            if not resp.is_succeeded():
+                raise RuntimeError(f"扫描{space}.{tag}的VID失败: {resp.error_msg()}")
+            vids, _ = decode_vids(column(resp, 0))
+            # 预留增量写入的空间
+            bloom = BloomFilter(max(len(vids) * 2, 1024), self.error_rate)
+            bloom.add_many(vids.tolist())
+            with self._lock:
+                bloom.add_many(self._building.get(key, ()))
+                self._filters[key] = (bloom, time.monotonic())
+            logger.info("已建立%s.%s的VID过滤器: %s个VID", space, tag, len(vids))
+            return bloom
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+
+    def _refresh_in_background(self, space: str, tag: str) -> None:
+        with self._lock:
+            if (space, tag) in self._building:
+                return
+            self._building[(space, tag)] = []
+
+        def run():
+            try:
+                self.build(space, tag)
+            except Exception as e:
+                logger.warning("建立%s.%s的VID过滤器失败: %s", space, tag, e)
+        threading.Thread(target=run, name=f"siwi-vid-filter-{tag}", daemon=True).start()
+
+    def get(self, space: str, tag: str) -> Optional[BloomFilter]:
+        """返回可用的过滤器；自动管理的标签没有过滤器或已过期时在后台（重新）建立"""
+        entry = self._filters.get((space, tag))
+        if tag in self.tags and (
+                entry is None or time.monotonic() - entry[1] > self.refresh_interval):
+            self._refresh_in_background(space, tag)
+        return entry[0] if entry is not None else None
+
+    def add(self, space: str, tag: str, vids: Iterable) -> None:
+        """加入本进程写入的VID"""
+        key = (space, tag)
+        if key not in self._filters and key not in self._building:
+            return
+        vids = list(vids)
+        with self._lock:
+            building = self._building.get(key)
+            if building is not None:
+                building.extend(vids)
+            entry = self._filters.get(key)
+        if entry is not None:
+            entry[0].add_many(vids)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._filters.clear()
+
+
+NEGATIVE_CACHE = NegativeCache()
+VID_FILTERS = VidFilters()
+
+
+def known_misses(space: str, tag: str, vids: Sequence[Hashable],
+                 props: Sequence[str] = ()) -> np.ndarray:
+    """判断哪些VID可以在本地确定为未命中
+
+    Args:
+        space: 图空间
+        tag: 标签
+        vids: VID列表
+        props: 需要读取的属性，全部在负缓存中记录为空时也判定为未命中
+
+    Returns:
+        与vids一一对应的布尔数组，True表示不需要查询graphd
+    """
+    misses = np.zeros(len(vids), dtype=bool)
+    bloom = VID_FILTERS.get(space, tag)
+    if not len(NEGATIVE_CACHE) and bloom is None:
+        return misses
+    for i, vid in enumerate(vids):
+        misses[i] = (NEGATIVE_CACHE.is_miss(space, tag, vid, props)
+                     or (bloom is not None and vid not in bloom))
+    hits = int(misses.sum())
+    if hits:
+        metrics.record_cache("negative_cache", True, hits)
+    if hits < len(vids):
+        metrics.record_cache("negative_cache", False, len(vids) - hits)
+    return misses
+
+
+def record_fetch(space: str, tag: str, requested: Iterable, found: Iterable,
+                 empty: Optional[Dict[str, Iterable]] = None) -> None:
+    """记录一次FETCH PROP的结果
+
+    Args:
+        requested: 查询的VID
+        found: 结果中出现的VID
+        empty: {属性名: 该属性为空的VID}
+    """
+    missing = set(requested).difference(found)
+    if missing:
+        NEGATIVE_CACHE.add_missing(space, tag, missing)
+    for prop, vids in (empty or {}).items():
+        NEGATIVE_CACHE.add_empty(space, tag, vids, prop)
+
+
+def record_written(space: str, tag: str, vids: Sequence) -> None:
+    """顶点被写入：移出负缓存并加入VID过滤器"""
+    NEGATIVE_CACHE.invalidate(space, tag, vids)
+    VID_FILTERS.add(space, tag, vids)
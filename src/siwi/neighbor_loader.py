@@ -3,8 +3,11 @@ from typing import List, Dict, Any, Optional, Tuple, Union
 
 from torch_geometric.data import Data
 
+from siwi.log import get_logger
 from siwi.remote_backend import NebulaFeatureStore, NebulaGraphStore
 
+logger = get_logger(__name__)
+
 class SimpleNeighborLoader:
     """简化版的邻居加载器
     
@@ -39,7 +42,7 @@ class SimpleNeighborLoader:
         Returns:
             PyG Data对象
         """
-        print(f"为{len(seed_nodes)}个种子节点加载{num_hops}跳邻居")
+        logger.debug("为%d个种子节点加载%d跳邻居", len(seed_nodes), num_hops)
         
         if len(seed_nodes) == 0:
             # 如果没有种子节点，返回空数据
@@ -80,7 +83,7 @@ class SimpleNeighborLoader:
             if features.size(0) == num_nodes:
                 node_features = features
         except Exception as e:
-            print(f"无法获取节点特征: {e}")
+            logger.warning("无法获取节点特征: %s", e)
             # 使用子图中的特征
             for idx, vid in enumerate(subgraph['idx_to_vid']):
                 if vid in subgraph['node_features'] and 'embedding' in subgraph['node_features'][vid]:
@@ -0,0 +1,377 @@
+"""
+热点顶点的k跳邻域索引
+
+/api/v1/subgraph、/api/v1/pyg和每个训练epoch反复对同一批热门球员、球队采样1-2跳
+子图。NeighborhoodIndex为度数最高的top_n个顶点物化sample_subgraph的结果：每个邻域
+保存为VID列表加上按边类型划分的CSR片段（indptr、indices，int32），以及节点类型和特征。
+
+- SubgraphSampler.sample_subgraph的中心节点是热点顶点时先查索引，命中时不访问graphd；
+  未命中时正常采样并把结果加入索引，热点顶点上其他参数组合的邻域也会被物化
+- 经BulkWriter写入的边和顶点使包含两端顶点的邻域失效，后台只重新采样这些邻域
+- 超过SIWI_NHOOD_INDEX_TTL秒（默认600）的邻域视为过期，覆盖其他进程的写入
+- 索引按估算的字节数限制大小（SIWI_NHOOD_INDEX_MB，默认128），超过时淘汰最久未读取的邻域
+
+由索引返回的结果中同一类型的边按源节点排列（CSR顺序），节点编号、边集合和特征与
+直接采样相同。
+
+    build_index("basketballplayer", top_n=100)     # 同步物化
+    start_index_build("basketballplayer")           # 后台线程执行，读取SIWI_NHOOD_TOP_N
+"""
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import torch
+
+from siwi import metrics
+from siwi.connection import get_connection_pool
+from siwi.feature_store import NEBULA_GRAPH_SPACE, NEBULA_PASSWORD, NEBULA_USER
+from siwi.log import get_logger
+from siwi.warmup import DEFAULT_TAGS, rank_by_degree
+
+logger = get_logger(__name__)
+
+# 估算的内存占用（字节）：每个VID（含vid_to_idx和节点类型）、每个节点的特征
+_VID_BYTES = 160
+_FEATURE_BYTES = 320
+
+NHOOD_INDEX_BYTES = metrics.gauge(
+    "siwi_neighborhood_index_bytes",
+    "Estimated memory used by the materialized neighborhood index")
+NHOOD_INDEX_ENTRIES = metrics.gauge(
+    "siwi_neighborhood_index_entries",
+    "Neighborhoods materialized in the neighborhood index")
+NHOOD_INDEX_REFRESHES = metrics.counter(
+    "siwi_neighborhood_index_refreshes_total",
+    "Neighborhoods re-sampled after their vertices or edges changed")
+
+
+def _freeze(value):
+    """把采样参数转换为可哈希的键"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class _Fragment:
+    """一个物化的邻域：VID列表、按边类型的CSR片段、节点类型和特征"""
+
+    __slots__ = ("space", "center", "params", "vids", "center_idx", "type_names",
+                 "csr", "edge_attr", "attr_columns", "node_types", "node_features",
+                 "expires", "nbytes")
+
+    def __init__(self, space: str, center, params: Dict, result: Dict, ttl: float):
+        self.space = space
+        self.center = center
+        self.params = params
+        self.vids = list(result['idx_to_vid'])
+        self.center_idx = result['center_node_idx']
+        self.type_names = list(result['edge_type_names'])
+        self.attr_columns = [tuple(name.split(".", 1)) for name in result['edge_attr_names']]
+        self.node_types = dict(result['node_types'])
+        self.node_features = {vid: dict(features) for vid, features in result['node_features'].items()}
+        self.expires = time.monotonic() + ttl
+
+        num_nodes = len(self.vids)
+        edge_index = result['edge_index'].numpy()
+        edge_type = result['edge_type'].numpy()
+        # 按 (边类型, 源节点) 稳定排序，每种类型的边是一段连续的CSR
+        order = np.lexsort((edge_index[0], edge_type)) if edge_index.shape[1] else np.zeros(0, dtype=np.int64)
+        src = edge_index[0, order]
+        dst = edge_index[1, order]
+        counts = np.bincount(edge_type, minlength=len(self.type_names))
+        self.csr = []
+        start = 0
+        for count in counts.tolist():
+            type_src = src[start:start + count]
+            indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+            np.cumsum(np.bincount(type_src, minlength=num_nodes), out=indptr[1:])
+            self.csr.append((indptr, dst[start:start + count].astype(np.int32)))
+            start += count
+        edge_attr = result.get('edge_attr')
+        self.edge_attr = edge_attr.numpy()[order].copy() if edge_attr is not None else None
+
+        self.nbytes = (sum(indptr.nbytes + indices.nbytes for indptr, indices in self.csr)
+                       + (self.edge_attr.nbytes if self.edge_attr is not None else 0)
+                       + _VID_BYTES * num_nodes + _FEATURE_BYTES * len(self.node_features))
+
+    def to_result(self) -> Dict:
+        """重建sample_subgraph的结果字典"""
+        num_nodes = len(self.vids)
+        rows = [np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(indptr))
+                for indptr, _ in self.csr]
+        counts = [len(indices) for _, indices in self.csr]
+        if sum(counts):
+            edge_index = torch.from_numpy(np.stack([
+                np.concatenate(rows),
+                np.concatenate([indices for _, indices in self.csr]).astype(np.int64)]))
+        else:
+            edge_index = torch.zeros((2, 0), dtype=torch.long)
+        edge_type = torch.from_numpy(np.repeat(np.arange(len(counts), dtype=np.int64), counts))
+        edge_attr = torch.from_numpy(self.edge_attr.copy()) if self.edge_attr is not None else None
+
+        edge_indices = {}
+        edge_attr_by_type = {}
+        start = 0
+        for name, count in zip(self.type_names, counts):
+            edge_indices[name] = edge_index[:, start:start + count]
+            if edge_attr is not None:
+                columns = [i for i, (etype, _) in enumerate(self.attr_columns) if etype == name]
+                edge_attr_by_type[name] = edge_attr[start:start + count, columns]
+            start += count
+
+        return {
+            'center_node_idx': self.center_idx,
+            'edge_index': edge_index,
+            'num_nodes': num_nodes,
+            'vid_to_idx': {vid: idx for idx, vid in enumerate(self.vids)},
+            'idx_to_vid': list(self.vids),
+            'node_types': dict(self.node_types),
+            'edge_indices_by_type': edge_indices,
+            'edge_type': edge_type,
+            'edge_type_names': list(self.type_names),
+            'edge_attr': edge_attr,
+            'edge_attr_names': [f"{etype}.{prop}" for etype, prop in self.attr_columns],
+            'edge_attr_by_type': edge_attr_by_type,
+            'node_features': {vid: dict(features) for vid, features in self.node_features.items()},
+        }
+
+
+class NeighborhoodIndex:
+    """热点顶点的物化邻域
+
+    Args:
+        max_bytes: 估算内存占用的上限，默认读取SIWI_NHOOD_INDEX_MB
+        ttl: 邻域的有效期（秒），默认读取SIWI_NHOOD_INDEX_TTL
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes or int(float(os.environ.get("SIWI_NHOOD_INDEX_MB", 128)) * 2 ** 20)
+        self.ttl = float(os.environ.get("SIWI_NHOOD_INDEX_TTL", 600)) if ttl is None else ttl
+        # 物化邻域的中心节点 (space, vid)
+        self._hot: Set[Tuple] = set()
+        self._entries: "OrderedDict[Tuple, _Fragment]" = OrderedDict()
+        # (space, vid) -> 包含该顶点的邻域键
+        self._members: Dict[Tuple, Set[Tuple]] = {}
+        self.nbytes = 0
+        # 每次失效加一；采样开始之后发生过失效的结果不再加入索引
+        self.version = 0
+        self._lock = threading.Lock()
+        self._refresh_queue: "queue.Queue[Tuple[Tuple, Dict]]" = queue.Queue()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add_hot(self, space: str, vids: Iterable) -> None:
+        """把顶点标记为热点，之后以它们为中心的采样结果会被物化"""
+        with self._lock:
+            self._hot.update((space, vid) for vid in vids)
+
+    def is_hot(self, space: str, vid) -> bool:
+        return bool(self._hot) and (space, vid) in self._hot
+
+    @staticmethod
+    def key(space: str, center, params: Dict) -> Tuple:
+        """邻域的键：图空间、中心节点和影响结果的采样参数"""
+        return (space, center, _freeze(params))
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        """返回物化的采样结果，不存在或已过期时返回None"""
+        fragment = self._entries.get(key)
+        if fragment is not None and fragment.expires <= time.monotonic():
+            with self._lock:
+                self._discard(key)
+                self._update_gauges()
+            fragment = None
+        metrics.record_cache("neighborhood_index", fragment is not None)
+        if fragment is None:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return fragment.to_result()
+
+    def put(self, key: Tuple, params: Dict, result: Dict, version: int) -> bool:
+        """物化一次采样结果；采样期间发生过失效时放弃，返回是否加入"""
+        space, center, _ = key
+        if not self.is_hot(space, center):
+            return False
+        fragment = _Fragment(space, center, params, result, self.ttl)
+        with self._lock:
+            if version != self.version:
+                return False
+            self._discard(key)
+            self._entries[key] = fragment
+            self.nbytes += fragment.nbytes
+            for vid in fragment.vids or [center]:
+                self._members.setdefault((space, vid), set()).add(key)
+            while self.nbytes > self.max_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+            self._update_gauges()
+        return True
+
+    def _discard(self, key: Tuple) -> Optional[_Fragment]:
+        fragment = self._entries.pop(key, None)
+        if fragment is None:
+            return None
+        self.nbytes -= fragment.nbytes
+        for vid in fragment.vids or [fragment.center]:
+            keys = self._members.get((fragment.space, vid))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._members[(fragment.space, vid)]
+        return fragment
+
+    def _update_gauges(self) -> None:
+        NHOOD_INDEX_BYTES.set(self.nbytes)
+        NHOOD_INDEX_ENTRIES.set(len(self._entries))
+
+    def invalidate(self, space: str, vids: Iterable, refresh: bool = True) -> int:
+        """顶点或它们的边被写入后，移除包含这些顶点的邻域
+
+        Args:
+            space: 图空间
+            vids: 被写入的顶点（边的两端）
+            refresh: 是否在后台重新采样被移除的邻域
+
+        Returns:
+            移除的邻域数
+        """
+        if not self._entries:
+            return 0
+        removed = []
+        with self._lock:
+            self.version += 1
+            keys = set()
+            for vid in vids:
+                keys.update(self._members.get((space, vid), ()))
+            for key in keys:
+                fragment = self._discard(key)
+                if fragment is not None:
+                    removed.append((key, fragment.params))
+            self._update_gauges()
+        if refresh:
+            for item in removed:
+                self._schedule_refresh(item)
+        return len(removed)
+
+    def _schedule_refresh(self, item: Tuple[Tuple, Dict]) -> None:
+        self._refresh_queue.put(item)
+        with self._lock:
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(
+                    target=self._refresh_loop, name="siwi-nhood-refresh", daemon=True)
+                self._refresh_thread.start()
+
+    def _refresh_loop(self) -> None:
+        # 延迟导入：subgraph_sampler依赖本模块
+        from siwi.subgraph_sampler import SubgraphSampler
+        sampler = None
+        while True:
+            try:
+                (space, center, _), params = self._refresh_queue.get(timeout=1)
+            except queue.Empty:
+                return
+            try:
+                sampler = sampler or SubgraphSampler(get_connection_pool())
+                # 中心节点是热点顶点，采样结果由sample_subgraph重新加入索引
+                sampler.sample_subgraph(center_vid=center, space_name=space, **params)
+                NHOOD_INDEX_REFRESHES.inc()
+            except Exception as e:
+                logger.warning("重新采样%s的邻域失败: %s", center, e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._hot.clear()
+            self._entries.clear()
+            self._members.clear()
+            self.nbytes = 0
+            self.version += 1
+            self._update_gauges()
+
+
+NEIGHBORHOOD_INDEX = NeighborhoodIndex()
+
+
+def build_index(space_name: str = NEBULA_GRAPH_SPACE,
+                top_n: Optional[int] = None,
+                hops: Optional[Sequence[int]] = None,
+                tags: Sequence[str] = DEFAULT_TAGS,
+                workers: int = 4,
+                connection_pool=None,
+                index: Optional[NeighborhoodIndex] = None) -> int:
+    """按度数排名选出热点顶点，并物化它们的k跳邻域
+
+    Args:
+        space_name: 图空间名称
+        top_n: 热点顶点数，默认读取SIWI_NHOOD_TOP_N（0，不物化）
+        hops: 物化的跳数，默认读取SIWI_NHOOD_HOPS（"1,2"）
+        tags: 参与排名的标签
+        workers: 并发采样的线程数
+        connection_pool: 连接池，默认使用当前进程的连接池
+        index: 目标索引，默认为NEIGHBORHOOD_INDEX
+
+    Returns:
+        物化的邻域数
+    """
+    # 延迟导入：subgraph_sampler依赖本模块
+    from siwi.subgraph_sampler import SubgraphSampler
+
+    top_n = int(os.environ.get("SIWI_NHOOD_TOP_N", 0)) if top_n is None else top_n
+    if hops is None:
+        hops = [int(hop) for hop in os.environ.get("SIWI_NHOOD_HOPS", "1,2").split(",") if hop.strip()]
+    if top_n <= 0 or not hops:
+        return 0
+    pool = connection_pool or get_connection_pool()
+    index = index or NEIGHBORHOOD_INDEX
+
+    start = time.monotonic()
+    session = pool.get_session(NEBULA_USER, NEBULA_PASSWORD)
+    try:
+        vids = [vid for vid, _ in rank_by_degree(session, space_name, tags, top_n)]
+    finally:
+        session.release()
+    index.add_hot(space_name, vids)
+
+    local = threading.local()
+
+    def materialize(vid, n_hops: int) -> None:
+        sampler = getattr(local, "sampler", None)
+        if sampler is None:
+            sampler = local.sampler = SubgraphSampler(pool)
+        try:
+            sampler.sample_subgraph(center_vid=vid, n_hops=n_hops, space_name=space_name)
+        except Exception as e:
+            logger.warning("物化%s的%s跳邻域失败: %s", vid, n_hops, e)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="siwi-nhood") as executor:
+        for vid in vids:
+            for n_hops in hops:
+                # 往返次数计入调用方的track()
+                executor.submit(contextvars.copy_context().run, materialize, vid, n_hops)
+    logger.info("已物化%s个热点顶点的邻域: %s项，%s字节，耗时%.3fs",
+                len(vids), len(index), index.nbytes, time.monotonic() - start)
+    return len(index)
+
+
+def start_index_build(space_name: str = NEBULA_GRAPH_SPACE, **kwargs) -> threading.Thread:
+    """在后台线程中执行build_index，参数同build_index，立即返回线程"""
+    def run():
+        try:
+            build_index(space_name, **kwargs)
+        except Exception:
+            logger.exception("物化邻域索引失败")
+    thread = threading.Thread(target=run, name="siwi-nhood-build", daemon=True)
+    thread.start()
+    return thread
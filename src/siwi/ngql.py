@@ -0,0 +1,42 @@
+"""
+nGQL字面量格式化工具
+
+所有拼接到nGQL语句中的值都应经过这里，保证字符串正确转义。
+"""
+
+import math
+
+
+def quote(text: str) -> str:
+    """把字符串格式化为nGQL的双引号字面量"""
+    return '"' + str(text).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def format_literal(value) -> str:
+    """把Python值格式化为nGQL字面量
+
+    None以及NaN/Inf格式化为NULL，NebulaGraph不支持非有限浮点字面量
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return "NULL"
+        return repr(value)
+    return quote(value)
+
+
+def format_vid(vid) -> str:
+    """格式化VID：整数VID直接输出，其余按字符串加引号"""
+    if isinstance(vid, int) and not isinstance(vid, bool):
+        return str(vid)
+    return quote(vid)
+
+
+def format_vids(vids) -> str:
+    """格式化VID列表，用于FROM/ON等子句"""
+    return ", ".join(format_vid(vid) for vid in vids)
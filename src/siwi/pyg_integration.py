@@ -3,11 +3,17 @@ PyG与NebulaGraph集成模块
 提供了从NebulaGraph加载数据到PyG的工具
 """
 
+import os
+
 import torch
 from typing import List, Dict, Any, Optional, Tuple, Union
 
-from siwi.remote_backend import NebulaFeatureStore, NebulaGraphStore
+from siwi.log import get_logger
+from siwi.remote_backend import NebulaFeatureStore, NebulaGraphStore, PlaceholderVid
 from siwi.neighbor_loader import SimpleNeighborLoader
+from siwi.warmup import start_warmup
+
+logger = get_logger(__name__)
 
 class NebulaToTorch:
     """NebulaGraph到PyTorch的转换器
@@ -15,11 +21,14 @@ class NebulaToTorch:
     这个类是功能3的主要接口，提供了将NebulaGraph数据转换为PyG格式的方法
     """
     
-    def __init__(self, space_name: str = "basketballplayer"):
+    def __init__(self, space_name: str = "basketballplayer",
+                 warmup_top_k: Optional[int] = None):
         """初始化转换器
         
         Args:
             space_name: NebulaGraph图空间名称
+            warmup_top_k: 在后台预热度数最高的多少个顶点，默认读取SIWI_WARMUP_TOP_K，
+                为0时不预热
         """
         # ID映射：字符串ID到索引的映射和反向映射
         self.id_to_idx = {}
@@ -41,7 +50,12 @@ class NebulaToTorch:
             graph_store=self.graph_store
         )
         
-        print(f"NebulaToTorch初始化完成，连接到图空间: {space_name}")
+        if warmup_top_k is None:
+            warmup_top_k = int(os.environ.get("SIWI_WARMUP_TOP_K", 0))
+        if warmup_top_k > 0:
+            start_warmup(space_name, top_k=warmup_top_k)
+        
+        logger.info("NebulaToTorch初始化完成，连接到图空间: %s", space_name)
     
     def get_node_id_by_idx(self, idx: int) -> str:
         """根据索引获取节点ID
@@ -54,7 +68,8 @@ class NebulaToTorch:
         """
         if 0 <= idx < len(self.idx_to_id):
             return self.idx_to_id[idx]
-        return f"unknown{idx}"
+        # 占位VID，写回时被拒绝
+        return PlaceholderVid(f"unknown{idx}")
     
     def _get_or_add_id(self, node_id: str) -> int:
         """获取或添加节点ID映射
@@ -1,13 +1,56 @@
+import threading
+
 import torch
 from typing import List, Dict, Any, Optional, Tuple, Union
 import numpy as np
 
 
-from torch_geometric.data import GraphStore, FeatureStore
+from torch_geometric.data import GraphStore, FeatureStore, TensorAttr
 
 
-from siwi.feature_store import get_entity_embedding, get_nebula_connection_pool
+from siwi import metrics
+from siwi.bulk_writer import BulkWriteResult, BulkWriter, WriteBehindBuffer, unique_edges
+from siwi.coalescer import LookupCoalescer
+from siwi.decoder import column, decode_floats, decode_ints, decode_vids
+from siwi.disk_cache import DISK_CACHE
+from siwi.feature_store import NEBULA_PASSWORD, NEBULA_USER, get_nebula_connection_pool
+from siwi.log import get_logger
+from siwi.miss_cache import known_misses, record_fetch
+from siwi.ngql import format_vids
+from siwi.shm_cache import SHM_CACHE
+from siwi.space import is_int_vid_space
 from siwi.subgraph_sampler import SubgraphSampler
+from siwi.vertex_cache import VERTEX_CACHE, as_float
+
+logger = get_logger(__name__)
+
+
+class PlaceholderVid(str):
+    """没有对应真实顶点的占位VID
+
+    默认的 f"{group}{idx}" 映射和NebulaToTorch中未知索引的 unknown{idx} 都是占位VID：
+    读取时与普通字符串相同（查不到属性），写回时被拒绝，避免UPSERT/INSERT创建不存在的顶点。
+    """
+
+
+def _check_write_vids(vids: List[Any], what: str) -> None:
+    """写回前检查VID，存在占位VID时抛出ValueError，不写入任何行"""
+    placeholders = [vid for vid in vids if isinstance(vid, PlaceholderVid)]
+    if placeholders:
+        raise ValueError(
+            f"拒绝写回{what}: {len(placeholders)}个节点索引没有对应的VID（例如{placeholders[0]}），"
+            f"请设置id_mapper")
+
+
+def _align_int_vids(fetched: np.ndarray, requested: np.ndarray) -> np.ndarray:
+    """返回requested中每个VID在fetched中的行号，不存在时为-1"""
+    if not len(fetched):
+        return np.full(len(requested), -1, dtype=np.int64)
+    order = np.argsort(fetched, kind="stable")
+    positions = np.searchsorted(fetched[order], requested).clip(max=len(fetched) - 1)
+    rows = order[positions]
+    return np.where(fetched[rows] == requested, rows, -1)
+
 
 class NebulaFeatureStore(FeatureStore):
     """连接NebulaGraph和PyG的特征存储类
@@ -15,12 +58,26 @@ class NebulaFeatureStore(FeatureStore):
     这个类实现了PyG的FeatureStore接口，使PyG能够从NebulaGraph获取节点特征
     """
     
-    def __init__(self, space_name: str = "basketballplayer"):
+    WRITE_BACK_MODES = ("none", "sync", "behind")
+    # 不超过该节点数的单特征读取经合并器，与其他线程同时发出的读取合并为一条FETCH PROP
+    COALESCE_MAX_NODES = 32
+
+    def __init__(self, space_name: str = "basketballplayer",
+                 write_back: str = "none", write_mode: str = "upsert",
+                 coalesce: bool = True):
         """初始化NebulaFeatureStore
         
         Args:
             space_name: NebulaGraph图空间名称
+            write_back: 写入张量时如何写回NebulaGraph。"none"（默认）只保存在本地缓存，
+                "sync"同步批量写入，"behind"放入写后缓冲在后台写入。写回需要
+                id_mapper（或INT64 VID图空间）给出真实的VID，占位VID会被拒绝
+            write_mode: 批量写入模式，"upsert"或"insert"，见siwi.bulk_writer
+            coalesce: 是否合并多个线程同时发出的小规模特征读取，见siwi.coalescer
         """
+        write_back = write_back or "none"
+        if write_back not in self.WRITE_BACK_MODES:
+            raise ValueError(f"不支持的write_back: {write_back}，可选 {self.WRITE_BACK_MODES}")
         self.space_name = space_name
         self.connection_pool = get_nebula_connection_pool()
         # 存储临时张量数据的字典，用于实现写入功能
@@ -29,6 +86,37 @@ class NebulaFeatureStore(FeatureStore):
         self._tensor_attrs = {}
         # ID映射函数，默认为None，可在外部设置
         self.id_mapper = None
+        self.write_back = write_back
+        self.write_mode = write_mode
+        self.writer = BulkWriter(self.connection_pool, space_name)
+        self.write_buffer = WriteBehindBuffer(self.writer) if write_back == "behind" else None
+        # 最近一次同步写回的结果，包含逐批次的失败信息
+        self.last_write_result = None
+        self.coalesce = coalesce
+        # (节点类型, 特征名) -> LookupCoalescer
+        self._coalescers = {}
+        self._coalescers_lock = threading.Lock()
+
+    def _int_vids(self) -> bool:
+        """未设置id_mapper且图空间为INT64 VID时，节点索引直接作为VID"""
+        return self.id_mapper is None and is_int_vid_space(self.space_name, self.connection_pool)
+
+    def _index_to_vids(self, group: str, index: torch.Tensor) -> List[Any]:
+        """把节点索引转换为顶点ID"""
+        if self.id_mapper:
+            # 使用提供的ID映射函数
+            return [self.id_mapper(idx) for idx in index.tolist()]
+        if self._int_vids():
+            return index.tolist()
+        # 使用默认格式，只能用于读取
+        return [PlaceholderVid(f"{group}{idx}") for idx in index.tolist()]
+
+    @staticmethod
+    def tensor_props(name: str, dim: int) -> List[str]:
+        """特征张量列对应的属性名：一维特征对应name，多维特征对应name_0...name_{D-1}"""
+        if dim == 1:
+            return [name]
+        return [f"{name}_{i}" for i in range(dim)]
         
     def _get_tensor(self, group: str, name: str, index: Optional[torch.Tensor] = None) -> torch.Tensor:
         """获取指定节点的特征（内部方法）
@@ -41,46 +129,191 @@ class NebulaFeatureStore(FeatureStore):
         Returns:
             特征张量
         """
-        print(f"[内部]获取{group}节点的{name}特征，索引大小: {index.size() if index is not None else 'None'}")
+        logger.debug("[内部]获取%s节点的%s特征，索引大小: %s", group, name,
+                     index.size() if index is not None else None)
         
         # 检查是否存在于临时缓存中
         key = (group, name)
         if key in self._tensor_cache:
+            metrics.record_cache("tensor_cache", True)
             tensor_data = self._tensor_cache[key]
             if index is None:
                 return tensor_data
             return tensor_data[index]
+        metrics.record_cache("tensor_cache", False)
         
         # 如果未提供索引，返回空张量
         if index is None:
             return torch.tensor([], dtype=torch.float)
         
-        # 将索引转换为节点ID
-        if self.id_mapper:
-            # 使用提供的ID映射函数
-            node_ids = [self.id_mapper(idx.item()) for idx in index]
+        # 所有节点的特征用一条FETCH PROP读取，找不到的特征为0
+        if self.coalesce and index.numel() <= self.COALESCE_MAX_NODES:
+            return self._get_tensor_coalesced(group, name, index)
+        return self._fetch_properties(group, index, [name])[:, 0]
+
+    def _get_tensor_coalesced(self, group: str, name: str, index: torch.Tensor) -> torch.Tensor:
+        """经合并器读取少量节点的单个特征，找不到的特征为0"""
+        key = (group, name)
+        with self._coalescers_lock:
+            coalescer = self._coalescers.get(key)
+            if coalescer is None:
+                coalescer = self._coalescers[key] = LookupCoalescer(
+                    lambda vids: self._fetch_by_vids(group, name, vids),
+                    name=f"feature_store:{group}.{name}", default=0.0)
+        vids = self._index_to_vids(group, index)
+        # 本地确定不存在或特征为空的节点不经合并器查询
+        misses = known_misses(self.space_name, group, vids, [name])
+        cached = self._cached_rows(group, vids, [name])
+        if not misses.any() and not cached:
+            return torch.tensor(coalescer.get_many(vids), dtype=torch.float)
+        values = torch.zeros(len(vids), dtype=torch.float)
+        for i, vid in enumerate(vids):
+            row = cached.get(vid)
+            if row is not None:
+                values[i] = row[0]
+                misses[i] = True
+        hits = np.flatnonzero(~misses)
+        if len(hits):
+            values[torch.from_numpy(hits)] = torch.tensor(
+                coalescer.get_many([vids[i] for i in hits.tolist()]), dtype=torch.float)
+        return values
+
+    def _fetch_by_vids(self, group: str, name: str, vids: List[Any]) -> Dict[Any, float]:
+        """用一条FETCH PROP读取一组VID的单个特征，返回 {VID: 值}，非数值的特征不返回"""
+        # 读取之前的写入代数，读取期间有顶点被写入时不把旧值写入缓存
+        shm_generation = SHM_CACHE.generation()
+        disk_generation = DISK_CACHE.generation(self.space_name)
+        resp = self._execute_fetch(group, format_vids(vids), [name])
+        if not resp.is_succeeded():
+            raise RuntimeError(f"读取{group}节点的{name}特征失败: {resp.error_msg()}")
+        fetched_ids, _ = decode_vids(column(resp, 0))
+        values, valid = decode_floats(column(resp, 1))
+        record_fetch(self.space_name, group, vids, fetched_ids.tolist(),
+                     {name: fetched_ids[~valid].tolist()})
+        SHM_CACHE.put_features(self.space_name, group, name,
+                               fetched_ids[valid].tolist(), values[valid].tolist(), shm_generation)
+        DISK_CACHE.put_features(self.space_name, group, name,
+                                fetched_ids[valid].tolist(), values[valid].tolist(), disk_generation)
+        return {vid: float(value) for vid, value, ok in zip(fetched_ids, values, valid) if ok}
+
+    def _cached_rows(self, group: str, vids: List[Any], names: List[str]) -> Dict[Any, List[float]]:
+        """依次从siwi.vertex_cache、siwi.shm_cache和siwi.disk_cache中读取已缓存节点的属性，
+        返回 {VID: 属性值列表}
+
+        预热缓存中的节点没有该标签或属性不是数值时为0，与FETCH PROP的结果一致；
+        共享内存和磁盘缓存只返回所有属性都已缓存的节点。
+        """
+        rows = {}
+        if VERTEX_CACHE.has_vertices():
+            for vid in vids:
+                tags = VERTEX_CACHE.get_vertex(self.space_name, vid)
+                if tags is not None:
+                    props = tags.get(group, {})
+                    rows[vid] = [as_float(props.get(name)) or 0.0 for name in names]
+            metrics.record_cache("vertex_cache", True, len(rows))
+            if len(rows) < len(vids):
+                metrics.record_cache("vertex_cache", False, len(vids) - len(rows))
+        if SHM_CACHE.enabled and len(rows) < len(vids):
+            rows.update(SHM_CACHE.get_features(
+                self.space_name, group, [vid for vid in vids if vid not in rows], names))
+        if DISK_CACHE.enabled and len(rows) < len(vids):
+            shm_generation = SHM_CACHE.generation()
+            disk_rows = DISK_CACHE.get_features(
+                self.space_name, group, [vid for vid in vids if vid not in rows], names)
+            # 磁盘命中的行放入共享内存，同一台机器上的其他worker不再读取磁盘
+            for i, name in enumerate(names):
+                SHM_CACHE.put_features(self.space_name, group, name, list(disk_rows),
+                                       [row[i] for row in disk_rows.values()], shm_generation)
+            rows.update(disk_rows)
+        return rows
+
+    def _execute_fetch(self, group: str, vid_list: str, names: List[str]):
+        """执行 USE + FETCH PROP，YIELD id和names列出的属性"""
+        yield_props = ", ".join(f"properties(vertex).{name} AS {name}" for name in names)
+        query = (f"USE {self.space_name}; FETCH PROP ON {group} {vid_list} "
+                 f"YIELD id(vertex) AS id, {yield_props}")
+        session = self.connection_pool.get_session(NEBULA_USER, NEBULA_PASSWORD)
+        try:
+            return metrics.execute(session, query)
+        finally:
+            session.release()
+
+    def _fetch_properties(self, group: str, index: torch.Tensor, names: List[str]) -> torch.Tensor:
+        """用一条FETCH PROP读取一组节点在同一标签上的多个属性
+
+        YIELD中只包含names列出的属性（投影下推），USE与FETCH在同一次execute中发送。
+
+        Args:
+            group: 节点类型（标签）
+            index: 节点索引张量
+            names: 属性名列表
+
+        Returns:
+            [N, len(names)]的浮点张量，节点或属性不存在、属性不是数值时为0
+        """
+        values = torch.zeros((index.numel(), len(names)), dtype=torch.float)
+        if not index.numel():
+            return values
+
+        int_vids = self._int_vids()
+        if int_vids:
+            # INT64 VID：索引即VID，不生成逐节点的字符串
+            node_ids = index.cpu().numpy().astype(np.int64, copy=False)
+            unique_ids = np.unique(node_ids).tolist()
         else:
-            # 使用默认格式
-            node_ids = [f"{group}{idx.item()}" for idx in index]
-        
-        # 获取每个节点的特征
-        features = []
-        for node_id in node_ids:
-            # 调用功能1获取特征
-            embedding = get_entity_embedding(node_id, group, name)
-            
-            # 如果找不到特征，使用零向量
-            if embedding is None:
-                features.append(torch.tensor([0.0], dtype=torch.float))
-            else:
-                # 将特征转换为张量
-                features.append(torch.tensor([float(embedding)], dtype=torch.float))
-        
-        # 堆叠所有特征
-        if features:
-            return torch.cat(features, dim=0)
+            node_ids = self._index_to_vids(group, index)
+            unique_ids = list(dict.fromkeys(node_ids))
+        # 本地确定不存在或属性为空的节点不再查询，结果中为0
+        misses = known_misses(self.space_name, group, unique_ids, names)
+        if misses.any():
+            unique_ids = [vid for vid, miss in zip(unique_ids, misses.tolist()) if not miss]
+            if not unique_ids:
+                return values
+        # 预热缓存中的节点不再查询，与查询结果合并后一起对齐
+        cached = self._cached_rows(group, unique_ids, names)
+        if cached:
+            unique_ids = [vid for vid in unique_ids if vid not in cached]
+        cached_ids = np.array(list(cached), dtype=np.int64 if int_vids else object)
+        cached_table = np.array(list(cached.values()), dtype=np.float64).reshape(-1, len(names))
+
+        if unique_ids:
+            vid_list = ", ".join(map(str, unique_ids)) if int_vids else format_vids(unique_ids)
+            # 读取之前的写入代数，读取期间有顶点被写入时不把旧值写入缓存
+            shm_generation = SHM_CACHE.generation()
+            disk_generation = DISK_CACHE.generation(self.space_name)
+            resp = self._execute_fetch(group, vid_list, names)
+            if not resp.is_succeeded():
+                logger.warning("读取%s节点的%s特征失败: %s", group, names, resp.error_msg())
+                return values
+            # 按列解码，再把结果行按节点ID对齐到请求的顺序
+            decoded = [decode_floats(column(resp, i + 1)) for i in range(len(names))]
+            table = np.stack([data for data, _ in decoded], axis=1)
+            fetched_ids, _ = (decode_ints if int_vids else decode_vids)(column(resp, 0))
+            record_fetch(self.space_name, group, unique_ids, fetched_ids.tolist(),
+                         {name: fetched_ids[~valid].tolist()
+                          for name, (_, valid) in zip(names, decoded)})
+            for name, (data, valid) in zip(names, decoded):
+                SHM_CACHE.put_features(self.space_name, group, name,
+                                       fetched_ids[valid].tolist(), data[valid].tolist(),
+                                       shm_generation)
+                DISK_CACHE.put_features(self.space_name, group, name,
+                                        fetched_ids[valid].tolist(), data[valid].tolist(),
+                                        disk_generation)
+            if cached:
+                fetched_ids = np.concatenate([fetched_ids, cached_ids])
+                table = np.concatenate([table, cached_table])
         else:
-            return torch.zeros((len(node_ids), 1), dtype=torch.float)
+            fetched_ids, table = cached_ids, cached_table
+
+        if int_vids:
+            rows = _align_int_vids(fetched_ids, node_ids)
+        else:
+            row_of = {node_id: row for row, node_id in enumerate(fetched_ids)}
+            rows = np.fromiter((row_of.get(node_id, -1) for node_id in node_ids),
+                               dtype=np.int64, count=len(node_ids))
+        found = rows >= 0
+        values[torch.from_numpy(found)] = torch.from_numpy(table[rows[found]]).float()
+        return values
             
     def _get_tensor_size(self, group: str, name: str) -> Tuple[int, ...]:
         """获取张量的大小
@@ -92,7 +325,7 @@ class NebulaFeatureStore(FeatureStore):
         Returns:
             张量的大小（形状）
         """
-        print(f"获取{group}节点的{name}特征大小")
+        logger.debug("获取%s节点的%s特征大小", group, name)
         
         # 检查是否存在于临时缓存中
         key = (group, name)
@@ -115,7 +348,14 @@ class NebulaFeatureStore(FeatureStore):
         Returns:
             是否成功存储
         """
-        print(f"[内部]存储{group}节点的{name}特征，张量大小: {tensor.size()}")
+        logger.debug("[内部]存储%s节点的%s特征，张量大小: %s", group, name, tensor.size())
+        
+        # 先确定写回的VID，被拒绝时本地缓存也不修改
+        vids = None
+        if self.write_back != "none":
+            write_index = torch.arange(tensor.size(0)) if index is None else index
+            vids = self._index_to_vids(group, write_index)
+            _check_write_vids(vids, f"{group}节点的{name}特征")
         
         # 存储在临时缓存中（真实实现应将数据写入NebulaGraph）
         key = (group, name)
@@ -133,12 +373,56 @@ class NebulaFeatureStore(FeatureStore):
             if key not in self._tensor_cache:
                 # 如果还不存在该张量，先创建一个全零张量
                 # 注意：这是一个简化的实现，可能需要更复杂的处理
-                self._tensor_cache[key] = torch.zeros((max(index) + 1, tensor.size(1)), dtype=tensor.dtype)
+                self._tensor_cache[key] = torch.zeros((int(index.max()) + 1,) + tuple(tensor.shape[1:]), dtype=tensor.dtype)
             
             # 更新指定索引的值
             self._tensor_cache[key][index] = tensor
             
-        return True
+        if self.write_back == "none":
+            return True
+        return self._write_back(group, name, tensor, vids)
+
+    def _write_back(self, group: str, name: str, tensor: torch.Tensor,
+                    vids: List[Any]) -> bool:
+        """把[N, D]张量批量写回NebulaGraph
+
+        Args:
+            group: 节点类型（标签）
+            name: 特征名称
+            tensor: [N]或[N, D]张量
+            vids: 与张量各行对应的顶点ID
+
+        Returns:
+            同步写回时表示是否全部批次成功；写后缓冲模式下放入缓冲即返回True
+        """
+        rows = tensor.detach().cpu()
+        if rows.dim() == 1:
+            rows = rows.unsqueeze(1)
+        props = self.tensor_props(name, rows.size(1))
+        rows = rows.tolist()
+
+        if self.write_buffer is not None:
+            self.write_buffer.put(group, props, vids, rows, self.write_mode)
+            return True
+
+        result = self.writer.write_vertices(group, props, vids, rows, self.write_mode)
+        self.last_write_result = result
+        if not result.ok:
+            logger.error("写回%s节点的%s特征失败: %s行，%s个批次失败",
+                         group, name, len(result.failed_keys), len(result.failures))
+        return result.ok
+
+    def flush(self) -> BulkWriteResult:
+        """立即写入写后缓冲中的数据，未启用写后缓冲时返回空结果"""
+        if self.write_buffer is None:
+            return BulkWriteResult()
+        return self.write_buffer.flush()
+
+    def close(self) -> BulkWriteResult:
+        """停止写后缓冲并写入剩余数据"""
+        if self.write_buffer is None:
+            return BulkWriteResult()
+        return self.write_buffer.close()
         
     def _remove_tensor(self, group: str, name: str) -> bool:
         """移除张量（内部方法）
@@ -150,7 +434,7 @@ class NebulaFeatureStore(FeatureStore):
         Returns:
             是否成功移除
         """
-        print(f"[内部]移除{group}节点的{name}特征")
+        logger.debug("[内部]移除%s节点的%s特征", group, name)
         
         # 从临时缓存中移除
         key = (group, name)
@@ -171,7 +455,7 @@ class NebulaFeatureStore(FeatureStore):
         Returns:
             所有可用的张量属性，格式为{group: [attr1, attr2, ...]}
         """
-        print("获取所有张量属性")
+        logger.debug("获取所有张量属性")
         
         # 将set转换为list返回
         return {group: list(attrs) for group, attrs in self._tensor_attrs.items()}
@@ -187,10 +471,58 @@ class NebulaFeatureStore(FeatureStore):
         Returns:
             特征张量
         """
-        print(f"获取{group}节点的{name}特征，索引大小: {index.size() if index is not None else 'None'}")
+        logger.debug("获取%s节点的%s特征，索引大小: %s", group, name,
+                     index.size() if index is not None else None)
         
         # 调用内部方法
-        return self._get_tensor(group, name, index)
+        with metrics.track("get_tensor"):
+            return self._get_tensor(group, name, index)
+    
+    def multi_get_tensor(self, attrs: List[Union[TensorAttr, Tuple]],
+                         convert_type: bool = False) -> List[torch.Tensor]:
+        """批量获取多个特征张量
+        
+        同一节点类型、同一组节点上的多个特征合并为一条FETCH PROP，YIELD中只包含
+        请求的属性，每组不同的节点在每个标签上只需一次往返。本地缓存中已有的
+        特征直接从缓存读取。
+        
+        Args:
+            attrs: TensorAttr或 (group, name, index) 元组的列表
+            convert_type: 与PyG接口保持一致，返回的张量始终是torch.Tensor
+            
+        Returns:
+            与attrs一一对应的特征张量
+        """
+        with metrics.track("multi_get_tensor"):
+            return self._multi_get_tensor(attrs)
+
+    def _multi_get_tensor(self, attrs: List[Union[TensorAttr, Tuple]]) -> List[torch.Tensor]:
+        """批量获取多个特征张量（内部方法）"""
+        results = [None] * len(attrs)
+        # (节点类型, 索引内容) -> (索引, {特征名: [结果位置]})
+        requests = {}
+        for position, attr in enumerate(attrs):
+            if isinstance(attr, TensorAttr):
+                group, name = attr.group_name, attr.attr_name
+                index = attr.index if attr.is_set("index") else None
+            else:
+                group, name, index = (tuple(attr) + (None,))[:3]
+            if index is not None:
+                index = torch.as_tensor(index, dtype=torch.long)
+            if index is None or (group, name) in self._tensor_cache:
+                results[position] = self._get_tensor(group, name, index)
+                continue
+            metrics.record_cache("tensor_cache", False)
+            key = (group, index.cpu().numpy().tobytes())
+            _, names = requests.setdefault(key, (index, {}))
+            names.setdefault(name, []).append(position)
+
+        for (group, _), (index, names) in requests.items():
+            values = self._fetch_properties(group, index, list(names))
+            for column, positions in enumerate(names.values()):
+                for position in positions:
+                    results[position] = values[:, column]
+        return results
     
     def get_all(self, group: str, name: str) -> torch.Tensor:
         """获取所有节点的特征（不推荐用于大图）
@@ -202,7 +534,7 @@ class NebulaFeatureStore(FeatureStore):
         Returns:
             特征张量
         """
-        print(f"警告：尝试获取所有{group}节点的{name}特征，这在大图上可能很慢")
+        logger.warning("尝试获取所有%s节点的%s特征，这在大图上可能很慢", group, name)
         # 在实际应用中，您应该避免获取所有节点的特征
         return torch.tensor([], dtype=torch.float)
 
@@ -214,11 +546,18 @@ class NebulaGraphStore(GraphStore):
     这个类实现了PyG的GraphStore接口，使PyG能够从NebulaGraph获取图结构
     """
     
-    def __init__(self, space_name: str = "basketballplayer"):
+    def __init__(self, space_name: str = "basketballplayer",
+                 write_back: bool = False,
+                 write_batch_size: Optional[int] = None,
+                 write_workers: Optional[int] = None):
         """初始化NebulaGraphStore
         
         Args:
             space_name: NebulaGraph图空间名称
+            write_back: 写入边索引时是否写回NebulaGraph，默认False只保存在本地缓存。
+                写回需要id_mapper（或INT64 VID图空间）给出真实的VID，占位VID会被拒绝
+            write_batch_size: 每条INSERT EDGE语句的边数，默认读取SIWI_WRITE_BATCH_SIZE
+            write_workers: 并发写入的批次数，默认读取SIWI_WRITE_WORKERS
         """
         self.space_name = space_name
         self.connection_pool = get_nebula_connection_pool()
@@ -230,6 +569,24 @@ class NebulaGraphStore(GraphStore):
         self._edge_attrs = {}
         # ID映射函数，默认为None，可在外部设置
         self.id_mapper = None
+        self.write_back = write_back
+        self.writer = BulkWriter(self.connection_pool, space_name,
+                                 write_batch_size, write_workers)
+        # 最近一次写回的结果，包含逐批次的失败信息
+        self.last_write_result = None
+
+    def _int_vids(self) -> bool:
+        """未设置id_mapper且图空间为INT64 VID时，节点索引直接作为VID"""
+        return self.id_mapper is None and is_int_vid_space(self.space_name, self.connection_pool)
+
+    def _index_to_vid(self, idx: int):
+        """把节点索引转换为顶点ID"""
+        if self.id_mapper:
+            return self.id_mapper(idx)
+        if self._int_vids():
+            return idx
+        # 默认格式只能用于读取
+        return PlaceholderVid(idx)
     
     def get_edge_index(self, edge_type: Union[str, Tuple[str, str, str]], 
                       layout: str = "coo", 
@@ -246,10 +603,11 @@ class NebulaGraphStore(GraphStore):
         Returns:
             边索引张量，形状为[2, num_edges]
         """
-        print(f"获取{edge_type}类型的边，布局: {layout}")
+        logger.debug("获取%s类型的边，布局: %s", edge_type, layout)
         
         # 直接调用内部方法
-        return self._get_edge_index(edge_type, layout, size, index)
+        with metrics.track("get_edge_index"):
+            return self._get_edge_index(edge_type, layout, size, index)
     
     def get_all_edge_index(self, edge_type: Union[str, Tuple[str, str, str]], 
                           layout: str = "coo",
@@ -264,7 +622,7 @@ class NebulaGraphStore(GraphStore):
         Returns:
             边索引张量
         """
-        print(f"警告：尝试获取所有{edge_type}类型的边，这在大图上可能很慢")
+        logger.warning("尝试获取所有%s类型的边，这在大图上可能很慢", edge_type)
         return torch.zeros((2, 0), dtype=torch.long)
     
     def _get_edge_index(self, edge_type: Union[str, Tuple[str, str, str]], 
@@ -282,11 +640,12 @@ class NebulaGraphStore(GraphStore):
         Returns:
             边索引张量，形状为[2, num_edges]
         """
-        print(f"[内部]获取{edge_type}类型的边，布局: {layout}")
+        logger.debug("[内部]获取%s类型的边，布局: %s", edge_type, layout)
         
         # 检查是否存在于临时缓存中
         key = (edge_type, layout)
         if key in self._edge_cache:
+            metrics.record_cache("edge_cache", True)
             edge_data = self._edge_cache[key]
             if index is None:
                 return edge_data
@@ -295,10 +654,49 @@ class NebulaGraphStore(GraphStore):
             mask = (edge_data[0].unsqueeze(1) == src_indices).any(dim=1) & (edge_data[1].unsqueeze(1) == dst_indices).any(dim=1)
             return edge_data[:, mask]
         
+        metrics.record_cache("edge_cache", False)
+
         # 只支持COO格式
         if layout != "coo":
             raise NotImplementedError(f"不支持{layout}布局，只支持coo")
         
+        if index is None:
+            # 如果没有提供索引，返回空边集
+            return torch.zeros((2, 0), dtype=torch.long)
+        edge_index, _ = self._collect_edges(edge_type, index)
+        return edge_index
+
+    def get_edge_index_with_attr(self, edge_type: Union[str, Tuple[str, str, str]],
+                                 props: List[str],
+                                 index: Tuple[torch.Tensor, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """获取边索引以及对齐的边属性张量
+
+        边属性随拓扑在同一查询中取回，不再为每条边单独查询属性。
+
+        Args:
+            edge_type: 边类型，例如"follow"或("player", "follow", "player")
+            props: 需要取回的边属性列表，例如["degree"]
+            index: 源节点和目标节点索引
+
+        Returns:
+            (边索引张量[2, num_edges], 边属性张量[num_edges, len(props)])
+        """
+        edge_index, edge_attr = self._collect_edges(edge_type, index, props)
+        return edge_index, edge_attr
+
+    def _collect_edges(self, edge_type: Union[str, Tuple[str, str, str]],
+                       index: Tuple[torch.Tensor, torch.Tensor],
+                       props: Optional[List[str]] = None) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """从每个源节点的一跳子图中收集落在给定索引内的边
+
+        Args:
+            edge_type: 边类型
+            index: 源节点和目标节点索引
+            props: 可选的边属性列表，提供时同时返回对齐的边属性
+
+        Returns:
+            (边索引张量, 边属性张量或None)
+        """
         # 处理边类型
         if isinstance(edge_type, tuple) and len(edge_type) == 3:
             # 如果是(src_type, edge_name, dst_type)格式
@@ -307,100 +705,156 @@ class NebulaGraphStore(GraphStore):
             # 如果是字符串格式
             edge_name = edge_type
             src_type = dst_type = None
-        
-        # 如果提供了索引（源节点和目标节点）
-        if index is not None:
-            src_indices, dst_indices = index
-            
-            # 将索引转换为ID列表
-            if self.id_mapper:
-                # 使用提供的ID映射函数
-                src_ids = [self.id_mapper(idx.item()) for idx in src_indices]
-                dst_ids = [self.id_mapper(idx.item()) for idx in dst_indices]
-            else:
-                # 使用默认格式
-                src_ids = [str(idx.item()) for idx in src_indices]
-                dst_ids = [str(idx.item()) for idx in dst_indices]
-            
-            # 使用SubgraphSampler高效地收集边
-            edges = []
-            for src_idx, src_id in enumerate(src_ids):
-                # 从该源节点获取一跳子图
-                subgraph = self.sampler.sample_subgraph(
-                    center_vid=src_id,
-                    n_hops=1,
-                    space_name=self.space_name
-                )
-                
-                # 处理子图边
-                if 'edge_index' in subgraph and subgraph['edge_index'] is not None:
-                    edge_index = subgraph['edge_index']
-                    num_edges = edge_index.shape[1]
-                    
-                    # 提取有用的连接
-                    for i in range(num_edges):
-                        # 获取边的源和目标索引
-                        sub_src_idx = int(edge_index[0, i])
-                        sub_dst_idx = int(edge_index[1, i])
-                        
-                        # 获取实际ID
-                        sub_src_id = subgraph['idx_to_vid'][sub_src_idx]
-                        sub_dst_id = subgraph['idx_to_vid'][sub_dst_idx]
-                        
-                        # 只保留符合条件的边：源节点是src_id，目标节点在dst_ids中
-                        if sub_src_id == src_id and sub_dst_id in dst_ids:
-                            # 将边加入结果，使用输入索引
-                            dst_idx = dst_ids.index(sub_dst_id)
-                            edges.append((src_idx, dst_idx))
-            
-            # 如果没有边，返回空张量
-            if not edges:
-                return torch.zeros((2, 0), dtype=torch.long)
-            
-            # 构建边索引张量
-            edge_array = np.array(edges, dtype=np.int64).T
-            return torch.from_numpy(edge_array)
-            
-        else:
-            # 如果没有提供索引，返回空边集
-            return torch.zeros((2, 0), dtype=torch.long)
-    
+        edge_props = {edge_name: list(props)} if props else None
+
+        src_indices, dst_indices = index
+
+        # 将索引转换为ID列表
+        src_ids = [self._index_to_vid(idx) for idx in src_indices.tolist()]
+        dst_ids = [self._index_to_vid(idx) for idx in dst_indices.tolist()]
+        dst_positions = {}
+        for dst_idx, dst_id in enumerate(dst_ids):
+            dst_positions.setdefault(dst_id, dst_idx)
+
+        # 使用SubgraphSampler高效地收集边
+        edges = []
+        attrs = []
+        for src_idx, src_id in enumerate(src_ids):
+            adjacency = VERTEX_CACHE.get_adjacency(self.space_name, src_id) if props is None else None
+            if adjacency is not None:
+                # 预热缓存了一跳邻接的源节点不再采样，同一对节点的多条边（rank不同）只保留一条
+                metrics.record_cache("vertex_cache", True)
+                for dst_id in dict.fromkeys(
+                        dst for src, dst, etype, _ in adjacency
+                        if src == src_id and etype == edge_name):
+                    dst_idx = dst_positions.get(dst_id)
+                    if dst_idx is not None:
+                        edges.append((src_idx, dst_idx))
+                continue
+            # 从该源节点获取一跳子图，只沿该类型的出边遍历
+            subgraph = self.sampler.sample_subgraph(
+                center_vid=src_id,
+                n_hops=1,
+                space_name=self.space_name,
+                edge_props=edge_props,
+                edge_types=[edge_name],
+                direction="out"
+            )
+
+            # 处理子图边
+            if 'edge_index' in subgraph and subgraph['edge_index'] is not None:
+                edge_index = subgraph['edge_index']
+                edge_attr = subgraph.get('edge_attr')
+                idx_to_vid = subgraph['idx_to_vid']
+
+                # 提取有用的连接
+                for i, (sub_src_idx, sub_dst_idx) in enumerate(edge_index.t().tolist()):
+                    # 只保留符合条件的边：源节点是src_id，目标节点在dst_ids中
+                    if idx_to_vid[sub_src_idx] != src_id:
+                        continue
+                    dst_idx = dst_positions.get(idx_to_vid[sub_dst_idx])
+                    if dst_idx is None:
+                        continue
+                    # 将边加入结果，使用输入索引
+                    edges.append((src_idx, dst_idx))
+                    if edge_props is not None:
+                        attrs.append(edge_attr[i])
+
+        num_props = len(edge_props[edge_name]) if edge_props else 0
+        # 如果没有边，返回空张量
+        if not edges:
+            empty_attr = torch.zeros((0, num_props), dtype=torch.float) if edge_props else None
+            return torch.zeros((2, 0), dtype=torch.long), empty_attr
+
+        # 构建边索引张量
+        edge_array = np.array(edges, dtype=np.int64).T
+        edge_attr = torch.stack(attrs) if edge_props is not None else None
+        return torch.from_numpy(edge_array), edge_attr
+
     def _put_edge_index(self, edge_type: Union[str, Tuple[str, str, str]],
                       edge_index: torch.Tensor,
                       layout: str = "coo",
-                      size: Optional[Tuple[int, int]] = None) -> bool:
+                      size: Optional[Tuple[int, int]] = None,
+                      rank: Optional[torch.Tensor] = None,
+                      edge_attr: Optional[Dict[str, torch.Tensor]] = None,
+                      if_not_exists: bool = True) -> bool:
         """存储边索引（内部方法）
         
+        边索引中的节点索引经id_mapper转换为VID，去掉重复的边后按批次并发
+        执行INSERT EDGE写回NebulaGraph。
+        
         Args:
             edge_type: 边类型
-            edge_index: 边索引张量
+            edge_index: 边索引张量，形状为[2, num_edges]
             layout: 数据布局
             size: 图大小
+            rank: 可选的rank张量，形状为[num_edges]，默认为0
+            edge_attr: 可选的边属性，{属性名: 形状为[num_edges]的张量}
+            if_not_exists: 为True时跳过NebulaGraph中已存在的边
             
         Returns:
             是否成功存储
         """
-        print(f"[内部]存储{edge_type}类型的边，布局: {layout}")
+        logger.debug("[内部]存储%s类型的边，布局: %s", edge_type, layout)
         
         # 只支持COO格式
         if layout != "coo":
             raise NotImplementedError(f"不支持{layout}布局，只支持coo")
         
-        # 存储在临时缓存中（真实实现应将数据写入NebulaGraph）
-        key = (edge_type, layout)
-        self._edge_cache[key] = edge_index
-        
-        # 将边类型添加到属性列表中
         if isinstance(edge_type, tuple) and len(edge_type) == 3:
             src_type, edge_name, dst_type = edge_type
         else:
             edge_name = edge_type
             src_type = dst_type = None
         
+        # 先检查写回的VID，被拒绝时本地缓存也不修改
+        if self.write_back and not self._int_vids():
+            nodes = torch.unique(edge_index.detach().cpu()).tolist()
+            _check_write_vids([self._index_to_vid(idx) for idx in nodes], f"{edge_name}边")
+        
+        # 存储在临时缓存中
+        key = (edge_type, layout)
+        self._edge_cache[key] = edge_index
+        
         # 注册边类型
         self._edge_attrs[edge_name] = {'src_type': src_type, 'dst_type': dst_type}
         
-        return True
+        if not self.write_back:
+            return True
+        return self._write_edges(edge_name, edge_index, rank, edge_attr or {}, if_not_exists)
+
+    def _write_edges(self, edge_name: str, edge_index: torch.Tensor,
+                     rank: Optional[torch.Tensor],
+                     edge_attr: Dict[str, torch.Tensor],
+                     if_not_exists: bool) -> bool:
+        """把COO边索引批量写回NebulaGraph
+
+        Returns:
+            是否全部批次写入成功，失败信息见last_write_result
+        """
+        src = edge_index[0].detach().cpu().numpy()
+        dst = edge_index[1].detach().cpu().numpy()
+        if rank is None:
+            ranks = np.zeros(len(src), dtype=np.int64)
+        else:
+            ranks = rank.detach().cpu().numpy().astype(np.int64)
+        
+        # 同一批数据中重复的 (src, dst, rank) 只写一次，与已有边的重复由IF NOT EXISTS处理
+        first = unique_edges(src, dst, ranks)
+        if len(first) < len(src):
+            logger.info("%s: 去掉%s条重复边", edge_name, len(src) - len(first))
+        props = list(edge_attr)
+        columns = [edge_attr[prop].detach().cpu().numpy()[first] for prop in props]
+        
+        result = self.writer.write_edges(
+            edge_name, src[first], dst[first], ranks[first], props, columns,
+            vid_mapper=None if self._int_vids() else self._index_to_vid,
+            if_not_exists=if_not_exists)
+        self.last_write_result = result
+        if not result.ok:
+            logger.error("写回%s边失败: %s条，%s个批次失败",
+                         edge_name, len(result.failed_keys), len(result.failures))
+        return result.ok
     
     def _remove_edge_index(self, edge_type: Union[str, Tuple[str, str, str]],
                          layout: str = "coo") -> bool:
@@ -413,7 +867,7 @@ class NebulaGraphStore(GraphStore):
         Returns:
             是否成功移除
         """
-        print(f"[内部]移除{edge_type}类型的边，布局: {layout}")
+        logger.debug("[内部]移除%s类型的边，布局: %s", edge_type, layout)
         
         # 从临时缓存中移除
         key = (edge_type, layout)
@@ -439,7 +893,7 @@ class NebulaGraphStore(GraphStore):
         Returns:
             所有可用的边类型列表
         """
-        print("获取所有边属性")
+        logger.debug("获取所有边属性")
         
         # 将边类型转换为(src_type, edge_name, dst_type)格式或字符串格式
         edge_types = []
@@ -0,0 +1,379 @@
+"""
+多graphd的客户端路由
+
+NG_ENDPOINTS列出多个graphd时，nebula3的ConnectionPool按轮询分配连接，不感知延迟：
+一个变慢的graphd会拖住分到它上面的所有请求。RoutingConnectionPool为每个graphd
+维护一个独立的连接池，在它们之上实现相同的get_session/release接口：
+
+- 路由：每个graphd记录请求延迟的EWMA，请求发往 EWMA × (进行中的请求数 + 1) 最小
+  的健康节点；超过SIWI_ROUTE_EXPLORE秒（默认5）没有样本的节点接收下一个请求，
+  使恢复的节点重新被选中
+- 对冲：只读请求（FETCH、GO、GET SUBGRAPH、LOOKUP、MATCH……）在主节点上等待超过
+  该节点近期延迟的SIWI_HEDGE_PERCENTILE分位数（默认95）后，向次优节点发送一份相同的
+  请求，取先返回的结果。SIWI_HEDGE=0关闭
+- 故障转移：连续SIWI_ROUTE_FAILURES次（默认3）连接或执行异常后断路器打开，
+  SIWI_ROUTE_COOLDOWN秒（默认5）内不再路由到该节点；后台线程定期ping打开的节点，
+  连通后半开，下一次异常立即重新打开。只读请求在异常后改发到其他节点重试
+
+会话状态（USE的图空间）记录在路由会话中，请求换到另一个节点的会话时先补发USE。
+写请求不对冲也不重试，避免重复写入。等待对冲请求时不超过当前请求的截止时间
+（siwi.deadline），超时后抛出DeadlineExceeded，落后的请求在后台结束。
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from siwi import deadline, metrics
+from siwi.deadline import DeadlineExceeded
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+# EWMA的平滑系数
+_ALPHA = 0.2
+# 每个节点保留的延迟样本数，用于计算对冲的分位数
+_WINDOW = 256
+# 样本少于此数时使用SIWI_HEDGE_DELAY_MS作为对冲延迟
+_MIN_SAMPLES = 20
+
+_READ_VERBS = {"GO", "FETCH", "GET", "LOOKUP", "MATCH", "FIND", "SHOW", "DESCRIBE", "DESC", "YIELD"}
+_USE_RE = re.compile(r"(?:^|;)\s*USE\s+`?(\w+)`?\s*(?=;|$)", re.I)
+
+ROUTE_REQUESTS = metrics.counter(
+    "siwi_route_requests_total",
+    "Requests sent to each graphd endpoint, including hedges",
+    ("endpoint",))
+ROUTE_LATENCY = metrics.gauge(
+    "siwi_route_latency_ewma_seconds",
+    "EWMA of request latency per graphd endpoint",
+    ("endpoint",))
+ROUTE_FAILURES = metrics.counter(
+    "siwi_route_failures_total",
+    "Connection or execution failures per graphd endpoint",
+    ("endpoint",))
+ROUTE_BREAKER = metrics.gauge(
+    "siwi_route_breaker_open",
+    "Whether the circuit breaker of a graphd endpoint is open",
+    ("endpoint",))
+ROUTE_HEDGES = metrics.counter(
+    "siwi_route_hedges_total",
+    "Hedged read requests by which copy answered first (primary or hedge)",
+    ("winner",))
+
+
+def _statements(stmt: str) -> List[str]:
+    return [part.strip() for part in stmt.split(";") if part.strip()]
+
+
+def is_read_only(stmt: str) -> bool:
+    """语句（可以是 "USE x; ..." 形式的多条）是否只读，只读的请求可以对冲和重试"""
+    verbs = [part.split(None, 1)[0].upper() for part in _statements(stmt)]
+    verbs = [verb for verb in verbs if verb != "USE"]
+    return bool(verbs) and all(verb in _READ_VERBS for verb in verbs)
+
+
+def used_space(stmt: str) -> Optional[str]:
+    """语句中最后一个USE的图空间"""
+    spaces = _USE_RE.findall(stmt)
+    return spaces[-1] if spaces else None
+
+
+def _bounded(timeout: Optional[float]) -> Optional[float]:
+    """不超过当前请求剩余时间的等待时间"""
+    budget = deadline.remaining()
+    if budget is None:
+        return timeout
+    budget = max(budget, 0.0)
+    return budget if timeout is None else min(timeout, budget)
+
+
+class _Endpoint:
+    """一个graphd的连接池、延迟统计和断路器状态"""
+
+    def __init__(self, address: Tuple[str, int], pool):
+        self.address = address
+        self.name = f"{address[0]}:{address[1]}"
+        self.pool = pool
+        self.ewma: Optional[float] = None
+        self._samples: deque = deque(maxlen=_WINDOW)
+        self.inflight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_sample = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.open_until <= now
+
+    def score(self) -> float:
+        return (self.ewma or 0.0) * (self.inflight + 1)
+
+    def percentile(self, q: float) -> Optional[float]:
+        samples = sorted(self._samples)
+        if len(samples) < _MIN_SAMPLES:
+            return None
+        return samples[min(int(q / 100 * len(samples)), len(samples) - 1)]
+
+    def record(self, latency: float) -> None:
+        self.ewma = latency if self.ewma is None else self.ewma + _ALPHA * (latency - self.ewma)
+        self._samples.append(latency)
+        self.last_sample = time.monotonic()
+        ROUTE_LATENCY.set(self.ewma, endpoint=self.name)
+
+
+class RoutedSession:
+    """路由连接池返回的会话，实现Session的execute/release接口
+
+    每个节点上的底层会话在首次使用时创建，release时全部归还。
+    """
+
+    def __init__(self, router: "RoutingConnectionPool", user_name: str, password: str):
+        self._router = router
+        self._user_name = user_name
+        self._password = password
+        self.space: Optional[str] = None
+        # 节点 -> [(底层会话, 会话当前的图空间)]
+        self._idle: Dict[_Endpoint, List[Tuple]] = {}
+        self._released = False
+        self._lock = threading.Lock()
+
+    def execute(self, stmt: str):
+        result = self._router.execute(self, stmt)
+        space = used_space(stmt)
+        if space is not None and result.is_succeeded():
+            self.space = space
+        return result
+
+    def release(self) -> None:
+        with self._lock:
+            self._released = True
+            idle, self._idle = self._idle, {}
+        for sessions in idle.values():
+            for session, _ in sessions:
+                session.release()
+
+    def _acquire(self, endpoint: _Endpoint) -> Tuple:
+        with self._lock:
+            sessions = self._idle.get(endpoint)
+            if sessions:
+                return sessions.pop()
+        return endpoint.pool.get_session(self._user_name, self._password), None
+
+    def _give_back(self, endpoint: _Endpoint, session, space: Optional[str]) -> None:
+        # 对冲中落后的请求在调用方返回之后才结束，这时会话可能已经release
+        with self._lock:
+            if not self._released:
+                self._idle.setdefault(endpoint, []).append((session, space))
+                return
+        session.release()
+
+
+class RoutingConnectionPool:
+    """多个graphd连接池之上的延迟感知路由，实现ConnectionPool的get_session/close接口
+
+    Args:
+        pools: [(地址, 连接池)]，每个graphd一个连接池
+        hedge: 是否对冲只读请求，默认读取SIWI_HEDGE（1）
+        hedge_percentile: 对冲延迟取主节点近期延迟的分位数，默认读取SIWI_HEDGE_PERCENTILE
+        hedge_delay: 样本不足时的对冲延迟（秒），默认读取SIWI_HEDGE_DELAY_MS（50）
+        failure_threshold: 打开断路器的连续失败次数，默认读取SIWI_ROUTE_FAILURES
+        cooldown: 断路器打开的时间（秒），默认读取SIWI_ROUTE_COOLDOWN
+        explore: 没有样本的节点重新接收请求的间隔（秒），默认读取SIWI_ROUTE_EXPLORE
+        max_workers: 执行对冲请求的线程数，默认读取SIWI_HEDGE_WORKERS（32）
+    """
+
+    def __init__(self, pools: Sequence[Tuple[Tuple[str, int], object]],
+                 hedge: Optional[bool] = None,
+                 hedge_percentile: Optional[float] = None,
+                 hedge_delay: Optional[float] = None,
+                 failure_threshold: Optional[int] = None,
+                 cooldown: Optional[float] = None,
+                 explore: Optional[float] = None,
+                 max_workers: Optional[int] = None):
+        if not pools:
+            raise ValueError("至少需要一个graphd连接池")
+        self.endpoints = [_Endpoint(tuple(address), pool) for address, pool in pools]
+        self.hedge = os.environ.get("SIWI_HEDGE", "1") != "0" if hedge is None else hedge
+        self.hedge_percentile = (float(os.environ.get("SIWI_HEDGE_PERCENTILE", 95))
+                                 if hedge_percentile is None else hedge_percentile)
+        self.hedge_delay = (float(os.environ.get("SIWI_HEDGE_DELAY_MS", 50)) / 1000
+                            if hedge_delay is None else hedge_delay)
+        self.failure_threshold = failure_threshold or int(os.environ.get("SIWI_ROUTE_FAILURES", 3))
+        self.cooldown = float(os.environ.get("SIWI_ROUTE_COOLDOWN", 5)) if cooldown is None else cooldown
+        self.explore = float(os.environ.get("SIWI_ROUTE_EXPLORE", 5)) if explore is None else explore
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.environ.get("SIWI_HEDGE_WORKERS", 32)),
+            thread_name_prefix="siwi-hedge")
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        for endpoint in self.endpoints:
+            ROUTE_BREAKER.set(0, endpoint=endpoint.name)
+
+    # --- ConnectionPool接口 ---
+
+    def get_session(self, user_name: str = "root", password: str = "nebula",
+                    retry_connect: bool = True) -> RoutedSession:
+        return RoutedSession(self, user_name, password)
+
+    @contextmanager
+    def session_context(self, *args, **kwargs):
+        session = self.get_session(*args, **kwargs)
+        try:
+            yield session
+        finally:
+            session.release()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for endpoint in self.endpoints:
+            endpoint.pool.close()
+
+    # --- 路由 ---
+
+    def _choose(self, exclude: Sequence[_Endpoint] = ()) -> Optional[_Endpoint]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.available(now)]
+            # 所有节点的断路器都打开时仍然尝试，由异常决定结果
+            candidates = healthy or candidates
+            for endpoint in candidates:
+                if now - endpoint.last_sample > self.explore:
+                    # 探索之后立即视为有样本，避免同时到达的请求都发往该节点
+                    endpoint.last_sample = now
+                    return endpoint
+            return min(candidates, key=_Endpoint.score)
+
+    def _healthy_count(self) -> int:
+        now = time.monotonic()
+        return sum(endpoint.available(now) for endpoint in self.endpoints)
+
+    def execute(self, routed: RoutedSession, stmt: str):
+        """在选中的节点上执行语句；只读语句按需对冲，异常后改发到其他节点"""
+        primary = self._choose()
+        if not is_read_only(stmt):
+            return self._run(routed, primary, stmt)
+        if not self.hedge or self._healthy_count() < 2:
+            try:
+                return self._run(routed, primary, stmt)
+            except Exception:
+                fallback = self._choose(exclude=[primary])
+                if fallback is None:
+                    raise
+                logger.warning("graphd %s执行失败，改发到%s", primary.name, fallback.name)
+                return self._run(routed, fallback, stmt)
+        return self._execute_hedged(routed, primary, stmt)
+
+    def _execute_hedged(self, routed: RoutedSession, primary: _Endpoint, stmt: str):
+        first = self._executor.submit(self._run, routed, primary, stmt)
+        with self._lock:
+            delay = primary.percentile(self.hedge_percentile)
+        done, _ = wait([first], timeout=_bounded(self.hedge_delay if delay is None else delay))
+        if done and first.exception() is None:
+            return first.result()
+        if not done and deadline.expired():
+            # 落后的请求在后台结束后归还会话
+            raise DeadlineExceeded(f"等待graphd {primary.name}超过请求的截止时间")
+        secondary = self._choose(exclude=[primary])
+        if done:
+            # 主节点已经失败，不是对冲而是故障转移
+            logger.warning("graphd %s执行失败，改发到%s", primary.name, secondary.name)
+            return self._run(routed, secondary, stmt)
+        second = self._executor.submit(self._run, routed, secondary, stmt)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=_bounded(None), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("等待对冲请求超过请求的截止时间")
+            for future in done:
+                if future.exception() is None:
+                    ROUTE_HEDGES.inc(winner="primary" if future is first else "hedge")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _run(self, routed: RoutedSession, endpoint: _Endpoint, stmt: str):
+        ROUTE_REQUESTS.inc(endpoint=endpoint.name)
+        with self._lock:
+            endpoint.inflight += 1
+        start = time.perf_counter()
+        try:
+            session, space = routed._acquire(endpoint)
+            query = stmt
+            if routed.space is not None and space != routed.space and used_space(stmt) is None:
+                query = f"USE {routed.space}; {stmt}"
+            try:
+                result = session.execute(query)
+            except Exception:
+                session.release()
+                raise
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            raise
+        finally:
+            with self._lock:
+                endpoint.inflight -= 1
+        with self._lock:
+            endpoint.record(time.perf_counter() - start)
+            endpoint.failures = 0
+        routed._give_back(endpoint, session, used_space(query) or space)
+        return result
+
+    # --- 断路器 ---
+
+    def _record_failure(self, endpoint: _Endpoint, error: Exception) -> None:
+        ROUTE_FAILURES.inc(endpoint=endpoint.name)
+        with self._lock:
+            endpoint.failures += 1
+            if endpoint.failures < self.failure_threshold:
+                return
+            endpoint.open_until = time.monotonic() + self.cooldown
+            start_prober = self._prober is None or not self._prober.is_alive()
+            if start_prober:
+                self._prober = threading.Thread(
+                    target=self._probe_loop, name="siwi-route-probe", daemon=True)
+        ROUTE_BREAKER.set(1, endpoint=endpoint.name)
+        logger.warning("graphd %s连续失败%s次，断路器打开: %s",
+                       endpoint.name, endpoint.failures, error)
+        if start_prober:
+            self._prober.start()
+
+    def _probe_loop(self) -> None:
+        # 断路器打开期间定期ping，连通后半开：再失败一次立即重新打开
+        while not self._closed.wait(min(self.cooldown, 1.0)):
+            now = time.monotonic()
+            with self._lock:
+                opened = [e for e in self.endpoints if e.failures >= self.failure_threshold]
+            if not opened:
+                return
+            for endpoint in opened:
+                ping = getattr(endpoint.pool, "ping", None)
+                if ping is not None and not ping(endpoint.address):
+                    with self._lock:
+                        endpoint.open_until = now + self.cooldown
+                    continue
+                with self._lock:
+                    endpoint.open_until = 0.0
+                    endpoint.failures = self.failure_threshold - 1
+                    # 恢复的节点立即接收探索请求，重新建立延迟样本
+                    endpoint.last_sample = 0.0
+                ROUTE_BREAKER.set(0, endpoint=endpoint.name)
+                logger.info("graphd %s恢复连通，断路器半开", endpoint.name)
+
+    def stats(self) -> List[Dict]:
+        """每个节点的延迟、进行中的请求数和断路器状态"""
+        now = time.monotonic()
+        with self._lock:
+            return [{"endpoint": e.name, "ewma": e.ewma, "inflight": e.inflight,
+                     "failures": e.failures, "open": not e.available(now),
+                     "p95": e.percentile(95)} for e in self.endpoints]
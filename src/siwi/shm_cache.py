@@ -0,0 +1,345 @@
+"""
+跨进程共享内存特征缓存
+
+多个gunicorn worker或DataLoader worker各自查询并缓存同样的特征行，内存占用随进程数
+线性增长，一个worker读取过的特征对其他worker没有帮助。SharedFeatureCache把特征行
+保存在一块multiprocessing.shared_memory共享内存中，同一台机器上的所有进程按名称
+映射同一块内存：
+
+- 读取不加锁，直接在共享内存的NumPy视图上做向量化查找，不复制整个表
+- 写入（从graphd或磁盘缓存读到的特征）由任意进程完成，对所有进程立即可见
+- 共享内存大小固定（SIWI_SHM_CACHE_MB，默认0，不启用），进程数增加时不再增长
+
+表结构为组相联的哈希表：(图空间, 标签, VID, 属性名) 哈希为64位键，每个键落在一个
+组内的_WAYS个槽之一，组满时替换最早过期的槽。每个槽保存键、值（float64）和
+过期时间（SIWI_SHM_CACHE_TTL秒，默认600）。写入者先清除槽的键再写入值和键，
+读取者读出值之后再次确认键，读到写了一半的槽时按未命中处理。进程之间的写入用
+fcntl.flock互斥。
+
+头部的写入代数在每次invalidate()后加一。读取graphd之前取得generation()，写入时
+代数已经变化（读取期间有顶点被写入）的put_features不写入，旧值不会在失效之后回到缓存。
+
+共享内存按名称（SIWI_SHM_CACHE_NAME，默认siwi-features）查找，第一个使用的进程
+创建，之后的进程（包括重启的worker）直接映射。进程退出时不删除，由gunicorn
+master在on_exit中调用SHM_CACHE.unlink()删除。
+"""
+
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from siwi import metrics
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+# 每组的槽数
+_WAYS = 8
+# 每个槽的字节数：键、值、过期时间各8字节
+_SLOT_BYTES = 24
+# 头部：魔数、组数、条目数、替换次数、写入代数
+_HEADER_BYTES = 64
+_GENERATION = 4
+_MAGIC = 0x5349574953484D31  # "SIWISHM1"
+
+SHM_CACHE_ENTRIES = metrics.gauge(
+    "siwi_shm_cache_entries",
+    "Entries in the shared-memory feature cache")
+SHM_CACHE_EVICTIONS = metrics.counter(
+    "siwi_shm_cache_evictions_total",
+    "Entries replaced in the shared-memory feature cache")
+
+
+def _prefix_hash(space: str, tag: str, prop: str) -> np.uint64:
+    digest = hashlib.blake2b(f"{space}\0{tag}\0{prop}".encode("utf-8"), digest_size=8).digest()
+    return np.uint64(int.from_bytes(digest, "little"))
+
+
+def _vid_hashes(vids: Sequence) -> np.ndarray:
+    # 整数VID直接参与混合；字符串VID用blake2b，结果在不同进程之间一致（不使用hash()）
+    if len(vids) and isinstance(vids[0], (int, np.integer)) and not isinstance(vids[0], bool):
+        return np.asarray(vids, dtype=np.int64).view(np.uint64)
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(str(vid).encode("utf-8"), digest_size=8).digest(), "little")
+         for vid in vids), dtype=np.uint64, count=len(vids))
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    # splitmix64终结函数，uint64数组上的乘法按模2^64回绕
+    values = values.copy()
+    values ^= values >> np.uint64(30)
+    values *= np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> np.uint64(27)
+    values *= np.uint64(0x94D049BB133111EB)
+    values ^= values >> np.uint64(31)
+    # 0表示空槽
+    values[values == 0] = 1
+    return values
+
+
+def feature_keys(space: str, tag: str, prop: str, vids: Sequence) -> np.ndarray:
+    """(图空间, 标签, VID, 属性名) 的64位键，不同进程中相同"""
+    return _mix(_vid_hashes(vids) ^ _prefix_hash(space, tag, prop))
+
+
+class _Table:
+    """共享内存上的NumPy视图"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, nsets: int):
+        self.shm = shm
+        self.nsets = nsets
+        slots = nsets * _WAYS
+        self.header = np.ndarray((_HEADER_BYTES // 8,), dtype=np.uint64, buffer=shm.buf)
+        offset = _HEADER_BYTES
+        self.keys = np.ndarray((slots,), dtype=np.uint64, buffer=shm.buf, offset=offset)
+        offset += slots * 8
+        self.values = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += slots * 8
+        self.expires = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+
+    def slots(self, keys: np.ndarray) -> np.ndarray:
+        """每个键所在组的全部槽号，形状 [len(keys), _WAYS]"""
+        sets = (keys % np.uint64(self.nsets)).astype(np.int64)
+        return sets[:, None] * _WAYS + np.arange(_WAYS)
+
+
+class SharedFeatureCache:
+    """共享内存中的特征行缓存
+
+    Args:
+        name: 共享内存名称，默认读取SIWI_SHM_CACHE_NAME
+        size: 共享内存字节数，默认读取SIWI_SHM_CACHE_MB；为0时不启用，
+            所有读取返回未命中，写入被忽略。已存在的共享内存保持原大小
+        ttl: 每项的有效期（秒），默认读取SIWI_SHM_CACHE_TTL
+    """
+
+    def __init__(self, name: Optional[str] = None, size: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        self.name = name or os.environ.get("SIWI_SHM_CACHE_NAME", "siwi-features")
+        if size is None:
+            size = int(float(os.environ.get("SIWI_SHM_CACHE_MB", 0)) * 2 ** 20)
+        self.size = size
+        self.ttl = float(os.environ.get("SIWI_SHM_CACHE_TTL", 600)) if ttl is None else ttl
+        self._table: Optional[_Table] = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def open(self, name: str, size: int) -> None:
+        """改用名为name的共享内存（不存在时按size创建），之前映射的共享内存不再使用"""
+        self.close()
+        self.name = name
+        self.size = size
+
+    def close(self) -> None:
+        """解除映射并停用缓存，共享内存本身保留"""
+        with self._lock:
+            if self._table is not None:
+                table, self._table = self._table, None
+                del table.header, table.keys, table.values, table.expires
+                table.shm.close()
+            self.size = 0
+
+    def unlink(self) -> None:
+        """删除共享内存，已经映射它的进程仍可继续使用，直到解除映射"""
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+    # --- 映射与加锁 ---
+
+    def _flock(self):
+        # flock的锁属于打开的文件，fork之后的子进程与父进程共享同一个打开的文件，
+        # 因此每个进程重新打开锁文件
+        pid, handle = self._lock_file or (None, None)
+        if handle is None or pid != os.getpid():
+            path = os.path.join(tempfile.gettempdir(), f"{self.name}.lock")
+            handle = open(path, "a+b")
+            self._lock_file = (os.getpid(), handle)
+        return handle
+
+    @contextmanager
+    def _locked(self):
+        # 线程锁保证同一进程的线程互斥，flock保证进程之间互斥
+        with self._lock:
+            handle = self._flock()
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _attach(self) -> Optional[_Table]:
+        table = self._table
+        if table is not None or not self.enabled:
+            return table
+        with self._locked():
+            if self._table is not None:
+                return self._table
+            try:
+                self._table = self._map()
+            except (OSError, ValueError) as e:
+                logger.warning("映射共享内存缓存%s失败，停用: %s", self.name, e)
+                self.size = 0
+            return self._table
+
+    def _map(self) -> _Table:
+        # 持有flock时创建或映射，其他进程不会看到未初始化的头部
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+            created = False
+        except FileNotFoundError:
+            shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.size)
+            created = True
+        # resource_tracker会在进程退出时删除它登记的共享内存，
+        # 这里的共享内存属于所有worker，不交给它管理
+        resource_tracker.unregister(shm._name, "shared_memory")
+        header = np.ndarray((4,), dtype=np.uint64, buffer=shm.buf)
+        if created:
+            nsets = max((shm.size - _HEADER_BYTES) // (_SLOT_BYTES * _WAYS), 1)
+            header[:] = (_MAGIC, nsets, 0, 0)
+        elif header[0] != _MAGIC:
+            del header
+            shm.close()
+            raise ValueError("共享内存不是siwi的特征缓存")
+        nsets = int(header[1])
+        del header
+        logger.info("%s共享内存缓存%s: %s字节，%s个槽",
+                    "创建" if created else "映射", self.name, shm.size, nsets * _WAYS)
+        return _Table(shm, nsets)
+
+    # --- 读取 ---
+
+    def _lookup(self, table: _Table, keys: np.ndarray):
+        """返回 (值, 是否命中)，读取不加锁"""
+        slots = table.slots(keys)
+        match = table.keys[slots] == keys[:, None]
+        slot = slots[np.arange(len(keys)), match.argmax(axis=1)]
+        values = table.values[slot]
+        # 写入者先清除键再写值；读出值之后键仍然匹配说明值完整
+        hit = match.any(axis=1) & (table.expires[slot] > time.time()) & (table.keys[slot] == keys)
+        return values, hit
+
+    def get_features(self, space: str, tag: str, vids: Sequence,
+                     props: Sequence[str]) -> Dict[object, List[float]]:
+        """读取特征行，只返回props全部命中的VID: {VID: 与props对齐的值}"""
+        table = self._attach()
+        if table is None or not len(vids) or not props:
+            return {}
+        columns = []
+        found = np.ones(len(vids), dtype=bool)
+        for prop in props:
+            values, hit = self._lookup(table, feature_keys(space, tag, prop, vids))
+            columns.append(values)
+            found &= hit
+        hits = np.flatnonzero(found)
+        rows = {}
+        if len(hits):
+            table_rows = np.stack(columns, axis=1)[hits].tolist()
+            rows = {vids[i]: row for i, row in zip(hits.tolist(), table_rows)}
+            metrics.record_cache("shm_cache", True, len(rows))
+        if len(rows) < len(vids):
+            metrics.record_cache("shm_cache", False, len(vids) - len(rows))
+        return rows
+
+    # --- 写入 ---
+
+    def generation(self) -> int:
+        """当前的写入代数（所有进程共享），每次invalidate()后加一"""
+        table = self._attach()
+        return int(table.header[_GENERATION]) if table is not None else 0
+
+    def put_features(self, space: str, tag: str, prop: str,
+                     vids: Sequence, values: Iterable[float],
+                     generation: Optional[int] = None) -> None:
+        """写入一个属性的多个数值，对所有进程立即可见
+
+        generation为读取这些值之前的generation()；之后有顶点被写入时不写入。
+        """
+        table = self._attach()
+        if table is None or not len(vids):
+            return
+        keys, first = np.unique(feature_keys(space, tag, prop, vids), return_index=True)
+        values = np.asarray(list(values), dtype=np.float64)[first]
+        expires = time.time() + self.ttl
+        added = evicted = 0
+        with self._locked():
+            if generation is not None and int(table.header[_GENERATION]) != generation:
+                return
+            pending = np.arange(len(keys))
+            while len(pending):
+                ways = table.slots(keys[pending])
+                current = table.keys[ways]
+                match = current == keys[pending, None]
+                empty = current == 0
+                has_match = match.any(axis=1)
+                has_empty = empty.any(axis=1)
+                # 已有的槽 -> 空槽 -> 最早过期的槽
+                choice = np.where(has_match, match.argmax(axis=1),
+                                  np.where(has_empty, empty.argmax(axis=1),
+                                           table.expires[ways].argmin(axis=1)))
+                target = ways[np.arange(len(pending)), choice]
+                # 同一批中选中同一个槽的键只写入第一个，其余在下一轮重新选择
+                _, winners = np.unique(target, return_index=True)
+                rows, target = pending[winners], target[winners]
+                table.keys[target] = 0
+                table.values[target] = values[rows]
+                table.expires[target] = expires
+                table.keys[target] = keys[rows]
+                added += int((~has_match & has_empty)[winners].sum())
+                evicted += int((~has_match & ~has_empty)[winners].sum())
+                pending = np.delete(pending, winners)
+            table.header[2] += np.uint64(added)
+            table.header[3] += np.uint64(evicted)
+            entries = int(table.header[2])
+        SHM_CACHE_ENTRIES.set(entries)
+        if evicted:
+            SHM_CACHE_EVICTIONS.inc(evicted)
+
+    def invalidate(self, space: str, tag: str, vids: Sequence, props: Sequence[str]) -> None:
+        """顶点属性被写入后移除对应的项"""
+        table = self._attach()
+        if table is None or not len(vids):
+            return
+        removed = 0
+        with self._locked():
+            table.header[_GENERATION] += np.uint64(1)
+            for prop in props:
+                keys = feature_keys(space, tag, prop, vids)
+                slots = table.slots(keys)
+                stale = slots[table.keys[slots] == keys[:, None]]
+                table.keys[stale] = 0
+                removed += len(stale)
+            table.header[2] -= np.uint64(min(removed, int(table.header[2])))
+            entries = int(table.header[2])
+        SHM_CACHE_ENTRIES.set(entries)
+
+    def clear(self) -> None:
+        table = self._attach()
+        if table is None:
+            return
+        with self._locked():
+            table.keys[:] = 0
+            table.header[2] = 0
+        SHM_CACHE_ENTRIES.set(0)
+
+    def __len__(self) -> int:
+        table = self._attach()
+        return int(table.header[2]) if table is not None else 0
+
+
+SHM_CACHE = SharedFeatureCache()
@@ -0,0 +1,106 @@
+"""
+图空间元数据
+
+按图空间缓存VID类型（DESCRIBE SPACE的Vid Type列）。INT64 VID的图空间中，
+PyG的整数索引可以直接作为VID写入查询，结果也可以直接解码为整数数组，
+不需要在字符串VID和索引之间来回转换。
+
+查询失败（graphd不可达、图空间不存在）同样按图空间记录，
+SIWI_VID_TYPE_RETRY秒（默认30）之内直接返回DEFAULT_VID_TYPE，不再重复查询。
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from siwi import metrics
+from siwi.connection import get_connection_pool
+from siwi.deadline import DeadlineExceeded
+from siwi.decoder import column, decode_strings
+from siwi.feature_store import NEBULA_PASSWORD, NEBULA_USER
+from siwi.log import get_logger
+
+logger = get_logger(__name__)
+
+# 未能查询到VID类型时的假设
+DEFAULT_VID_TYPE = "FIXED_STRING"
+
+_vid_types: Dict[str, str] = {}
+# 图空间 -> 上次查询失败的时间（time.monotonic）
+_vid_type_failures: Dict[str, float] = {}
+_vid_types_lock = threading.Lock()
+
+
+def _record_failure(space_name: str) -> str:
+    with _vid_types_lock:
+        _vid_type_failures[space_name] = time.monotonic()
+    return DEFAULT_VID_TYPE
+
+
+def get_vid_type(space_name: str, connection_pool=None, session=None) -> str:
+    """查询图空间的VID类型，例如"INT64"或"FIXED_STRING(32)"
+
+    结果按图空间缓存，每个进程只查询一次；查询失败时返回DEFAULT_VID_TYPE，
+    SIWI_VID_TYPE_RETRY秒之后才会重新查询。截止时间用尽不算查询失败。
+
+    Args:
+        space_name: 图空间名称
+        connection_pool: 连接池，默认使用当前进程的连接池
+        session: 已有的会话，给出时直接使用，不另外获取会话
+
+    Returns:
+        VID类型字符串
+    """
+    vid_type = _vid_types.get(space_name)
+    if vid_type is not None:
+        return vid_type
+    failed_at = _vid_type_failures.get(space_name)
+    if (failed_at is not None and time.monotonic() - failed_at
+            < float(os.environ.get("SIWI_VID_TYPE_RETRY", 30))):
+        return DEFAULT_VID_TYPE
+
+    own_session = session is None
+    try:
+        if own_session:
+            session = (connection_pool or get_connection_pool()).get_session(
+                NEBULA_USER, NEBULA_PASSWORD)
+        try:
+            resp = metrics.execute(session, f"DESCRIBE SPACE {space_name}")
+        finally:
+            if own_session:
+                session.release()
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.warning("无法获取图空间%s的VID类型，按%s处理: %s",
+                       space_name, DEFAULT_VID_TYPE, e)
+        return _record_failure(space_name)
+    if not resp.is_succeeded() or "Vid Type" not in resp.keys():
+        logger.warning("无法获取图空间%s的VID类型，按%s处理: %s",
+                       space_name, DEFAULT_VID_TYPE, resp.error_msg())
+        return _record_failure(space_name)
+
+    vid_types, valid = decode_strings(column(resp, "Vid Type"))
+    if not len(vid_types) or not valid[0]:
+        return _record_failure(space_name)
+    with _vid_types_lock:
+        _vid_types[space_name] = vid_types[0]
+        _vid_type_failures.pop(space_name, None)
+    return vid_types[0]
+
+
+def is_int_vid_space(space_name: str, connection_pool=None, session=None) -> bool:
+    """图空间是否使用INT64 VID"""
+    return get_vid_type(space_name, connection_pool, session).upper().startswith("INT")
+
+
+def clear_vid_types(space_name: Optional[str] = None) -> None:
+    """清除缓存的VID类型，例如图空间被重建之后"""
+    with _vid_types_lock:
+        if space_name is None:
+            _vid_types.clear()
+            _vid_type_failures.clear()
+        else:
+            _vid_types.pop(space_name, None)
+            _vid_type_failures.pop(space_name, None)
@@ -1,9 +1,168 @@
+import itertools
+from operator import itemgetter
 import torch
 import numpy as np
-from typing import Dict, List, Tuple, Set, Union, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Set, Union, Optional
+from nebula3.common.ttypes import Value
 from nebula3.gclient.net import ConnectionPool
 
+from siwi import deadline, metrics
+from siwi.admission import ESTIMATOR
+from siwi.deadline import DeadlineExceeded
+from siwi.decoder import (
+    column, decode_floats, decode_ints, decode_lists, decode_scalars, decode_strings,
+    decode_vids)
 from siwi.feature_store import get_nebula_connection_pool
+from siwi.log import get_logger
+from siwi.ngql import format_vid, format_vids
+from siwi.disk_cache import DISK_CACHE, subgraph_key
+from siwi.neighborhood_index import NEIGHBORHOOD_INDEX
+from siwi.space import is_int_vid_space
+from siwi.vertex_cache import VERTEX_CACHE, as_float
+
+logger = get_logger(__name__)
+
+# 遍历方向，以及GO语句中对应的关键字
+DIRECTIONS = ("out", "in", "both")
+_GO_DIRECTION_KEYWORDS = {"out": "", "in": " REVERSELY", "both": " BIDIRECT"}
+
+# 每个图空间的边类型列表（SHOW EDGES），GET SUBGRAPH指定方向时需要列出边类型
+_space_edge_types: Dict[str, List[str]] = {}
+
+
+def _decode_vid(value: Value):
+    """把thrift Value形式的VID解码为字符串或整数"""
+    if value.getType() == Value.SVAL:
+        return value.get_sVal().decode("utf-8")
+    return value.get_iVal()
+
+
+def _decode_vid_column(values: List[Value]) -> np.ndarray:
+    """把VID列解码为数组：INT64 VID为int64数组，字符串VID为object数组"""
+    if values and values[0].field == Value.IVAL:
+        vids, valid = decode_ints(values)
+        if valid.all():
+            return vids
+    return decode_vids(values)[0]
+
+
+def _value_to_float(value: Value) -> float:
+    """把thrift Value形式的数值属性转换为浮点数，NULL等非数值返回0.0"""
+    value_type = value.getType()
+    if value_type == Value.FVAL:
+        return value.get_fVal()
+    if value_type == Value.IVAL:
+        return float(value.get_iVal())
+    if value_type == Value.BVAL:
+        return float(value.get_bVal())
+    return 0.0
+
+
+# 属性不存在时使用的EMPTY值
+_EMPTY_VALUE = Value()
+
+# 默认的节点特征投影：任意标签上的name和embedding1，标签为None表示不限标签
+_DEFAULT_NODE_COLUMNS = [(None, "name"), (None, "embedding1")]
+
+
+def _node_columns(node_attrs: Optional[Dict[str, List[str]]]) -> List[Tuple[Optional[str], str]]:
+    """把 {标签: [属性]} 投影展开为 [(标签, 属性)] 列，为None时使用默认投影"""
+    if node_attrs is None:
+        return list(_DEFAULT_NODE_COLUMNS)
+    return [(tag, prop) for tag, props in node_attrs.items() for prop in props]
+
+
+def _decode_node_columns(columns: List[Tuple[Optional[str], str]],
+                         column_values: List[List[Value]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """按投影列批量解码节点属性列
+
+    name解码为字符串（缺失为""），embedding1解码为浮点数，其他属性解码为Python标量。
+    """
+    decoded = []
+    for (_, prop), values in zip(columns, column_values):
+        if prop == "name":
+            decoded.append(decode_strings(values, fill=""))
+        elif prop == "embedding1":
+            decoded.append(decode_floats(values))
+        else:
+            decoded.append(decode_scalars(values))
+    return decoded
+
+
+def _node_features_at(node_type: Optional[str], columns: List[Tuple[Optional[str], str]],
+                      decoded: List[Tuple[np.ndarray, np.ndarray]], row: int) -> Dict:
+    """从批量解码的属性列中取出一个节点的特征
+
+    只使用不限标签或属于node_type标签的列。embedding1对应'embedding'张量
+    tensor([x])（不是数值时不包含），其他属性按属性名保存。
+    """
+    features = {}
+    for (tag, prop), (data, mask) in zip(columns, decoded):
+        if tag is not None and tag != node_type:
+            continue
+        if prop == "embedding1":
+            if mask[row]:
+                features['embedding'] = torch.tensor([data[row]], dtype=torch.float)
+        else:
+            features[prop] = data[row]
+    return features
+
+
+def _cached_node_features(node_type: str, columns: List[Tuple[Optional[str], str]],
+                          props: Dict) -> Dict:
+    """从预热缓存的属性中取出一个节点的特征，规则与_node_features_at相同"""
+    features = {}
+    for tag, prop in columns:
+        if tag is not None and tag != node_type:
+            continue
+        value = props.get(prop)
+        if prop == "embedding1":
+            value = as_float(value)
+            if value is not None:
+                features['embedding'] = torch.tensor([value], dtype=torch.float)
+        elif prop == "name":
+            features[prop] = value if isinstance(value, str) else ""
+        else:
+            features[prop] = value
+    return features
+
+
+def _vertex_yield(marker: str, alias: str, columns: List[Tuple[Optional[str], str]]) -> str:
+    """融合模式下GO语句为$^或$$附带的列：标签以及投影的属性"""
+    items = [f"tags({marker}) AS {alias}_tags"]
+    for tag, prop in columns:
+        if tag is None:
+            items.append(f"properties({marker}).{prop} AS {alias}_{prop}")
+        else:
+            items.append(f"{marker}.{tag}.{prop} AS {alias}_{tag}_{prop}")
+    return ", ".join(items)
+
+
+def _over_clause(edge_types: Optional[List[str]], direction: Optional[str]) -> str:
+    """生成GO语句的OVER子句，例如 OVER follow REVERSELY"""
+    over = ", ".join(edge_types) if edge_types else "*"
+    return f"OVER {over}{_GO_DIRECTION_KEYWORDS[direction or 'out']}"
+
+
+def _decode_edge(edge, attr_columns: Optional[List[Tuple[str, str]]] = None) -> Tuple:
+    """把thrift Edge解码为 (src_vid, dst_vid, edge_type[, 属性值元组])
+
+    type为负数表示从终点一侧读到的反向边，此时src和dst互换。
+    给出attr_columns（[(边类型, 属性名)]）时附加对齐的属性值，其他类型边的属性为0.0。
+    """
+    name = edge.name.decode("utf-8")
+    if edge.type < 0:
+        decoded = (_decode_vid(edge.dst), _decode_vid(edge.src), name)
+    else:
+        decoded = (_decode_vid(edge.src), _decode_vid(edge.dst), name)
+    if not attr_columns:
+        return decoded
+    props = edge.props or {}
+    attrs = tuple(
+        _value_to_float(props[prop.encode("utf-8")])
+        if etype == name and prop.encode("utf-8") in props else 0.0
+        for etype, prop in attr_columns)
+    return decoded + (attrs,)
 
 class SubgraphSampler:
     """从NebulaGraph中提取子图并转换为PyG可用的格式"""
@@ -21,15 +180,30 @@ class SubgraphSampler:
         self._idx_to_vid_map = []
         # 存储不同类型的边
         self._edge_indices = {}
+        # 边类型名称，以及与edge_index对齐的边类型编码
+        self._edge_type_names = []
+        self._edge_type = torch.zeros(0, dtype=torch.long)
+        # 与edge_index对齐的边属性，以及按边类型划分的边属性
+        self._edge_attr = None
+        self._edge_attr_by_type = {}
         # 节点类型信息
         self._node_types = {}
+        self._space_name = None
+        # 截止时间已过、跳过了部分查询
+        self._partial = False
     
     def sample_subgraph(self, 
                         center_vid: str, 
                         n_hops: int = 1, 
                         space_name: str = "basketballplayer",
                         use_bidirectional: bool = True,
-                        max_nodes: int = 1000) -> Dict:
+                        max_nodes: int = 1000,
+                        coalesce: bool = False,
+                        edge_props: Optional[Dict[str, List[str]]] = None,
+                        fused: bool = True,
+                        edge_types: Optional[List[str]] = None,
+                        direction: Optional[str] = None,
+                        node_attrs: Optional[Dict[str, List[str]]] = None) -> Dict:
         """从指定节点出发，采样n_hops跳的子图
         
         Args:
@@ -38,97 +212,245 @@ class SubgraphSampler:
             space_name: NebulaGraph图空间名称
             use_bidirectional: 是否生成双向边 (PyG通常期望无向图格式)
             max_nodes: 最大节点数限制，防止子图过大
+            coalesce: 是否去掉重复的边
+            edge_props: 在同一次遍历中读取的边属性，例如
+                {"follow": ["degree"], "serve": ["start_year", "end_year"]}，
+                结果中的edge_attr为与edge_index对齐的[num_edges, 属性数]张量
+            fused: 是否在遍历语句中同时读取节点标签和特征（融合模式），默认为True。
+                1-2跳时USE和一条GO 1 TO n STEPS合并为一次往返；更多跳时
+                GET SUBGRAPH使用WITH PROP，不再单独执行FETCH PROP。
+                为False时按遍历、逐节点查询标签、分批FETCH PROP三个阶段执行
+            edge_types: 只遍历这些边类型，例如["follow"]，由graphd在服务端过滤；
+                为None时遍历所有边类型
+            direction: 遍历方向，"out"、"in"或"both"，下推为GO的REVERSELY/BIDIRECT
+                以及GET SUBGRAPH的IN/OUT/BOTH；为None时GO沿出边、GET SUBGRAPH双向遍历。
+                边始终按实际方向（src(edge) -> dst(edge)）记录
+            node_attrs: 节点特征投影，例如 {"player": ["name", "age"], "team": ["name"]}，
+                只读取列出的属性，未列出的标签不读取特征；为None时读取所有标签的
+                name和embedding1。embedding1对应node_features中的'embedding'张量
             
         Returns:
-            包含子图信息的字典，可以直接用于构建PyG的Data对象
+            包含子图信息的字典，可以直接用于构建PyG的Data对象。请求的截止时间
+            （siwi.deadline）已过、跳过了剩余的跳数或特征批次时partial为True
         """
+        if direction is not None and direction not in DIRECTIONS:
+            raise ValueError(f"direction必须是{DIRECTIONS}之一: {direction!r}")
+        if edge_types is not None:
+            edge_types = list(edge_types)
+            unknown = [etype for etype in edge_props or {} if etype not in edge_types]
+            if unknown:
+                raise ValueError(f"edge_props中的边类型不在edge_types中: {unknown}")
+        attr_columns = [
+            (etype, prop) for etype, props in (edge_props or {}).items() for prop in props]
+        node_columns = _node_columns(node_attrs)
+        if (isinstance(center_vid, str) and center_vid.lstrip("-").isdigit()
+                and is_int_vid_space(space_name, self.connection_pool)):
+            # INT64 VID的图空间中，HTTP参数等给出的数字字符串按整数VID查询
+            center_vid = int(center_vid)
         # 重置状态
         self._vid_to_idx_map = {}
         self._idx_to_vid_map = []
         self._edge_indices = {}
+        self._edge_type_names = []
+        self._edge_type = torch.zeros(0, dtype=torch.long)
+        self._edge_attr = None
+        self._edge_attr_by_type = {}
         self._node_types = {}
+        self._space_name = space_name
+        self._partial = False
         
-        # 获取会话
-        session = self.connection_pool.get_session("root", "nebula")
-        try:
-            # 使用指定的图空间
-            session.execute(f"USE {space_name}")
+        params = dict(
+            n_hops=n_hops, use_bidirectional=use_bidirectional, max_nodes=max_nodes,
+            coalesce=coalesce, edge_props=edge_props, fused=fused,
+            edge_types=edge_types, direction=direction, node_attrs=node_attrs)
+        with metrics.track("sample_subgraph"):
+            # 热点顶点的物化邻域或磁盘缓存命中时直接返回，不访问graphd
+            cached, store = self._lookup_cached(space_name, center_vid, params)
+            if cached is not None:
+                self._restore_state(cached)
+                return cached
             
-            # 1. 获取子图数据
-            if n_hops <= 2:
-                # 对于小跳数使用GO语句
-                subgraph_data = self._get_subgraph_using_go(session, center_vid, n_hops, max_nodes)
-            else:
-                # 对于更大跳数使用GET SUBGRAPH
-                subgraph_data = self._get_subgraph_using_subgraph(session, center_vid, n_hops, max_nodes)
-            
-            # 2. 生成PyG格式的edge_index
-            edge_index = self._create_edge_index(subgraph_data['edges'], use_bidirectional)
-            
-            # 3. 获取相关节点的属性
-            node_features = self._get_node_features(session, subgraph_data['nodes'])
+            # 获取会话
+            session = self.connection_pool.get_session("root", "nebula")
+            try:
+                # 融合模式下USE与遍历语句合并发送，否则先单独切换图空间
+                use_space = space_name if fused else None
+                if not fused:
+                    metrics.execute(session, f"USE {space_name}")
+
+                # 1. 获取子图数据
+                with metrics.span("traverse"):
+                    if n_hops <= 2 and fused:
+                        # 一条GO语句同时返回拓扑和两端顶点的标签、特征
+                        subgraph_data = self._get_subgraph_fused(
+                            session, center_vid, n_hops, max_nodes, attr_columns, use_space,
+                            _over_clause(edge_types, direction), node_columns)
+                    elif n_hops <= 2:
+                        # 对于小跳数使用GO语句
+                        subgraph_data = self._get_subgraph_using_go(
+                            session, center_vid, n_hops, max_nodes, attr_columns,
+                            _over_clause(edge_types, direction))
+                    else:
+                        # 对于更大跳数使用GET SUBGRAPH
+                        edge_clause = ""
+                        if edge_types or direction:
+                            edge_types = edge_types or self._list_edge_types(
+                                session, space_name, use_space)
+                            edge_clause = f"{(direction or 'both').upper()} {', '.join(edge_types)} "
+                        subgraph_data = self._get_subgraph_using_subgraph(
+                            session, center_vid, n_hops, max_nodes, attr_columns, use_space,
+                            edge_clause, node_columns)
+
+                # 2. 生成PyG格式的edge_index（GET SUBGRAPH的结果在这里边解码边编码）
+                with metrics.span("edge_index_build"):
+                    edge_index = self._create_edge_index(
+                        subgraph_data['edges'], use_bidirectional, coalesce, attr_columns)
+
+                # 3. 获取相关节点的属性（融合模式下已随遍历返回）
+                with metrics.span("feature_fetch"):
+                    if 'features' in subgraph_data:
+                        node_features = subgraph_data['features']
+                    else:
+                        node_features = self._get_node_features(
+                            session, list(subgraph_data['nodes']), node_columns)
             
-            # 4. 构建结果字典
-            result = {
-                'center_node_idx': self._vid_to_idx_map.get(center_vid, 0),
-                'edge_index': edge_index,
-                'num_nodes': len(self._idx_to_vid_map),
-                'vid_to_idx': self._vid_to_idx_map.copy(),
-                'idx_to_vid': self._idx_to_vid_map.copy(),
-                'node_types': self._node_types,
-                'edge_indices_by_type': self._edge_indices,
-                'node_features': node_features
-            }
+                # 4. 构建结果字典
+                result = {
+                    'center_node_idx': self._vid_to_idx_map.get(center_vid, 0),
+                    'edge_index': edge_index,
+                    'num_nodes': len(self._idx_to_vid_map),
+                    'vid_to_idx': self._vid_to_idx_map.copy(),
+                    'idx_to_vid': self._idx_to_vid_map.copy(),
+                    'node_types': self._node_types,
+                    'edge_indices_by_type': self._edge_indices,
+                    'edge_type': self._edge_type,
+                    'edge_type_names': self._edge_type_names,
+                    'edge_attr': self._edge_attr,
+                    'edge_attr_names': [f"{etype}.{prop}" for etype, prop in attr_columns],
+                    'edge_attr_by_type': self._edge_attr_by_type,
+                    'node_features': node_features,
+                    'partial': self._partial
+                }
+                # 部分结果不缓存，也不作为代价估算的观测值
+                if not self._partial:
+                    ESTIMATOR.record(space_name, center_vid, n_hops,
+                                     edge_index.shape[1] // (2 if use_bidirectional else 1))
+                    if store is not None:
+                        store(result)
             
-            return result
+                return result
             
-        finally:
-            session.release()
+            finally:
+                session.release()
     
-    def _get_subgraph_using_go(self, session, center_vid: str, n_hops: int, max_nodes: int) -> Dict:
+    def _lookup_cached(self, space_name: str, center_vid, params: Dict):
+        """依次查询邻域索引（只对热点顶点）和磁盘缓存
+        
+        Returns:
+            (命中的结果或None, 未命中时把采样结果写入各层缓存的函数或None)
+        """
+        hot = NEIGHBORHOOD_INDEX.is_hot(space_name, center_vid)
+        if not hot and not DISK_CACHE.enabled:
+            return None, None
+        key = NEIGHBORHOOD_INDEX.key(space_name, center_vid, params)
+        # 在查询之前读取版本和代数，采样期间发生的写入使结果不被缓存
+        version = NEIGHBORHOOD_INDEX.version
+        if hot:
+            result = NEIGHBORHOOD_INDEX.get(key)
+            if result is not None:
+                return result, None
+        disk_key = None
+        if DISK_CACHE.enabled:
+            disk_key = subgraph_key(*key)
+            generation = DISK_CACHE.generation(space_name)
+            result = DISK_CACHE.get_subgraph(space_name, disk_key)
+            if result is not None:
+                if hot:
+                    NEIGHBORHOOD_INDEX.put(key, params, result, version)
+                return result, None
+        
+        def store(result: Dict) -> None:
+            if hot:
+                NEIGHBORHOOD_INDEX.put(key, params, result, version)
+            if disk_key is not None:
+                DISK_CACHE.put_subgraph(space_name, disk_key, result, generation)
+        return None, store
+    
+    def _out_of_time(self, force: bool = False) -> bool:
+        """请求的截止时间已过（或force）时把结果标记为部分结果，返回True"""
+        if force or deadline.expired():
+            self._partial = True
+            deadline.mark_partial()
+            return True
+        return False
+    
+    def _restore_state(self, result: Dict) -> None:
+        """从缓存返回的结果恢复采样状态"""
+        self._vid_to_idx_map = result['vid_to_idx'].copy()
+        self._idx_to_vid_map = list(result['idx_to_vid'])
+        self._edge_indices = result['edge_indices_by_type']
+        self._edge_type_names = result['edge_type_names']
+        self._edge_type = result['edge_type']
+        self._edge_attr = result['edge_attr']
+        self._edge_attr_by_type = result['edge_attr_by_type']
+        self._node_types = result['node_types']
+    
+    def _get_subgraph_using_go(self, session, center_vid: str, n_hops: int, max_nodes: int,
+                               attr_columns: Optional[List[Tuple[str, str]]] = None,
+                               over: str = "OVER *") -> Dict:
         """使用GO语句获取子图
         
-        适合1-2跳的小规模子图
+        适合1-2跳的小规模子图。给出attr_columns时在同一条GO语句中读取边属性。
+        over为OVER子句，边类型和方向由graphd过滤。
         """
         nodes = set([center_vid])
         edges = []
         
         # 获取中心节点的类型
-        type_query = f'MATCH (v) WHERE id(v) == "{center_vid}" RETURN labels(v) as types'
-        resp = session.execute(type_query)
-        if resp.is_succeeded() and resp.row_size() > 0:
-            node_types = resp.row_values(0)[0].as_list()
-            if node_types and not node_types[0].is_empty():
-                self._node_types[center_vid] = node_types[0].as_string()
+        self._lookup_node_type(session, center_vid)
+        
+        # 边属性列：<边类型>.<属性>，其他类型的边上为NULL
+        attr_yield = "".join(
+            f", {etype}.{prop} AS {etype}_{prop}" for etype, prop in attr_columns or ())
         
         # 对每一跳进行查询
         for hop in range(1, n_hops + 1):
-            # 获取所有外向边
+            # 截止时间已过时跳过剩余的跳数，返回已经取得的边
+            if hop > 1 and self._out_of_time():
+                break
+            # 获取该跳的边，src(edge)/dst(edge)为边的实际方向
             out_query = f'''
-            GO {hop} STEPS FROM "{center_vid}" OVER * 
-            YIELD DISTINCT id($^) as src, id($$) as dst, type(edge) as edge_type
+            GO {hop} STEPS FROM {format_vid(center_vid)} {over}
+            YIELD DISTINCT src(edge) as src, dst(edge) as dst, type(edge) as edge_type{attr_yield}
             '''
-            resp = session.execute(out_query)
+            try:
+                resp = metrics.execute(session, out_query)
+            except DeadlineExceeded:
+                if hop == 1:
+                    raise
+                self._out_of_time(force=True)
+                break
             
             if resp.is_succeeded():
-                for i in range(resp.row_size()):
-                    row = resp.row_values(i)
-                    src = row[0].as_string()
-                    dst = row[1].as_string()
-                    edge_type = row[2].as_string()
-                    
+                src_vids, _ = decode_vids(column(resp, 0))
+                dst_vids, _ = decode_vids(column(resp, 1))
+                edge_types, _ = decode_strings(column(resp, 2))
+                if attr_columns:
+                    attrs = np.stack([
+                        decode_floats(column(resp, 3 + i))[0]
+                        for i in range(len(attr_columns))], axis=1).tolist()
+                for i, (src, dst, edge_type) in enumerate(zip(src_vids, dst_vids, edge_types)):
                     nodes.add(src)
                     nodes.add(dst)
-                    edges.append((src, dst, edge_type))
+                    if attr_columns:
+                        edges.append((src, dst, edge_type, tuple(attrs[i])))
+                    else:
+                        edges.append((src, dst, edge_type))
                     
-                    # 获取目标节点的类型
-                    if dst not in self._node_types:
-                        type_query = f'MATCH (v) WHERE id(v) == "{dst}" RETURN labels(v) as types'
-                        type_resp = session.execute(type_query)
-                        if type_resp.is_succeeded() and type_resp.row_size() > 0:
-                            node_types = type_resp.row_values(0)[0].as_list()
-                            if node_types and not node_types[0].is_empty():
-                                self._node_types[dst] = node_types[0].as_string()
+                    # 获取新节点的类型（反向遍历时新节点是src）
+                    for vid in (src, dst):
+                        if vid not in self._node_types and not self._out_of_time():
+                            self._lookup_node_type(session, vid)
                     
                     # 检查是否超过节点数限制
                     if len(nodes) >= max_nodes:
@@ -143,57 +465,248 @@ class SubgraphSampler:
             'edges': edges
         }
     
-    def _get_subgraph_using_subgraph(self, session, center_vid: str, n_hops: int, max_nodes: int) -> Dict:
-        """使用GET SUBGRAPH语句获取子图
-        
-        适合更大规模的子图
+    def _lookup_node_type(self, session, vid) -> None:
+        """用MATCH查询单个节点的标签，第一个标签作为节点类型
+
+        预热缓存中的节点直接取缓存的第一个标签。
         """
-        # GET SUBGRAPH语句
-        query = f'''
-        GET SUBGRAPH {n_hops} STEPS FROM "{center_vid}" YIELD VERTICES AS nodes, EDGES AS relationships
-        '''
+        tags = VERTEX_CACHE.get_vertex(self._space_name, vid)
+        if tags:
+            metrics.record_cache("vertex_cache", True)
+            self._node_types[vid] = next(iter(tags))
+            return
+        type_query = f'MATCH (v) WHERE id(v) == {format_vid(vid)} RETURN labels(v) as types'
+        with metrics.span("tag_lookup"):
+            resp = metrics.execute(session, type_query)
+        node_types, _ = decode_lists(column(resp, 0), dtype=object, fill=None, width=1)
+        if len(node_types) and node_types[0, 0] is not None:
+            self._node_types[vid] = node_types[0, 0]
+    
+    def _list_edge_types(self, session, space_name: str,
+                         use_space: Optional[str] = None) -> List[str]:
+        """列出图空间中的所有边类型，结果按图空间缓存"""
+        edge_types = _space_edge_types.get(space_name)
+        if edge_types is None:
+            query = f"USE {use_space}; SHOW EDGES" if use_space else "SHOW EDGES"
+            resp = metrics.execute(session, query)
+            if not resp.is_succeeded():
+                raise RuntimeError(f"SHOW EDGES失败: {resp.error_msg()}")
+            edge_types = decode_strings(column(resp, 0))[0].tolist()
+            _space_edge_types[space_name] = edge_types
+        return edge_types
+    
+    def _get_subgraph_fused(self, session, center_vid: str, n_hops: int, max_nodes: int,
+                            attr_columns: Optional[List[Tuple[str, str]]] = None,
+                            use_space: Optional[str] = None,
+                            over: str = "OVER *",
+                            node_columns: Optional[List[Tuple[Optional[str], str]]] = None) -> Dict:
+        """融合遍历和属性读取，用一条GO 1 TO n STEPS语句获取1-n跳的子图
         
-        nodes = set([center_vid])
+        每条边同时返回$^和$$的标签以及node_columns投影的属性（默认为name和
+        embedding1），节点类型和特征直接从遍历结果中得到。给出use_space时USE与GO在同一次execute中发送，
+        整个采样只需一次往返。只有中心节点没有可遍历的边时才额外查询它的标签和特征。
+        
+        边按src(edge)/dst(edge)记录实际方向；双向遍历时同一条边可能从两端
+        各读到一次，按 (src, dst, 类型) 去重。
+        
+        Returns:
+            {'nodes': 有序dict, 'edges': 边列表, 'features': 节点特征}
+        """
+        nodes = {center_vid: None}
         edges = []
+        seen_edges = set()
+        features = {}
+        node_columns = node_columns or list(_DEFAULT_NODE_COLUMNS)
+        # 每个顶点占用的列数：id、标签、投影属性
+        width = 2 + len(node_columns)
         
-        resp = session.execute(query)
-        if resp.is_succeeded():
-            # 解析结果比较复杂，需要根据NebulaGraph的返回格式进行处理
-            # 此示例假设返回了一个可以按行遍历的结果集
-            for i in range(resp.row_size()):
-                row_data = resp.row_values(i)
-                
-                # 处理节点
-                # 注意: 这部分代码需要根据实际的返回格式调整
-                if row_data[0].is_vertex():
-                    vertex = row_data[0]
-                    vid = vertex.get_id().as_string()
-                    nodes.add(vid)
-                    
-                    # 获取节点类型
-                    node_type = vertex.tags()[0]  # 假设使用第一个tag作为节点类型
-                    self._node_types[vid] = node_type
-                
-                # 处理边
-                if len(row_data) > 1 and row_data[1].is_edge():
-                    edge = row_data[1]
-                    src = edge.get_src().as_string()
-                    dst = edge.get_dst().as_string()
-                    edge_type = edge.name()  # 边类型
-                    
-                    nodes.add(src)
-                    nodes.add(dst)
-                    edges.append((src, dst, edge_type))
-                
+        attr_yield = "".join(
+            f", {etype}.{prop} AS {etype}_{prop}" for etype, prop in attr_columns or ())
+        query = (
+            f"GO 1 TO {n_hops} STEPS FROM {format_vid(center_vid)} {over} "
+            f"YIELD DISTINCT src(edge) AS src, dst(edge) AS dst, type(edge) AS edge_type, "
+            f"id($^) AS from_id, {_vertex_yield('$^', 'from', node_columns)}, "
+            f"id($$) AS to_id, {_vertex_yield('$$', 'to', node_columns)}{attr_yield}")
+        if use_space:
+            query = f"USE {use_space}; {query}"
+        
+        resp = metrics.execute(session, query)
+        if not resp.is_succeeded():
+            logger.warning("融合GO查询失败: %s", resp.error_msg())
+        else:
+            # 按列解码，再按行决定接纳哪些边
+            src_vids = _decode_vid_column(column(resp, 0))
+            dst_vids = _decode_vid_column(column(resp, 1))
+            edge_types, _ = decode_strings(column(resp, 2))
+            keep = []
+            for i, edge in enumerate(zip(src_vids.tolist(), dst_vids.tolist(), edge_types)):
+                if edge in seen_edges:
+                    continue
+                seen_edges.add(edge)
+                nodes[edge[0]] = None
+                nodes[edge[1]] = None
+                keep.append(i)
                 # 检查是否超过节点数限制
                 if len(nodes) >= max_nodes:
                     break
-                    
+            
+            # INT64 VID保持为int64数组，由_encode_vids按数组编码
+            edges = {
+                'src': src_vids[keep],
+                'dst': dst_vids[keep],
+                'edge_type': edge_types[keep].tolist(),
+            }
+            if attr_columns:
+                edges['edge_attr'] = np.stack([
+                    decode_floats(column(resp, 3 + 2 * width + i))[0]
+                    for i in range(len(attr_columns))], axis=1)[keep]
+            
+            # 两端顶点（$^和$$）的标签和特征，每个顶点只解码一次
+            for offset in (3, 3 + width):
+                vids = _decode_vid_column(column(resp, offset)).tolist()
+                tags, _ = decode_lists(column(resp, offset + 1), dtype=object, fill=None, width=1)
+                decoded = _decode_node_columns(
+                    node_columns, [column(resp, offset + 2 + i) for i in range(len(node_columns))])
+                for i in keep:
+                    vid = vids[i]
+                    node_type = tags[i, 0]
+                    if vid in self._node_types or node_type is None:
+                        continue
+                    self._node_types[vid] = node_type
+                    vertex_features = _node_features_at(node_type, node_columns, decoded, i)
+                    if vertex_features:
+                        features[vid] = vertex_features
+        
+        if center_vid not in self._node_types:
+            # 中心节点没有可遍历的边时不会出现在$^中。遍历结果已经取得，
+            # 截止时间已过时返回部分结果而不是抛出DeadlineExceeded
+            try:
+                if not self._out_of_time():
+                    self._lookup_node_type(session, center_vid)
+                    features.update(self._get_node_features(session, [center_vid], node_columns))
+            except DeadlineExceeded:
+                self._out_of_time(force=True)
+        
         return {
-            'nodes': list(nodes),
-            'edges': edges
+            'nodes': nodes,
+            'edges': edges,
+            'features': features
         }
     
+    def _get_subgraph_using_subgraph(self, session, center_vid: str, n_hops: int, max_nodes: int,
+                                     attr_columns: Optional[List[Tuple[str, str]]] = None,
+                                     use_space: Optional[str] = None,
+                                     edge_clause: str = "",
+                                     node_columns: Optional[List[Tuple[Optional[str], str]]] = None) -> Dict:
+        """使用GET SUBGRAPH语句获取子图
+        
+        适合更大规模的子图。返回的edges是按步产生边批次的生成器，
+        nodes在生成器被消费的过程中填充，因此必须先构建edge_index再读取nodes。
+        给出attr_columns时使用WITH PROP，边属性随边一起返回。
+        给出use_space时为融合模式：USE与GET SUBGRAPH WITH PROP一起发送，
+        节点特征从返回的顶点属性中解码，结果中的features同样在消费edges时填充。
+        edge_clause为方向和边类型子句，例如 "OUT follow "，node_columns为节点特征投影。
+        """
+        # GET SUBGRAPH语句
+        with_prop = "WITH PROP " if attr_columns or use_space else ""
+        query = f'''
+        GET SUBGRAPH {with_prop}{n_hops} STEPS FROM {format_vid(center_vid)} {edge_clause}YIELD VERTICES AS nodes, EDGES AS relationships
+        '''
+        if use_space:
+            query = f"USE {use_space}; {query.strip()}"
+        
+        # 用dict作为有序集合，保持顶点的发现顺序
+        nodes = {center_vid: None}
+        features = {} if use_space else None
+        
+        resp = metrics.execute(session, query)
+        if not resp.is_succeeded():
+            logger.warning("GET SUBGRAPH失败: %s", resp.error_msg())
+            return {'nodes': nodes, 'edges': []}
+        
+        subgraph_data = {
+            'nodes': nodes,
+            'edges': self._iter_subgraph_steps(
+                resp.rows(), nodes, max_nodes, attr_columns, features,
+                node_columns or list(_DEFAULT_NODE_COLUMNS))
+        }
+        if features is not None:
+            subgraph_data['features'] = features
+        return subgraph_data
+    
+    def _iter_subgraph_steps(self, rows, nodes: Dict, max_nodes: int,
+                             attr_columns: Optional[List[Tuple[str, str]]] = None,
+                             features: Optional[Dict] = None,
+                             node_columns: Optional[List[Tuple[Optional[str], str]]] = None):
+        """逐步解码GET SUBGRAPH的结果，每步产生一批边 [(src_vid, dst_vid, edge_type)]
+        
+        GET SUBGRAPH每一行对应一步：第一列是该步的顶点列表，第二列是从这些
+        顶点出发的边列表，边的另一端出现在下一行的顶点列表中。因此每行的边
+        要等下一行的顶点加入后再产生，只保留两端都在nodes中的边。
+        
+        顶点按步加入nodes，达到max_nodes后不再加入新顶点；当前行的边处理完
+        即停止解码，后续步骤的顶点和边不会被解析。
+        
+        Args:
+            rows: ResultSet.rows()返回的thrift行
+            nodes: 已接纳的顶点（有序dict），原地更新
+            max_nodes: 最大节点数
+            attr_columns: 需要附加到每条边上的 [(边类型, 属性名)]
+            features: 给出时从顶点属性（WITH PROP）中解码已接纳顶点的特征，原地更新
+            node_columns: 解码特征时使用的投影列
+        """
+        pending = []
+        for row in rows:
+            truncated = False
+            vertices, edges = row.values[0], row.values[1]
+            # 本步新接纳顶点的属性值，按投影列收集后批量解码
+            feature_vids = []
+            feature_values = [[] for _ in node_columns or ()]
+            if vertices.getType() == Value.LVAL:
+                for value in vertices.get_lVal().values:
+                    vertex = value.get_vVal()
+                    vid = _decode_vid(vertex.vid)
+                    if vid not in nodes:
+                        if len(nodes) >= max_nodes:
+                            truncated = True
+                            continue
+                        nodes[vid] = None
+                    if vertex.tags and vid not in self._node_types:
+                        # 使用第一个tag作为节点类型
+                        self._node_types[vid] = vertex.tags[0].name.decode("utf-8")
+                    if features is not None and vertex.tags and vid not in features:
+                        tag_props = {tag.name.decode("utf-8"): tag.props or {} for tag in vertex.tags}
+                        merged = {}
+                        for props in reversed(list(tag_props.values())):
+                            merged.update(props)
+                        feature_vids.append(vid)
+                        for values, (tag, prop) in zip(feature_values, node_columns):
+                            props = merged if tag is None else tag_props.get(tag, {})
+                            values.append(props.get(prop.encode("utf-8"), _EMPTY_VALUE))
+            
+            if feature_vids:
+                decoded = _decode_node_columns(node_columns, feature_values)
+                for i, vid in enumerate(feature_vids):
+                    vertex_features = _node_features_at(
+                        self._node_types[vid], node_columns, decoded, i)
+                    if vertex_features:
+                        features[vid] = vertex_features
+            
+            batch = [edge for edge in pending if edge[0] in nodes and edge[1] in nodes]
+            if batch:
+                yield batch
+            
+            pending = []
+            if edges.getType() == Value.LVAL:
+                pending = [_decode_edge(value.get_eVal(), attr_columns)
+                           for value in edges.get_lVal().values]
+            if truncated:
+                break
+        
+        batch = [edge for edge in pending if edge[0] in nodes and edge[1] in nodes]
+        if batch:
+            yield batch
+    
     def _get_vid_idx(self, vid: str) -> int:
         """将VID映射为连续整数索引
         
@@ -205,68 +718,172 @@ class SubgraphSampler:
             self._idx_to_vid_map.append(vid)
         return self._vid_to_idx_map[vid]
     
+    def _encode_vids(self, vids: Union[List, np.ndarray]) -> np.ndarray:
+        """把VID列表批量编码为连续整数索引数组
+
+        索引按VID首次出现的顺序分配，与逐个调用_get_vid_idx的结果一致。
+        去重和查表都由dict.fromkeys/map在C层完成，不逐边执行Python代码。
+        INT64 VID的int64数组用np.unique去重，只对不同的VID执行查表。
+        """
+        vid_to_idx = self._vid_to_idx_map
+        if isinstance(vids, np.ndarray) and vids.dtype == np.int64:
+            unique, first, inverse = np.unique(vids, return_index=True, return_inverse=True)
+            unique = unique.tolist()
+            for position in np.argsort(first, kind="stable").tolist():
+                vid = unique[position]
+                if vid not in vid_to_idx:
+                    vid_to_idx[vid] = len(self._idx_to_vid_map)
+                    self._idx_to_vid_map.append(vid)
+            codes = np.fromiter(map(vid_to_idx.__getitem__, unique), dtype=np.int64, count=len(unique))
+            return codes[inverse.reshape(-1)]
+        for vid in dict.fromkeys(vids):
+            if vid not in vid_to_idx:
+                vid_to_idx[vid] = len(self._idx_to_vid_map)
+                self._idx_to_vid_map.append(vid)
+        return np.fromiter(map(vid_to_idx.__getitem__, vids), dtype=np.int64, count=len(vids))
+
+    @staticmethod
+    def _encode_categories(values: List, categories: Dict) -> np.ndarray:
+        """把类别列表编码为整数，类别按首次出现的顺序编号
+
+        Args:
+            values: 类别列表
+            categories: 已有的 {类别: 编码}，新类别原地追加
+        """
+        for value in dict.fromkeys(values):
+            if value not in categories:
+                categories[value] = len(categories)
+        return np.fromiter(map(categories.__getitem__, values), dtype=np.int64, count=len(values))
+
+    @staticmethod
+    def _edge_batches(edges, with_attr: bool) -> Iterator[Tuple[List, List, List, Optional[List]]]:
+        """把各种形式的边输入统一为 (src列, dst列, 类型列, 属性行) 批次"""
+        if isinstance(edges, dict):
+            yield edges['src'], edges['dst'], edges['edge_type'], edges.get('edge_attr')
+            return
+        if isinstance(edges, list):
+            edges = [edges]
+        for batch in edges:
+            yield (list(map(itemgetter(0), batch)),
+                   list(map(itemgetter(1), batch)),
+                   list(map(itemgetter(2), batch)),
+                   list(map(itemgetter(3), batch)) if with_attr else None)
+
     def _create_edge_index(self, 
-                          edges: List[Tuple[str, str, str]], 
-                          bidirectional: bool = True) -> torch.Tensor:
+                          edges: Union[List[Tuple[str, str, str]], Dict[str, List], Iterable[List[Tuple[str, str, str]]]], 
+                          bidirectional: bool = True,
+                          coalesce: bool = False,
+                          attr_columns: Optional[List[Tuple[str, str]]] = None) -> torch.Tensor:
         """将边列表转换为PyG格式的edge_index
         
+        按列构建：VID批量编码为整数，边类型编码为类别码，反向边由一次
+        flip/cat生成，再按边类型稳定排序，每种类型的edge_index是排序后
+        总edge_index的切片视图，不单独复制。
+        
         Args:
-            edges: 边列表，每个元素为 (src_vid, dst_vid, edge_type)
+            edges: 边列表，每个元素为 (src_vid, dst_vid, edge_type)；
+                也可以是按列给出的 {'src': [...], 'dst': [...], 'edge_type': [...]}，
+                或逐批产生边列表的生成器（每批到达即编码，不等待全部结果）
             bidirectional: 是否添加反向边
+            coalesce: 是否去掉重复的边（相同的源、目标和类型），
+                去重后每种类型内按 (src, dst) 排序
+            attr_columns: 边属性列 [(边类型, 属性名)]，此时每条边的第4个元素
+                （按列输入时为edge_attr）是对齐的属性值，结果保存在_edge_attr中
             
         Returns:
-            形状为[2, num_edges]的edge_index张量
+            形状为[2, num_edges]的edge_index张量，同类型的边相邻
         """
-        if not edges:
-            return torch.zeros((2, 0), dtype=torch.long)
+        self._edge_type_names = []
+        self._edge_type = torch.zeros(0, dtype=torch.long)
+        attr_columns = attr_columns or []
+        self._edge_attr = torch.zeros((0, len(attr_columns))) if attr_columns else None
+        self._edge_attr_by_type = {}
         
-        # 按边类型分组
-        edge_indices_by_type = {}
+        code_parts = []
+        type_parts = []
+        attr_parts = []
+        categories = {}
+        for src_vids, dst_vids, edge_types, attrs in self._edge_batches(edges, bool(attr_columns)):
+            if not len(src_vids):
+                continue
+            if attr_columns:
+                attr_parts.append(np.asarray(attrs, dtype=np.float32).reshape(-1, len(attr_columns)))
+            # 源和目标交替排列，保证索引按VID首次出现的顺序分配
+            if isinstance(src_vids, np.ndarray) and src_vids.dtype == np.int64:
+                pairs = np.stack((src_vids, dst_vids), axis=1).ravel()
+            else:
+                pairs = list(itertools.chain.from_iterable(zip(src_vids, dst_vids)))
+            code_parts.append(self._encode_vids(pairs))
+            type_parts.append(self._encode_categories(list(edge_types), categories))
         
-        # 处理所有边
-        for src_vid, dst_vid, edge_type in edges:
-            src_idx = self._get_vid_idx(src_vid)
-            dst_idx = self._get_vid_idx(dst_vid)
-            
-            # 按边类型存储边
-            if edge_type not in edge_indices_by_type:
-                edge_indices_by_type[edge_type] = []
-            
-            edge_indices_by_type[edge_type].append((src_idx, dst_idx))
-            
-            # 如果需要双向边，添加反向边
-            if bidirectional:
-                edge_indices_by_type[edge_type].append((dst_idx, src_idx))
+        if not code_parts:
+            return torch.zeros((2, 0), dtype=torch.long)
+        codes = np.concatenate(code_parts)
+        type_names = list(categories)
         
-        # 创建每种类型的edge_index
-        for edge_type, edge_list in edge_indices_by_type.items():
-            edge_array = np.array(edge_list, dtype=np.int64).T
-            self._edge_indices[edge_type] = torch.from_numpy(edge_array)
+        edge_index = torch.from_numpy(codes.reshape(-1, 2).T.copy())
+        edge_type = torch.from_numpy(np.concatenate(type_parts))
+        edge_attr = torch.from_numpy(np.concatenate(attr_parts)) if attr_columns else None
         
-        # 合并所有边类型创建总的edge_index
-        all_edges = []
-        for edge_list in edge_indices_by_type.values():
-            all_edges.extend(edge_list)
+        # 如果需要双向边，一次性添加所有反向边
+        if bidirectional:
+            edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+            edge_type = torch.cat([edge_type, edge_type])
+            if edge_attr is not None:
+                edge_attr = torch.cat([edge_attr, edge_attr])
         
-        if not all_edges:
-            return torch.zeros((2, 0), dtype=torch.long)
+        if coalesce:
+            num_nodes = len(self._idx_to_vid_map)
+            key = (edge_type * num_nodes + edge_index[0]) * num_nodes + edge_index[1]
+            key, perm = torch.sort(key, stable=True)
+            keep = torch.ones(len(key), dtype=torch.bool)
+            keep[1:] = key[1:] != key[:-1]
+            perm = perm[keep]
+        else:
+            perm = torch.argsort(edge_type, stable=True)
+        edge_index = edge_index[:, perm]
+        edge_type = edge_type[perm]
+        if edge_attr is not None:
+            edge_attr = edge_attr[perm]
+        
+        # 每种类型的edge_index是总edge_index的切片
+        counts = torch.bincount(edge_type, minlength=len(type_names)).tolist()
+        start = 0
+        for name, count in zip(type_names, counts):
+            self._edge_indices[name] = edge_index[:, start:start + count]
+            if edge_attr is not None:
+                # 每种类型只保留属于该类型的属性列
+                columns = [i for i, (etype, _) in enumerate(attr_columns) if etype == name]
+                self._edge_attr_by_type[name] = edge_attr[start:start + count, columns]
+            start += count
+        self._edge_type_names = type_names
+        self._edge_type = edge_type
+        self._edge_attr = edge_attr
         
-        # 转换为PyG期望的COO格式
-        edge_array = np.array(all_edges, dtype=np.int64).T
-        return torch.from_numpy(edge_array)
+        return edge_index
     
         # 确保正确缩进这个方法，使它成为类的一部分
-    def _get_node_features(self, session, node_vids: List[str]) -> Dict:
+    def _get_node_features(self, session, node_vids: List[str],
+                           node_columns: Optional[List[Tuple[Optional[str], str]]] = None) -> Dict:
         """获取节点的特征
         
-        尝试获取节点的embedding1特征
+        按节点类型分批FETCH PROP，YIELD中只包含node_columns投影中属于该类型的
+        属性（默认为name和embedding1）。预热缓存中的节点不再查询。
         """
         features = {}
+        node_columns = node_columns or list(_DEFAULT_NODE_COLUMNS)
         
         # 对于每个节点类型分别查询
         node_vids_by_type = {}
         for vid in node_vids:
             node_type = self._node_types.get(vid, 'unknown')
+            tags = VERTEX_CACHE.get_vertex(self._space_name, vid) if node_type != 'unknown' else None
+            if tags is not None:
+                metrics.record_cache("vertex_cache", True)
+                vertex_features = _cached_node_features(node_type, node_columns, tags.get(node_type, {}))
+                if vertex_features:
+                    features[vid] = vertex_features
+                continue
             if node_type not in node_vids_by_type:
                 node_vids_by_type[node_type] = []
             node_vids_by_type[node_type].append(vid)
@@ -275,46 +892,32 @@ class SubgraphSampler:
         for node_type, vids in node_vids_by_type.items():
             if node_type == 'unknown':
                 continue
+            props = [prop for tag, prop in node_columns if tag is None or tag == node_type]
+            if not props:
+                continue
+            type_columns = [(None, prop) for prop in props]
+            yield_props = ", ".join(f"properties(vertex).{prop} AS {prop}" for prop in props)
                 
             # 分批查询以避免查询过大
             batch_size = 100
             for i in range(0, len(vids), batch_size):
+                # 截止时间已过时剩余的节点没有特征
+                if self._out_of_time():
+                    return features
                 batch_vids = vids[i:i+batch_size]
-                vid_str = '", "'.join(batch_vids)
                 
                 query = f'''
-                FETCH PROP ON {node_type} "{vid_str}" 
-                YIELD id(vertex) AS id, properties(vertex).name AS name, 
-                      properties(vertex).embedding1 AS embedding
+                FETCH PROP ON {node_type} {format_vids(batch_vids)} 
+                YIELD id(vertex) AS id, {yield_props}
                 '''
                 
-                resp = session.execute(query)
+                resp = metrics.execute(session, query)
                 if resp.is_succeeded():
-                    for j in range(resp.row_size()):
-                        row = resp.row_values(j)
-                        vid = row[0].as_string()
-                        
-                        # 处理name字段
-                        name = ""
-                        if not row[1].is_empty() and row[1].is_string():
-                            name = row[1].as_string()
-                        
-                        # 初始化基本特征
-                        features[vid] = {'name': name}
-                        
-                        # 处理embedding字段 - 修复这里的错误处理
-                        if not row[2].is_empty():
-                            try:
-                                if row[2].is_double():
-                                    embedding = row[2].as_double()
-                                    features[vid]['embedding'] = torch.tensor([float(embedding)], dtype=torch.float)
-                                elif row[2].is_int():
-                                    # 如果是整数，转换为浮点数
-                                    embedding = float(row[2].as_int())
-                                    features[vid]['embedding'] = torch.tensor([embedding], dtype=torch.float)
-                                # 可以添加其他类型的处理...
-                            except Exception as e:
-                                print(f"无法转换节点 {vid} 的embedding1值: {e}")
+                    fetched_vids, _ = decode_vids(column(resp, 0))
+                    decoded = _decode_node_columns(
+                        type_columns, [column(resp, j + 1) for j in range(len(props))])
+                    for j, vid in enumerate(fetched_vids):
+                        features[vid] = _node_features_at(node_type, type_columns, decoded, j)
         
         return features
     
@@ -352,6 +955,9 @@ class SubgraphSampler:
                 center_node_idx=subgraph['center_node_idx']
             )
             
+            if subgraph.get('edge_attr') is not None:
+                data.edge_attr = subgraph['edge_attr']
+            
             # 存储VID映射，便于后续查询
             data.vid_to_idx = subgraph['vid_to_idx']
             data.idx_to_vid = subgraph['idx_to_vid']
@@ -359,5 +965,5 @@ class SubgraphSampler:
             return data
             
         except ImportError:
-            print("PyTorch Geometric未安装，无法创建Data对象")
+            logger.warning("PyTorch Geometric未安装，无法创建Data对象")
             return None
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""
+测试和基准测试工具
+
+fake_nebula 提供一个内存中的NebulaGraph替身，不需要运行graphd即可执行
+项目实际发出的nGQL语句。
+"""
+
+from siwi.testing.fake_nebula import (
+    FakeConnectionPool,
+    FakeSession,
+    SyntheticGraph,
+)
+
+__all__ = ["FakeConnectionPool", "FakeSession", "SyntheticGraph"]
@@ -0,0 +1,935 @@
+"""
+内存中的NebulaGraph替身
+
+SyntheticGraph 生成与basketballplayer结构相同的幂律图（player/team标签，
+follow/serve边），FakeConnectionPool / FakeSession 实现项目用到的
+ConnectionPool和Session接口，按nGQL语句在图上计算结果，并返回真实的
+nebula3 ResultSet，因此所有结果解析代码都能原样运行。
+
+支持的语句形态（即项目实际发出的语句）:
+    USE <space>
+    DESCRIBE SPACE <space>
+    SHOW EDGES
+    GO [<m> TO] <n> STEPS FROM <vids> OVER <types|*> [REVERSELY|BIDIRECT]
+        YIELD [DISTINCT] <exprs>
+    FETCH PROP ON <tags|*> <vids> YIELD <exprs>
+    LOOKUP ON <tag> YIELD id(vertex) [AS <alias>]
+    LOOKUP ON <tag> YIELD id(vertex) AS vid | GO FROM $-.vid OVER <types|*> BIDIRECT
+        YIELD $-.vid AS vid | GROUP BY $-.vid YIELD $-.vid AS vid, count(*) AS degree
+        | ORDER BY $-.degree DESC | LIMIT <n>
+    MATCH (v) WHERE id(v) == <vid> RETURN labels(v)
+    MATCH p=(v)-[e:<type>*1]->(v1) WHERE id(v) == <vid> RETURN p [LIMIT <n>]
+    GET SUBGRAPH [WITH PROP] <n> STEPS FROM <vids> [IN|OUT|BOTH <types>]
+        YIELD VERTICES AS <a>, EDGES AS <b>
+    FIND [NOLOOP|SHORTEST] PATH FROM <vid> TO <vid> OVER <types|*>
+        [REVERSELY|BIDIRECT] UPTO <n> STEPS YIELD path AS <p>
+    INSERT VERTEX [IF NOT EXISTS] <tag>(<props>) VALUES <vid>:(<values>), ...
+    UPSERT|UPDATE VERTEX ON <tag> <vid> SET <prop> = <value>, ...
+    INSERT EDGE [IF NOT EXISTS] <type>(<props>) VALUES <src>-><dst>[@<rank>]:(<values>), ...
+
+每次execute计为一次往返，可以注入固定延迟和随机抖动。
+"""
+
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from nebula3.common import ttypes
+from nebula3.data.ResultSet import ResultSet
+from nebula3.graph.ttypes import ExecutionResponse
+
+
+class FakeNebulaError(Exception):
+    """语句无法执行，返回给调用方的是失败的ResultSet"""
+
+
+class SyntheticGraph:
+    """合成的幂律图
+
+    follow边按优先连接生成，入度和出度都呈长尾分布；serve边从player连到team，
+    team的选择同样按优先连接，少数team拥有大量球员。
+    """
+
+    def __init__(self,
+                 num_players: int = 1000,
+                 num_teams: int = 30,
+                 follows_per_player: int = 3,
+                 serves_per_player: int = 2,
+                 seed: int = 0,
+                 space_name: str = "basketballplayer",
+                 vid_type: str = "FIXED_STRING(32)"):
+        self.space_name = space_name
+        # INT64时球员和球队的VID为整数：球员从100开始，球队紧随其后
+        self.vid_type = vid_type
+        self.tag_schema = {
+            "player": ["name", "age", "embedding1"],
+            "team": ["name"],
+        }
+        self.edge_schema = {
+            "follow": ["degree"],
+            "serve": ["start_year", "end_year"],
+        }
+        self.edge_type_ids = {"follow": 1, "serve": 2}
+        # vid -> {tag: {prop: value}}
+        self.vertices = {}
+        # vid -> [(edge_type, other_vid, rank, props)]
+        self.out_edges = {}
+        self.in_edges = {}
+        self._lock = threading.Lock()
+        self._generate(num_players, num_teams, follows_per_player,
+                       serves_per_player, random.Random(seed))
+
+    def _generate(self, num_players, num_teams, follows_per_player,
+                  serves_per_player, rng) -> None:
+        if self.vid_type.upper().startswith("INT"):
+            players = [100 + i for i in range(num_players)]
+            teams = [100 + num_players + i for i in range(num_teams)]
+        else:
+            players = [f"player{100 + i}" for i in range(num_players)]
+            teams = [f"team{200 + i}" for i in range(num_teams)]
+        for i, vid in enumerate(players):
+            self.add_vertex(vid, "player", {
+                "name": f"Player {100 + i}",
+                "age": rng.randint(20, 40),
+                "embedding1": rng.random(),
+            })
+        for i, vid in enumerate(teams):
+            self.add_vertex(vid, "team", {"name": f"Team {200 + i}"})
+
+        # 优先连接：节点在列表中出现的次数与度数成正比
+        attachment = []
+        for i, vid in enumerate(players):
+            # 用dict作有序集合，保证同一seed生成的图与哈希随机化无关
+            targets = {}
+            candidates = min(i, follows_per_player)
+            while len(targets) < candidates:
+                if attachment and rng.random() < 0.8:
+                    targets[rng.choice(attachment)] = None
+                else:
+                    targets[players[rng.randrange(i)]] = None
+            for target in targets:
+                src, dst = (vid, target) if rng.random() < 0.5 else (target, vid)
+                self.add_edge("follow", src, dst, 0,
+                              {"degree": rng.randint(0, 100)})
+                attachment.extend((vid, target))
+
+        team_attachment = []
+        for vid in players:
+            for _ in range(serves_per_player if teams else 0):
+                if team_attachment and rng.random() < 0.7:
+                    team = rng.choice(team_attachment)
+                else:
+                    team = rng.choice(teams)
+                start_year = rng.randint(1995, 2018)
+                self.add_edge("serve", vid, team, 0, {
+                    "start_year": start_year,
+                    "end_year": start_year + rng.randint(1, 6),
+                })
+                team_attachment.append(team)
+
+    def add_vertex(self, vid, tag: str, props: dict) -> None:
+        with self._lock:
+            self.vertices.setdefault(vid, {}).setdefault(tag, {}).update(props)
+            self.out_edges.setdefault(vid, [])
+            self.in_edges.setdefault(vid, [])
+
+    def add_edge(self, edge_type: str, src, dst, rank: int = 0,
+                 props: dict = None) -> bool:
+        """添加边，已存在同一 (type, src, dst, rank) 的边时覆盖属性，返回是否新建"""
+        props = dict(props or {})
+        with self._lock:
+            for vid in (src, dst):
+                self.vertices.setdefault(vid, {})
+                self.out_edges.setdefault(vid, [])
+                self.in_edges.setdefault(vid, [])
+            for index, (etype, other, erank, _) in enumerate(self.out_edges[src]):
+                if etype == edge_type and other == dst and erank == rank:
+                    self.out_edges[src][index] = (edge_type, dst, rank, props)
+                    for j, (itype, iother, irank, _) in enumerate(self.in_edges[dst]):
+                        if itype == edge_type and iother == src and irank == rank:
+                            self.in_edges[dst][j] = (edge_type, src, rank, props)
+                    return False
+            self.out_edges[src].append((edge_type, dst, rank, props))
+            self.in_edges[dst].append((edge_type, src, rank, props))
+            return True
+
+    def has_edge(self, edge_type: str, src, dst, rank: int = 0) -> bool:
+        return any(
+            etype == edge_type and other == dst and erank == rank
+            for etype, other, erank, _ in self.out_edges.get(src, ()))
+
+    def degree(self, vid) -> int:
+        return len(self.out_edges.get(vid, ())) + len(self.in_edges.get(vid, ()))
+
+    def hubs(self, k: int = 10, tag: str = None) -> list:
+        """度数最高的k个顶点，用于基准测试中的热点请求"""
+        vids = [
+            vid for vid, tags in self.vertices.items()
+            if tag is None or tag in tags]
+        return sorted(vids, key=self.degree, reverse=True)[:k]
+
+    def neighbors(self, vid, edge_types=None, direction: str = "out") -> list:
+        """返回 [(edge_type, 邻居, rank, props, 是否反向)]"""
+        result = []
+        if direction in ("out", "both"):
+            for etype, other, rank, props in self.out_edges.get(vid, ()):
+                if edge_types is None or etype in edge_types:
+                    result.append((etype, other, rank, props, False))
+        if direction in ("in", "both"):
+            for etype, other, rank, props in self.in_edges.get(vid, ()):
+                if edge_types is None or etype in edge_types:
+                    result.append((etype, other, rank, props, True))
+        return result
+
+
+# --- 值转换 ---
+
+class _VertexRef:
+    __slots__ = ("vid", "with_props")
+
+    def __init__(self, vid, with_props=True):
+        self.vid = vid
+        # GET SUBGRAPH不带WITH PROP时只返回标签名，不返回属性
+        self.with_props = with_props
+
+    def __repr__(self):
+        return f"V({self.vid!r})"
+
+
+class _EdgeRef:
+    __slots__ = ("edge_type", "src", "dst", "rank", "props", "reverse", "with_props")
+
+    def __init__(self, edge_type, src, dst, rank, props, reverse=False, with_props=True):
+        self.edge_type = edge_type
+        self.src = src
+        self.dst = dst
+        self.rank = rank
+        self.props = props
+        self.reverse = reverse
+        self.with_props = with_props
+
+    def __repr__(self):
+        return f"E({self.edge_type},{self.src!r},{self.dst!r},{self.rank})"
+
+
+class _PathRef:
+    __slots__ = ("start", "steps")
+
+    def __init__(self, start, steps):
+        # steps: [(_EdgeRef, 到达的vid)]
+        self.start = start
+        self.steps = steps
+
+    def __repr__(self):
+        return f"P({self.start!r},{self.steps!r})"
+
+
+def _vid_value(vid) -> ttypes.Value:
+    if isinstance(vid, int):
+        return ttypes.Value(iVal=vid)
+    return ttypes.Value(sVal=str(vid).encode("utf-8"))
+
+
+class _ValueEncoder:
+    def __init__(self, graph: SyntheticGraph):
+        self.graph = graph
+
+    def encode(self, value) -> ttypes.Value:
+        if value is None:
+            return ttypes.Value(nVal=ttypes.NullType.__NULL__)
+        if isinstance(value, bool):
+            return ttypes.Value(bVal=value)
+        if isinstance(value, int):
+            return ttypes.Value(iVal=value)
+        if isinstance(value, float):
+            return ttypes.Value(fVal=value)
+        if isinstance(value, str):
+            return ttypes.Value(sVal=value.encode("utf-8"))
+        if isinstance(value, (list, tuple)):
+            return ttypes.Value(lVal=ttypes.NList(
+                values=[self.encode(item) for item in value]))
+        if isinstance(value, dict):
+            return ttypes.Value(mVal=ttypes.NMap(kvs={
+                key.encode("utf-8"): self.encode(item)
+                for key, item in value.items()}))
+        if isinstance(value, _VertexRef):
+            return ttypes.Value(vVal=self.vertex(value.vid, value.with_props))
+        if isinstance(value, _EdgeRef):
+            return ttypes.Value(eVal=self.edge(value))
+        if isinstance(value, _PathRef):
+            return ttypes.Value(pVal=self.path(value))
+        raise TypeError(f"cannot encode {value!r}")
+
+    def _props(self, props: dict) -> dict:
+        return {
+            key.encode("utf-8"): self.encode(value)
+            for key, value in props.items()}
+
+    def vertex(self, vid, with_props: bool = True) -> ttypes.Vertex:
+        tags = self.graph.vertices.get(vid, {})
+        return ttypes.Vertex(
+            vid=_vid_value(vid),
+            tags=[
+                ttypes.Tag(name=tag.encode("utf-8"),
+                           props=self._props(props if with_props else {}))
+                for tag, props in tags.items()])
+
+    def edge(self, edge: _EdgeRef) -> ttypes.Edge:
+        return ttypes.Edge(
+            src=_vid_value(edge.src),
+            dst=_vid_value(edge.dst),
+            type=self.graph.edge_type_ids.get(edge.edge_type, 0),
+            name=edge.edge_type.encode("utf-8"),
+            ranking=edge.rank,
+            props=self._props(edge.props if edge.with_props else {}))
+
+    def path(self, path: _PathRef) -> ttypes.Path:
+        steps = []
+        for edge, reached in path.steps:
+            type_id = self.graph.edge_type_ids.get(edge.edge_type, 0)
+            steps.append(ttypes.Step(
+                dst=self.vertex(reached),
+                type=-type_id if edge.reverse else type_id,
+                name=edge.edge_type.encode("utf-8"),
+                ranking=edge.rank,
+                props=self._props(edge.props)))
+        return ttypes.Path(src=self.vertex(path.start), steps=steps)
+
+
+# --- 语句解析 ---
+
+_VID_LIST = r'(?:"(?:[^"\\]|\\.)*"|-?\d+)(?:\s*,\s*(?:"(?:[^"\\]|\\.)*"|-?\d+))*'
+
+_USE_RE = re.compile(r"^USE\s+(?P<space>\w+)$", re.I)
+_SHOW_EDGES_RE = re.compile(r"^SHOW\s+EDGES$", re.I)
+_LOOKUP_RE = re.compile(
+    r"^LOOKUP\s+ON\s+(?P<tag>\w+)\s+YIELD\s+id\(vertex\)(?:\s+AS\s+(?P<alias>\w+))?$", re.I)
+_DEGREE_RANK_RE = re.compile(
+    r"^LOOKUP\s+ON\s+(?P<tag>\w+)\s+YIELD\s+id\(vertex\)\s+AS\s+vid\s*"
+    r"\|\s*GO\s+FROM\s+\$-\.vid\s+OVER\s+(?P<over>[\w\s,*]+?)\s+BIDIRECT\s+YIELD\s+\$-\.vid\s+AS\s+vid\s*"
+    r"\|\s*GROUP\s+BY\s+\$-\.vid\s+YIELD\s+\$-\.vid\s+AS\s+vid,\s*count\(\*\)\s+AS\s+degree\s*"
+    r"\|\s*ORDER\s+BY\s+\$-\.degree\s+DESC\s*\|\s*LIMIT\s+(?P<limit>\d+)$", re.I)
+_DESCRIBE_SPACE_RE = re.compile(r"^(?:DESCRIBE|DESC)\s+SPACE\s+(?P<space>\w+)$", re.I)
+_GO_RE = re.compile(
+    r"^GO\s+(?:(?P<m>\d+)\s+TO\s+(?P<n>\d+)\s+STEPS?\s+|(?P<k>\d+)\s+STEPS?\s+)?"
+    r"FROM\s+(?P<vids>" + _VID_LIST + r")\s+"
+    r"OVER\s+(?P<over>\*|\w+(?:\s*,\s*\w+)*)"
+    r"(?:\s+(?P<direction>REVERSELY|BIDIRECT))?\s+"
+    r"YIELD\s+(?P<distinct>DISTINCT\s+)?(?P<yield>.+)$", re.I | re.S)
+_FETCH_RE = re.compile(
+    r"^FETCH\s+PROP\s+ON\s+(?P<tags>\*|\w+(?:\s*,\s*\w+)*)\s+"
+    r"(?P<vids>" + _VID_LIST + r")\s+YIELD\s+(?P<yield>.+)$", re.I | re.S)
+_MATCH_LABELS_RE = re.compile(
+    r'^MATCH\s+\(v\)\s+WHERE\s+id\(v\)\s*==\s*(?P<vid>"[^"]*"|-?\d+)\s+'
+    r"RETURN\s+labels\(v\)(?:\s+AS\s+\w+)?$", re.I | re.S)
+_MATCH_PATH_RE = re.compile(
+    r"^MATCH\s+p\s*=\s*\(v\)-\[e:(?P<etype>\w+)\*1\]->\(v1\)\s+"
+    r'WHERE\s+id\(v\)\s*==\s*(?P<vid>"[^"]*"|-?\d+)\s+'
+    r"RETURN\s+p(?:\s+LIMIT\s+(?P<limit>\d+))?$", re.I | re.S)
+_SUBGRAPH_RE = re.compile(
+    r"^GET\s+SUBGRAPH\s+(?P<with_prop>WITH\s+PROP\s+)?(?P<n>\d+)\s+STEPS?\s+"
+    r"FROM\s+(?P<vids>" + _VID_LIST + r")\s*"
+    r"(?:(?P<direction>IN|OUT|BOTH)\s+(?P<etypes>\w+(?:\s*,\s*\w+)*)\s+)?"
+    r"YIELD\s+(?P<yield>.+)$", re.I | re.S)
+_FIND_PATH_RE = re.compile(
+    r"^FIND\s+(?:(?P<kind>NOLOOP|SHORTEST|ALL)\s+)?PATH\s+"
+    r'FROM\s+(?P<src>"[^"]*"|-?\d+)\s+TO\s+(?P<dst>"[^"]*"|-?\d+)\s+'
+    r"OVER\s+(?P<over>\*|\w+(?:\s*,\s*\w+)*)"
+    r"(?:\s+(?P<direction>REVERSELY|BIDIRECT))?\s+"
+    r"UPTO\s+(?P<n>\d+)\s+STEPS?\s+YIELD\s+path\s+AS\s+\w+$", re.I | re.S)
+_INSERT_VERTEX_RE = re.compile(
+    r"^INSERT\s+VERTEX\s+(?P<if_not_exists>IF\s+NOT\s+EXISTS\s+)?"
+    r"(?P<tag>\w+)\s*\((?P<props>[^)]*)\)\s+VALUES\s+(?P<values>.+)$", re.I | re.S)
+_UPSERT_VERTEX_RE = re.compile(
+    r"^(?P<verb>UPSERT|UPDATE)\s+VERTEX\s+ON\s+(?P<tag>\w+)\s+"
+    r'(?P<vid>"(?:[^"\\]|\\.)*"|-?\d+)\s+SET\s+(?P<assignments>.+)$', re.I | re.S)
+_VALUES_ITEM_RE = re.compile(
+    r'^(?P<vid>"(?:[^"\\]|\\.)*"|-?\d+)\s*:\s*\((?P<values>.*)\)$', re.S)
+_INSERT_EDGE_RE = re.compile(
+    r"^INSERT\s+EDGE\s+(?P<if_not_exists>IF\s+NOT\s+EXISTS\s+)?"
+    r"(?P<etype>\w+)\s*\((?P<props>[^)]*)\)\s+VALUES\s+(?P<values>.+)$", re.I | re.S)
+_EDGE_ITEM_RE = re.compile(
+    r'^(?P<src>"(?:[^"\\]|\\.)*"|-?\d+)\s*->\s*(?P<dst>"(?:[^"\\]|\\.)*"|-?\d+)'
+    r'(?:\s*@\s*(?P<rank>-?\d+))?\s*:\s*\((?P<values>.*)\)$', re.S)
+_ALIAS_RE = re.compile(r"^(?P<expr>.+?)\s+AS\s+(?P<alias>\w+)$", re.I | re.S)
+
+
+def split_statements(text: str) -> list:
+    """按分号拆分语句，忽略引号内的分号"""
+    statements = []
+    current = []
+    quote = None
+    escaped = False
+    for char in text:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == ";":
+            statements.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    statements.append("".join(current).strip())
+    return [stmt for stmt in statements if stmt]
+
+
+def split_top_level(text: str, separator: str = ",") -> list:
+    """按顶层逗号拆分，忽略括号和引号内的逗号"""
+    parts = []
+    current = []
+    depth = 0
+    quote = None
+    escaped = False
+    for char in text:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if current:
+        parts.append("".join(current).strip())
+    return parts
+
+
+def parse_vid(literal: str):
+    literal = literal.strip()
+    if literal.startswith('"'):
+        return literal[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return int(literal)
+
+
+def parse_vid_list(text: str) -> list:
+    return [parse_vid(item) for item in split_top_level(text)]
+
+
+def parse_literal(literal: str):
+    """解析INSERT/UPSERT中的常量"""
+    literal = literal.strip()
+    lowered = literal.lower()
+    if lowered == "null":
+        return None
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if literal.startswith('"'):
+        return parse_vid(literal)
+    try:
+        return int(literal)
+    except ValueError:
+        pass
+    try:
+        return float(literal)
+    except ValueError:
+        raise FakeNebulaError(f"SyntaxError: unsupported literal `{literal}'")
+
+
+def parse_yield(text: str) -> list:
+    """解析YIELD列表，返回 [(表达式, 列名)]"""
+    columns = []
+    for item in split_top_level(text.strip()):
+        match = _ALIAS_RE.match(item)
+        if match:
+            columns.append((match["expr"].strip(), match["alias"]))
+        else:
+            columns.append((item, item))
+    return columns
+
+
+def _normalize(expr: str) -> str:
+    return re.sub(r"\s+", "", expr)
+
+
+class FakeSession:
+    """实现Session的execute/release接口"""
+
+    def __init__(self, pool: "FakeConnectionPool"):
+        self.pool = pool
+        self.graph = pool.graph
+        self.space = None
+        self._encoder = _ValueEncoder(self.graph)
+
+    def execute(self, stmt: str) -> ResultSet:
+        self.pool._record_round_trip()
+        start = time.perf_counter()
+        columns, rows = [], []
+        try:
+            for single in split_statements(stmt):
+                columns, rows = self._execute_one(single)
+        except FakeNebulaError as e:
+            return self._result(None, None, str(e), start)
+        return self._result(columns, rows, None, start)
+
+    def release(self) -> None:
+        self.pool._release(self)
+
+    # --- 结果 ---
+
+    def _result(self, columns, rows, error, start) -> ResultSet:
+        latency_us = int((time.perf_counter() - start) * 1e6)
+        if error is not None:
+            resp = ExecutionResponse(
+                error_code=ttypes.ErrorCode.E_SYNTAX_ERROR,
+                latency_in_us=latency_us,
+                error_msg=error.encode("utf-8"))
+        else:
+            data = None
+            if columns:
+                data = ttypes.DataSet(
+                    column_names=[name.encode("utf-8") for name in columns],
+                    rows=[
+                        ttypes.Row(values=[
+                            self._encoder.encode(value) for value in row])
+                        for row in rows])
+            resp = ExecutionResponse(
+                error_code=ttypes.ErrorCode.SUCCEEDED,
+                latency_in_us=latency_us,
+                data=data,
+                space_name=(self.space or "").encode("utf-8"))
+        return ResultSet(resp, all_latency=latency_us)
+
+    # --- 语句分派 ---
+
+    def _execute_one(self, stmt: str) -> tuple:
+        match = _DESCRIBE_SPACE_RE.match(stmt)
+        if match:
+            return self._describe_space(match)
+        match = _USE_RE.match(stmt)
+        if match:
+            if match["space"] != self.graph.space_name:
+                raise FakeNebulaError(f"SpaceNotFound: {match['space']}")
+            self.space = match["space"]
+            return [], []
+        if self.space is None:
+            raise FakeNebulaError("No space selected")
+
+        for pattern, handler in (
+                (_SHOW_EDGES_RE, self._show_edges),
+                (_GO_RE, self._go),
+                (_FETCH_RE, self._fetch),
+                (_LOOKUP_RE, self._lookup),
+                (_DEGREE_RANK_RE, self._degree_rank),
+                (_MATCH_LABELS_RE, self._match_labels),
+                (_MATCH_PATH_RE, self._match_path),
+                (_SUBGRAPH_RE, self._get_subgraph),
+                (_FIND_PATH_RE, self._find_path),
+                (_INSERT_VERTEX_RE, self._insert_vertex),
+                (_UPSERT_VERTEX_RE, self._upsert_vertex),
+                (_INSERT_EDGE_RE, self._insert_edge)):
+            match = pattern.match(stmt)
+            if match:
+                return handler(match)
+        raise FakeNebulaError(f"SyntaxError: unsupported statement `{stmt}'")
+
+    # --- 各语句的实现 ---
+
+    def _edge_types(self, over: str):
+        over = over.strip()
+        if over == "*":
+            return None
+        return {name.strip() for name in over.split(",")}
+
+    @staticmethod
+    def _direction(keyword) -> str:
+        if keyword is None:
+            return "out"
+        return {"REVERSELY": "in", "BIDIRECT": "both", "IN": "in",
+                "OUT": "out", "BOTH": "both"}[keyword.upper()]
+
+    def _go(self, match) -> tuple:
+        if match["k"]:
+            first = last = int(match["k"])
+        elif match["n"]:
+            first, last = int(match["m"]), int(match["n"])
+        else:
+            first = last = 1
+        edge_types = self._edge_types(match["over"])
+        direction = self._direction(match["direction"])
+        columns = parse_yield(match["yield"])
+
+        frontier = list(dict.fromkeys(parse_vid_list(match["vids"])))
+        rows = []
+        for step in range(1, last + 1):
+            next_frontier = {}
+            for vid in frontier:
+                for etype, other, rank, props, reverse in self.graph.neighbors(
+                        vid, edge_types, direction):
+                    src, dst = (other, vid) if reverse else (vid, other)
+                    edge = _EdgeRef(etype, src, dst, rank, props, reverse)
+                    if step >= first:
+                        rows.append([
+                            self._eval_go(expr, vid, other, edge)
+                            for expr, _ in columns])
+                    next_frontier[other] = None
+            frontier = list(next_frontier)
+        if match["distinct"]:
+            rows = self._distinct(rows)
+        return [alias for _, alias in columns], rows
+
+    def _eval_go(self, expr: str, from_vid, to_vid, edge: _EdgeRef):
+        key = _normalize(expr)
+        lowered = key.lower()
+        if lowered == "id($^)":
+            return from_vid
+        if lowered == "id($$)":
+            return to_vid
+        if lowered == "src(edge)":
+            return edge.src
+        if lowered == "dst(edge)":
+            return edge.dst
+        if lowered == "type(edge)":
+            return edge.edge_type
+        if lowered == "rank(edge)":
+            return edge.rank
+        if lowered == "edge":
+            return edge
+        if lowered == "properties(edge)":
+            return dict(edge.props)
+        if lowered.startswith("properties(edge)."):
+            return edge.props.get(key.split(".", 1)[1])
+        for marker, vid in (("$^", from_vid), ("$$", to_vid)):
+            value = self._eval_vertex_expr(key, marker, vid)
+            if value is not _MISSING:
+                return value
+        if "." in key:
+            etype, prop = key.split(".", 1)
+            if etype in self.graph.edge_schema:
+                return edge.props.get(prop) if edge.edge_type == etype else None
+        raise FakeNebulaError(f"SemanticError: unsupported expression `{expr}'")
+
+    def _eval_vertex_expr(self, key: str, marker: str, vid):
+        """计算以marker（$^、$$或vertex）表示的顶点上的表达式"""
+        lowered = key.lower()
+        tags = self.graph.vertices.get(vid, {})
+        if lowered == marker:
+            return _VertexRef(vid)
+        if lowered in (f"tags({marker})", f"labels({marker})"):
+            return list(tags)
+        if lowered == f"properties({marker})":
+            merged = {}
+            for props in tags.values():
+                merged.update(props)
+            return merged
+        if lowered.startswith(f"properties({marker})."):
+            prop = key.split(".", 1)[1]
+            for props in tags.values():
+                if prop in props:
+                    return props[prop]
+            return None
+        if key.startswith(marker + "."):
+            tag, _, prop = key[len(marker) + 1:].partition(".")
+            return tags.get(tag, {}).get(prop)
+        return _MISSING
+
+    def _fetch(self, match) -> tuple:
+        tag_names = match["tags"].strip()
+        columns = parse_yield(match["yield"])
+        rows = []
+        for vid in parse_vid_list(match["vids"]):
+            tags = self.graph.vertices.get(vid)
+            if not tags:
+                continue
+            if tag_names != "*":
+                wanted = [name.strip() for name in tag_names.split(",")]
+                if not any(tag in tags for tag in wanted):
+                    continue
+            rows.append([self._eval_fetch(expr, vid) for expr, _ in columns])
+        return [alias for _, alias in columns], rows
+
+    def _eval_fetch(self, expr: str, vid):
+        key = _normalize(expr)
+        if key.lower() == "id(vertex)":
+            return vid
+        value = self._eval_vertex_expr(key, "vertex", vid)
+        if value is not _MISSING:
+            return value
+        if "." in key:
+            tag, prop = key.split(".", 1)
+            if tag in self.graph.tag_schema:
+                return self.graph.vertices.get(vid, {}).get(tag, {}).get(prop)
+        raise FakeNebulaError(f"SemanticError: unsupported expression `{expr}'")
+
+    def _lookup(self, match) -> tuple:
+        tag = match["tag"]
+        if tag not in self.graph.tag_schema:
+            raise FakeNebulaError(f"TagNotFound: {tag}")
+        rows = [[vid] for vid, tags in self.graph.vertices.items() if tag in tags]
+        return [match["alias"] or "id(VERTEX)"], rows
+
+    def _degree_rank(self, match) -> tuple:
+        tag = match["tag"]
+        if tag not in self.graph.tag_schema:
+            raise FakeNebulaError(f"TagNotFound: {tag}")
+        edge_types = self._edge_types(match["over"])
+        degrees = []
+        for vid, tags in self.graph.vertices.items():
+            if tag in tags:
+                degree = len(self.graph.neighbors(vid, edge_types, "both"))
+                if degree:
+                    degrees.append([vid, degree])
+        degrees.sort(key=lambda row: row[1], reverse=True)
+        return ["vid", "degree"], degrees[:int(match["limit"])]
+
+    def _describe_space(self, match) -> tuple:
+        if match["space"] != self.graph.space_name:
+            raise FakeNebulaError(f"SpaceNotFound: {match['space']}")
+        return (["ID", "Name", "Partition Number", "Replica Factor", "Charset",
+                 "Collate", "Vid Type", "Atomic Edge", "Zones", "Comment"],
+                [[1, self.graph.space_name, 10, 1, "utf8", "utf8_bin",
+                  self.graph.vid_type, False, "default_zone", None]])
+
+    def _show_edges(self, match) -> tuple:
+        return ["Name"], [[name] for name in self.graph.edge_schema]
+
+    def _match_labels(self, match) -> tuple:
+        vid = parse_vid(match["vid"])
+        tags = self.graph.vertices.get(vid)
+        if tags is None:
+            return ["types"], []
+        return ["types"], [[list(tags)]]
+
+    def _match_path(self, match) -> tuple:
+        vid = parse_vid(match["vid"])
+        limit = int(match["limit"]) if match["limit"] else None
+        rows = []
+        for etype, other, rank, props, _ in self.graph.neighbors(
+                vid, {match["etype"]}, "out"):
+            edge = _EdgeRef(etype, vid, other, rank, props)
+            rows.append([_PathRef(vid, [(edge, other)])])
+            if limit is not None and len(rows) >= limit:
+                break
+        return ["p"], rows
+
+    def _get_subgraph(self, match) -> tuple:
+        steps = int(match["n"])
+        edge_types = None
+        if match["etypes"]:
+            edge_types = {name.strip() for name in match["etypes"].split(",")}
+        direction = self._direction(match["direction"] or "BOTH")
+        columns = [alias for _, alias in parse_yield(match["yield"])]
+        with_props = bool(match["with_prop"])
+
+        visited = {}
+        level = []
+        for vid in parse_vid_list(match["vids"]):
+            if vid in self.graph.vertices and vid not in visited:
+                visited[vid] = 0
+                level.append(vid)
+        seen_edges = set()
+        rows = []
+        for step in range(steps + 1):
+            edges = []
+            next_level = []
+            for vid in level:
+                for etype, other, rank, props, reverse in self.graph.neighbors(
+                        vid, edge_types, direction):
+                    if step == steps and other not in visited:
+                        # 最后一步只返回已访问顶点之间的边
+                        continue
+                    src, dst = (other, vid) if reverse else (vid, other)
+                    key = (etype, src, dst, rank)
+                    if key in seen_edges:
+                        continue
+                    seen_edges.add(key)
+                    edges.append(_EdgeRef(
+                        etype, src, dst, rank, props, with_props=with_props))
+                    if other not in visited:
+                        visited[other] = step + 1
+                        next_level.append(other)
+            rows.append([[_VertexRef(vid, with_props) for vid in level], edges])
+            level = next_level
+        return columns, rows
+
+    def _find_path(self, match) -> tuple:
+        src = parse_vid(match["src"])
+        dst = parse_vid(match["dst"])
+        max_steps = int(match["n"])
+        edge_types = self._edge_types(match["over"])
+        direction = self._direction(match["direction"])
+
+        # 广度优先搜索，返回最短路径（最多100条）
+        paths = []
+        queue = deque([(src, [])])
+        depth_seen = {src: 0}
+        while queue and len(paths) < 100:
+            vid, steps = queue.popleft()
+            if len(steps) >= max_steps:
+                continue
+            for etype, other, rank, props, reverse in self.graph.neighbors(
+                    vid, edge_types, direction):
+                if any(reached == other for _, reached in steps) or other == src:
+                    continue
+                edge_src, edge_dst = (other, vid) if reverse else (vid, other)
+                edge = _EdgeRef(etype, edge_src, edge_dst, rank, props, reverse)
+                new_steps = steps + [(edge, other)]
+                if other == dst:
+                    paths.append(_PathRef(src, new_steps))
+                    continue
+                if depth_seen.get(other, len(new_steps)) >= len(new_steps):
+                    depth_seen[other] = len(new_steps)
+                    queue.append((other, new_steps))
+        return ["p"], [[path] for path in paths]
+
+    def _check_props(self, schema: dict, name: str, props) -> None:
+        if name not in schema:
+            raise FakeNebulaError(f"SemanticError: `{name}' not found")
+        for prop in props:
+            if prop not in schema[name]:
+                raise FakeNebulaError(f"SemanticError: unknown prop `{prop}' in `{name}'")
+
+    def _insert_vertex(self, match) -> tuple:
+        tag = match["tag"]
+        props = [prop.strip() for prop in match["props"].split(",") if prop.strip()]
+        self._check_props(self.graph.tag_schema, tag, props)
+        rows = []
+        for item in split_top_level(match["values"]):
+            item_match = _VALUES_ITEM_RE.match(item)
+            if item_match is None:
+                raise FakeNebulaError(f"SyntaxError: bad VALUES item `{item}'")
+            values = [parse_literal(value)
+                      for value in split_top_level(item_match["values"])]
+            if len(values) != len(props):
+                raise FakeNebulaError("SemanticError: column count mismatch")
+            rows.append((parse_vid(item_match["vid"]), dict(zip(props, values))))
+        for vid, values in rows:
+            exists = tag in self.graph.vertices.get(vid, {})
+            if match["if_not_exists"] and exists:
+                continue
+            # INSERT覆盖整个标签：未给出的属性置为NULL
+            full = {prop: None for prop in self.graph.tag_schema[tag]}
+            full.update(values)
+            self.graph.add_vertex(vid, tag, full)
+        return [], []
+
+    def _upsert_vertex(self, match) -> tuple:
+        tag = match["tag"]
+        vid = parse_vid(match["vid"])
+        values = {}
+        for assignment in split_top_level(match["assignments"]):
+            prop, sep, value = assignment.partition("=")
+            if not sep:
+                raise FakeNebulaError(f"SyntaxError: bad assignment `{assignment}'")
+            values[prop.strip()] = parse_literal(value)
+        self._check_props(self.graph.tag_schema, tag, values)
+        exists = tag in self.graph.vertices.get(vid, {})
+        if not exists:
+            if match["verb"].upper() == "UPDATE":
+                raise FakeNebulaError("Storage Error: Vertex or edge not found.")
+            self.graph.add_vertex(
+                vid, tag, {prop: None for prop in self.graph.tag_schema[tag]})
+        self.graph.add_vertex(vid, tag, values)
+        return [], []
+
+    def _insert_edge(self, match) -> tuple:
+        etype = match["etype"]
+        props = [prop.strip() for prop in match["props"].split(",") if prop.strip()]
+        self._check_props(self.graph.edge_schema, etype, props)
+        edges = []
+        for item in split_top_level(match["values"]):
+            item_match = _EDGE_ITEM_RE.match(item)
+            if item_match is None:
+                raise FakeNebulaError(f"SyntaxError: bad VALUES item `{item}'")
+            values = [parse_literal(value)
+                      for value in split_top_level(item_match["values"])]
+            if len(values) != len(props):
+                raise FakeNebulaError("SemanticError: column count mismatch")
+            edges.append((parse_vid(item_match["src"]), parse_vid(item_match["dst"]),
+                          int(item_match["rank"] or 0), dict(zip(props, values))))
+        for src, dst, rank, values in edges:
+            if match["if_not_exists"] and self.graph.has_edge(etype, src, dst, rank):
+                continue
+            full = {prop: None for prop in self.graph.edge_schema[etype]}
+            full.update(values)
+            self.graph.add_edge(etype, src, dst, rank, full)
+        return [], []
+
+    @staticmethod
+    def _distinct(rows: list) -> list:
+        seen = set()
+        result = []
+        for row in rows:
+            key = repr(row)
+            if key not in seen:
+                seen.add(key)
+                result.append(row)
+        return result
+
+
+_MISSING = object()
+
+
+class FakeConnectionPool:
+    """实现ConnectionPool接口的内存替身
+
+    Args:
+        graph: 图数据，默认生成一个1000个球员的合成图
+        latency: 每次往返注入的固定延迟（秒）
+        jitter: 在固定延迟之上叠加的均匀随机延迟上限（秒）
+    """
+
+    def __init__(self, graph: SyntheticGraph = None,
+                 latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.graph = graph or SyntheticGraph()
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.sessions_in_use = 0
+
+    def init(self, addresses=None, configs=None) -> bool:
+        return True
+
+    def get_session(self, user_name: str = "root", password: str = "nebula",
+                    retry_connect: bool = True) -> FakeSession:
+        with self._lock:
+            self.sessions_in_use += 1
+        return FakeSession(self)
+
+    @contextmanager
+    def session_context(self, *args, **kwargs):
+        session = self.get_session(*args, **kwargs)
+        try:
+            yield session
+        finally:
+            session.release()
+
+    def close(self) -> None:
+        pass
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.round_trips = 0
+
+    def _record_round_trip(self) -> None:
+        with self._lock:
+            self.round_trips += 1
+            delay = self.latency
+            if self.jitter:
+                delay += self._rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _release(self, session: FakeSession) -> None:
+        with self._lock:
+            self.sessions_in_use -= 1
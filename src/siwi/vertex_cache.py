@@ -0,0 +1,161 @@
+"""
+热点顶点缓存
+
+按 (图空间, VID) 缓存顶点的标签和属性，以及顶点的一跳邻接（两个方向的边）。
+由siwi.warmup在启动时按度数排名预先加载，读取时:
+
+- get_entity_embedding 和 NebulaFeatureStore 的特征读取先查这里
+- SubgraphSampler 的节点类型和特征查询先查这里
+- NebulaGraphStore 收集边时，已缓存邻接的源节点不再采样
+
+缓存按估算的字节数限制大小（SIWI_VERTEX_CACHE_MB，默认64），超过时淘汰最早加入的项。
+经BulkWriter写入的顶点和边会使对应的缓存项失效。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from siwi import metrics
+
+# 估算的内存占用（字节）：每个顶点、每个属性、每条边
+_VERTEX_BYTES = 240
+_PROP_BYTES = 96
+_EDGE_BYTES = 160
+
+_MISSING = object()
+
+VERTEX_CACHE_BYTES = metrics.gauge(
+    "siwi_vertex_cache_bytes",
+    "Estimated memory used by the hot vertex cache")
+VERTEX_CACHE_ENTRIES = metrics.gauge(
+    "siwi_vertex_cache_entries",
+    "Entries in the hot vertex cache by kind (vertex or adjacency)",
+    ("kind",))
+
+
+class VertexCache:
+    """热点顶点的标签、属性和一跳邻接
+
+    Args:
+        max_bytes: 估算内存占用的上限，默认读取SIWI_VERTEX_CACHE_MB
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or int(float(os.environ.get("SIWI_VERTEX_CACHE_MB", 64)) * 2 ** 20)
+        # (space, vid) -> {标签: {属性名: 值}}
+        self._vertices: "OrderedDict[Tuple, Dict[str, Dict]]" = OrderedDict()
+        # (space, vid) -> [(src, dst, 边类型, rank)]
+        self._adjacency: "OrderedDict[Tuple, List[Tuple]]" = OrderedDict()
+        self._sizes: Dict[Tuple, int] = {}
+        self.nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._vertices) + len(self._adjacency)
+
+    def _set(self, store: OrderedDict, kind: str, key: Tuple, value, size: int) -> None:
+        with self._lock:
+            self._discard(store, kind, key)
+            store[key] = value
+            self._sizes[(kind, key)] = size
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and (self._vertices or self._adjacency):
+                # 两类缓存项中较大的一类先淘汰
+                victim = self._adjacency if len(self._adjacency) > len(self._vertices) else self._vertices
+                victim_kind = "adjacency" if victim is self._adjacency else "vertex"
+                self._discard(victim, victim_kind, next(iter(victim)))
+            self._update_gauges()
+
+    def _discard(self, store: OrderedDict, kind: str, key: Tuple) -> None:
+        if store.pop(key, None) is not None:
+            self.nbytes -= self._sizes.pop((kind, key), 0)
+
+    def _update_gauges(self) -> None:
+        VERTEX_CACHE_BYTES.set(self.nbytes)
+        VERTEX_CACHE_ENTRIES.set(len(self._vertices), kind="vertex")
+        VERTEX_CACHE_ENTRIES.set(len(self._adjacency), kind="adjacency")
+
+    @staticmethod
+    def vertex_size(tags: Dict[str, Dict]) -> int:
+        """顶点项的估算字节数"""
+        return _VERTEX_BYTES + _PROP_BYTES * sum(len(props) for props in tags.values())
+
+    @staticmethod
+    def adjacency_size(edges: List[Tuple]) -> int:
+        """邻接项的估算字节数"""
+        return _VERTEX_BYTES + _EDGE_BYTES * len(edges)
+
+    def put_vertex(self, space: str, vid, tags: Dict[str, Dict]) -> int:
+        """缓存顶点的标签和属性，返回估算的字节数"""
+        size = self.vertex_size(tags)
+        self._set(self._vertices, "vertex", (space, vid), tags, size)
+        return size
+
+    def put_adjacency(self, space: str, vid, edges: List[Tuple]) -> int:
+        """缓存顶点的一跳邻接 [(src, dst, 边类型, rank)]，返回估算的字节数"""
+        size = self.adjacency_size(edges)
+        self._set(self._adjacency, "adjacency", (space, vid), edges, size)
+        return size
+
+    def get_vertex(self, space: str, vid) -> Optional[Dict[str, Dict]]:
+        if not self._vertices:
+            return None
+        return self._vertices.get((space, vid))
+
+    def get_prop(self, space: str, vid, tag: str, prop: str):
+        """返回缓存的属性值；顶点未缓存时返回_MISSING，没有该标签或属性时返回None"""
+        tags = self.get_vertex(space, vid)
+        if tags is None:
+            return _MISSING
+        return tags.get(tag, {}).get(prop)
+
+    def get_adjacency(self, space: str, vid) -> Optional[List[Tuple]]:
+        if not self._adjacency:
+            return None
+        return self._adjacency.get((space, vid))
+
+    def has_vertices(self) -> bool:
+        return bool(self._vertices)
+
+    def invalidate(self, space: str, vids: Iterable) -> None:
+        """顶点属性被写入后移除顶点项"""
+        if not self._vertices:
+            return
+        with self._lock:
+            for vid in vids:
+                self._discard(self._vertices, "vertex", (space, vid))
+            self._update_gauges()
+
+    def invalidate_adjacency(self, space: str, vids: Iterable) -> None:
+        """边被写入后移除两端顶点的邻接项"""
+        if not self._adjacency:
+            return
+        with self._lock:
+            for vid in vids:
+                self._discard(self._adjacency, "adjacency", (space, vid))
+            self._update_gauges()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vertices.clear()
+            self._adjacency.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+            self._update_gauges()
+
+
+VERTEX_CACHE = VertexCache()
+
+
+def is_missing(value) -> bool:
+    """get_prop的返回值表示顶点未缓存"""
+    return value is _MISSING
+
+
+def as_float(value) -> Optional[float]:
+    """缓存的属性值按decode_floats的规则转换为浮点数，不是数值时返回None"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
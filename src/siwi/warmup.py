@@ -0,0 +1,266 @@
+"""
+启动预热
+
+部署或重启之后所有缓存都是空的，最初几分钟的请求全部落到graphd上。预热阶段
+用一条聚合查询按度数给每个标签的顶点排名，再把度数最高的top_k个顶点的标签、
+属性和一跳邻接并发加载到siwi.vertex_cache中，受时间和内存预算限制。
+
+    warm_up("basketballplayer", top_k=1000)          # 同步执行
+    start_warmup("basketballplayer", top_k=1000)     # 后台线程执行，立即返回
+
+应用在init_app中、NebulaToTorch在初始化时根据SIWI_WARMUP_TOP_K（默认0，不预热）
+启动后台预热。进度通过以下指标导出:
+    siwi_warmup_running        是否正在预热
+    siwi_warmup_vertices       按阶段（ranked、vertex、adjacency）统计的顶点数
+    siwi_warmup_progress       已加载的顶点占排名顶点的比例
+    siwi_warmup_bytes          加载到缓存中的估算字节数
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from siwi import metrics
+from siwi.connection import get_connection_pool
+from siwi.decoder import column, decode_ints, decode_strings, decode_vertices, decode_vids
+from siwi.feature_store import NEBULA_GRAPH_SPACE, NEBULA_PASSWORD, NEBULA_USER
+from siwi.log import get_logger
+from siwi.ngql import format_vids
+from siwi.vertex_cache import VERTEX_CACHE, VertexCache
+
+logger = get_logger(__name__)
+
+DEFAULT_TAGS = ("player", "team")
+
+WARMUP_RUNNING = metrics.gauge(
+    "siwi_warmup_running",
+    "Whether a cache warm-up is in progress")
+WARMUP_VERTICES = metrics.gauge(
+    "siwi_warmup_vertices",
+    "Vertices processed by the cache warm-up by stage (ranked, vertex, adjacency)",
+    ("stage",))
+WARMUP_PROGRESS = metrics.gauge(
+    "siwi_warmup_progress",
+    "Fraction of ranked vertices loaded by the cache warm-up")
+WARMUP_BYTES = metrics.gauge(
+    "siwi_warmup_bytes",
+    "Estimated bytes loaded into the vertex cache by the warm-up")
+
+
+class WarmupResult:
+    """一次预热的结果
+
+    Attributes:
+        ranked: 参与排名并计划加载的顶点数
+        vertices: 加载了标签和属性的顶点数
+        adjacency: 加载了一跳邻接的顶点数
+        nbytes: 加载的估算字节数
+        elapsed: 耗时（秒）
+        stopped: 结束原因，"done"、"time"（超过时间预算）、"memory"（超过内存预算）或"error"
+    """
+
+    def __init__(self):
+        self.ranked = 0
+        self.vertices = 0
+        self.adjacency = 0
+        self.nbytes = 0
+        self.elapsed = 0.0
+        self.stopped = "done"
+
+    def __repr__(self):
+        return (f"WarmupResult(ranked={self.ranked}, vertices={self.vertices}, "
+                f"adjacency={self.adjacency}, bytes={self.nbytes}, "
+                f"elapsed={self.elapsed:.3f}s, stopped={self.stopped})")
+
+
+def rank_by_degree(session, space_name: str, tags: Sequence[str], top_k: int) -> List[Tuple]:
+    """按度数（两个方向的边数）给各标签的顶点排名
+
+    每个标签一条 LOOKUP | GO | GROUP BY | ORDER BY | LIMIT 聚合查询，在graphd中
+    完成计数和排序，只返回度数最高的top_k个顶点。
+
+    Returns:
+        按度数从高到低排列的 [(vid, 度数)]，最多top_k个
+    """
+    ranked = []
+    for tag in tags:
+        resp = metrics.execute(
+            session,
+            f"USE {space_name}; LOOKUP ON {tag} YIELD id(vertex) AS vid "
+            f"| GO FROM $-.vid OVER * BIDIRECT YIELD $-.vid AS vid "
+            f"| GROUP BY $-.vid YIELD $-.vid AS vid, count(*) AS degree "
+            f"| ORDER BY $-.degree DESC | LIMIT {int(top_k)}")
+        if not resp.is_succeeded():
+            logger.warning("按度数排名%s失败: %s", tag, resp.error_msg())
+            continue
+        vids, _ = decode_vids(column(resp, "vid"))
+        degrees, _ = decode_ints(column(resp, "degree"))
+        ranked.extend(zip(vids.tolist(), degrees.tolist()))
+    ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked[:top_k]
+
+
+def _load_batch(pool, space_name: str, vids: List, cache: VertexCache,
+                admit: Callable[[int], bool]) -> Tuple[int, int]:
+    """加载一批顶点的标签、属性和一跳邻接，返回 (顶点数, 邻接数)
+
+    每一项放入缓存之前先调用admit(估算字节数)，返回False时停止加载。
+    """
+    session = pool.get_session(NEBULA_USER, NEBULA_PASSWORD)
+    try:
+        vertex_resp = metrics.execute(
+            session, f"USE {space_name}; FETCH PROP ON * {format_vids(vids)} YIELD vertex AS v")
+        edge_resp = metrics.execute(
+            session,
+            f"GO FROM {format_vids(vids)} OVER * BIDIRECT "
+            f"YIELD id($^) AS center, src(edge) AS src, dst(edge) AS dst, "
+            f"type(edge) AS edge_type, rank(edge) AS rank")
+    finally:
+        session.release()
+
+    vertices = 0
+    for vid, tags in decode_vertices(column(vertex_resp, 0)):
+        if not admit(cache.vertex_size(tags)):
+            return vertices, 0
+        cache.put_vertex(space_name, vid, tags)
+        vertices += 1
+
+    adjacency = 0
+    if edge_resp.is_succeeded():
+        centers, _ = decode_vids(column(edge_resp, 0))
+        srcs, _ = decode_vids(column(edge_resp, 1))
+        dsts, _ = decode_vids(column(edge_resp, 2))
+        edge_types, _ = decode_strings(column(edge_resp, 3))
+        ranks, _ = decode_ints(column(edge_resp, 4))
+        edges = {vid: [] for vid in vids}
+        for center, edge in zip(centers.tolist(), zip(
+                srcs.tolist(), dsts.tolist(), edge_types.tolist(), ranks.tolist())):
+            edges.setdefault(center, []).append(edge)
+        for vid, vid_edges in edges.items():
+            if not admit(cache.adjacency_size(vid_edges)):
+                break
+            cache.put_adjacency(space_name, vid, vid_edges)
+            adjacency += 1
+    else:
+        logger.warning("预热一跳邻接失败: %s", edge_resp.error_msg())
+    return vertices, adjacency
+
+
+def warm_up(space_name: str = NEBULA_GRAPH_SPACE,
+            top_k: Optional[int] = None,
+            tags: Sequence[str] = DEFAULT_TAGS,
+            time_budget: Optional[float] = None,
+            memory_budget: Optional[int] = None,
+            workers: Optional[int] = None,
+            batch_size: int = 128,
+            connection_pool=None,
+            cache: Optional[VertexCache] = None) -> WarmupResult:
+    """按度数排名预热顶点缓存
+
+    度数最高的顶点最先加载；超过时间预算或内存预算时不再提交新的批次。
+
+    Args:
+        space_name: 图空间名称
+        top_k: 加载的顶点数，默认读取SIWI_WARMUP_TOP_K
+        tags: 参与排名的标签
+        time_budget: 时间预算（秒），默认读取SIWI_WARMUP_SECONDS（60）
+        memory_budget: 内存预算（字节），默认读取SIWI_WARMUP_MB（32）
+        workers: 并发批次数，默认读取SIWI_WARMUP_WORKERS（4）
+        batch_size: 每批的顶点数
+        connection_pool: 连接池，默认使用当前进程的连接池
+        cache: 目标缓存，默认为siwi.vertex_cache.VERTEX_CACHE
+
+    Returns:
+        WarmupResult
+    """
+    top_k = int(os.environ.get("SIWI_WARMUP_TOP_K", 0)) if top_k is None else top_k
+    if time_budget is None:
+        time_budget = float(os.environ.get("SIWI_WARMUP_SECONDS", 60))
+    if memory_budget is None:
+        memory_budget = int(float(os.environ.get("SIWI_WARMUP_MB", 32)) * 2 ** 20)
+    workers = workers or int(os.environ.get("SIWI_WARMUP_WORKERS", 4))
+    pool = connection_pool or get_connection_pool()
+    cache = cache or VERTEX_CACHE
+    memory_budget = min(memory_budget, cache.max_bytes)
+
+    result = WarmupResult()
+    start = time.monotonic()
+    deadline = start + time_budget
+    if top_k <= 0:
+        return result
+
+    WARMUP_RUNNING.set(1)
+    for stage in ("ranked", "vertex", "adjacency"):
+        WARMUP_VERTICES.set(0, stage=stage)
+    WARMUP_PROGRESS.set(0)
+    WARMUP_BYTES.set(0)
+    lock = threading.Lock()
+
+    def admit(size: int) -> bool:
+        # 各批次共享内存预算，超出时整个预热停止
+        with lock:
+            if result.nbytes + size > memory_budget:
+                result.stopped = "memory"
+                return False
+            result.nbytes += size
+            return True
+
+    def run(batch: List) -> None:
+        with lock:
+            if result.stopped != "done":
+                return
+            if time.monotonic() > deadline:
+                result.stopped = "time"
+                return
+        try:
+            vertices, adjacency = _load_batch(pool, space_name, batch, cache, admit)
+        except Exception as e:
+            logger.warning("预热批次失败: %s", e)
+            with lock:
+                result.stopped = "error"
+            return
+        with lock:
+            result.vertices += vertices
+            result.adjacency += adjacency
+            WARMUP_VERTICES.set(result.vertices, stage="vertex")
+            WARMUP_VERTICES.set(result.adjacency, stage="adjacency")
+            WARMUP_PROGRESS.set(result.adjacency / max(result.ranked, 1))
+            WARMUP_BYTES.set(result.nbytes)
+
+    try:
+        with metrics.track("warmup"):
+            session = pool.get_session(NEBULA_USER, NEBULA_PASSWORD)
+            try:
+                ranked = rank_by_degree(session, space_name, tags, top_k)
+            finally:
+                session.release()
+            result.ranked = len(ranked)
+            WARMUP_VERTICES.set(result.ranked, stage="ranked")
+
+            vids = [vid for vid, _ in ranked]
+            with ThreadPoolExecutor(max_workers=workers,
+                                    thread_name_prefix="siwi-warmup") as executor:
+                for begin in range(0, len(vids), batch_size):
+                    # 往返次数计入调用方的track()
+                    executor.submit(contextvars.copy_context().run,
+                                    run, vids[begin:begin + batch_size])
+    finally:
+        WARMUP_RUNNING.set(0)
+        result.elapsed = time.monotonic() - start
+        logger.info("缓存预热完成: %s", result)
+    return result
+
+
+def start_warmup(space_name: str = NEBULA_GRAPH_SPACE, **kwargs) -> threading.Thread:
+    """在后台线程中执行warm_up，参数同warm_up，立即返回线程"""
+    def run():
+        try:
+            warm_up(space_name, **kwargs)
+        except Exception:
+            logger.exception("缓存预热失败")
+    thread = threading.Thread(target=run, name="siwi-warmup", daemon=True)
+    thread.start()
+    return thread
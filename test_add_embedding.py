@@ -3,10 +3,16 @@
 
 import sys
 import time
+import os
 import numpy as np
 from nebula3.gclient.net import ConnectionPool
 from nebula3.Config import Config
 
+# 确保src目录在Python路径中
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from siwi.bulk_writer import BulkWriter
+
 # NebulaGraph 连接配置
 NEBULA_HOSTS = [('127.0.0.1', 9669)]
 NEBULA_USER = 'root'
@@ -126,21 +132,17 @@ with connection_pool.session_context(NEBULA_USER, NEBULA_PASSWORD) as session:
             
             # 6. 更新所有球员的embedding1
             print("\n步骤6: 更新所有球员的embedding1属性...")
-            updated_count = 1  # 已经更新了一个测试球员
-            
-            for player_id in player_ids[1:]:  # 跳过第一个已测试的球员
-                # 为embedding1生成40-50之间的随机值（与embedding不同的范围）
-                random_value = round(np.random.uniform(40, 50), 2)
-                upsert_query = f'UPSERT VERTEX ON player "{player_id}" SET embedding1 = {random_value}'
-                resp = session.execute(upsert_query)
-                
-                if resp.is_succeeded():
-                    updated_count += 1
-                    # 每10个更新显示一次进度
-                    if updated_count % 10 == 0 or updated_count == len(player_ids):
-                        print(f"已更新 {updated_count}/{len(player_ids)} 个球员")
-                else:
-                    print(f"更新球员 {player_id} 失败: {resp.error_msg()}")
+            # 按批次并发写入，每个批次一次往返
+            writer = BulkWriter(connection_pool, NEBULA_SPACE)
+            other_ids = player_ids[1:]  # 跳过第一个已测试的球员
+            # 为embedding1生成40-50之间的随机值（与embedding不同的范围）
+            values = np.round(np.random.uniform(40, 50, len(other_ids)), 2)
+            result = writer.write_vertices(
+                "player", ["embedding1"], other_ids, [[float(v)] for v in values])
+            for failure in result.failures:
+                print(f"批次 {failure.batch} 更新 {len(failure.keys)} 个球员失败: {failure.error}")
+            updated_count = 1 + result.written_rows  # 加上已经更新的测试球员
+            print(f"已更新 {updated_count}/{len(player_ids)} 个球员，耗时 {result.elapsed:.2f} 秒")
             
             print(f"\n总结: 成功更新 {updated_count}/{len(player_ids)} 个球员的embedding1属性")
             
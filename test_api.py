@@ -17,4 +17,14 @@ print(f"根路径响应: {response.data.decode()}")
 # 测试embedding API
 response = client.get('/api/v1/entity/player/player100/embedding')
 print(f"embedding API 状态码: {response.status_code}")
-print(f"embedding API 响应: {response.data.decode()}")
\ No newline at end of file
+print(f"embedding API 响应: {response.data.decode()}")
+
+# 测试批量问答 API
+response = client.post('/query/batch', json={"questions": [
+    "Whom does Tim Duncan follow?",
+    "Which team had Yao Ming served?",
+    "Whom does Tim Duncan follow?",
+    ""
+]})
+print(f"批量问答 API 状态码: {response.status_code}")
+print(f"批量问答 API 响应: {response.data.decode()}")
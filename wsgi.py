@@ -5,15 +5,12 @@ import sys
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, BASE_DIR)
 sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
-sys.path.insert(0, os.path.join(BASE_DIR, 'src', 'siwi'))
 
-# 导入应用
-from src.siwi.app import app, init_app
+# 导入应用工厂
+from siwi.app import create_app
 
-# 初始化应用（连接池和bot）
-init_app()
+# app是Flask对象。连接池和bot不在这里创建：
+# gunicorn的post_fork钩子（conf/gunicorn.conf.py）在每个worker中调用init_app
+application = create_app()
 
-# app是Flask对象
-application = app
-
-# 启动命令: gunicorn --bind :5000 wsgi:application --workers 1 --threads 1 --timeout 60
+# 启动命令: gunicorn --config conf/gunicorn.conf.py wsgi:application